@@ -2,8 +2,17 @@ from agents.sentinel import SentinelAgent
 from agents.adversary import AdversaryAgent
 from agents.visual_director import VisualDirectorAgent
 from agents.growth_hacker import GrowthHackerAgent
+from agents.base_agent import BaseAgent
+
+AGENT_CLASSES: dict[str, type[BaseAgent]] = {
+    "sentinel": SentinelAgent,
+    "adversary": AdversaryAgent,
+    "visual_director": VisualDirectorAgent,
+    "growth_hacker": GrowthHackerAgent,
+}
 
 __all__ = [
+    "AGENT_CLASSES",
     "SentinelAgent",
     "AdversaryAgent",
     "VisualDirectorAgent",
@@ -1,13 +1,129 @@
 from __future__ import annotations
 
-from agents.base_agent import BaseAgent
+import re
+from collections.abc import AsyncIterator, Iterator
+
+from agents.base_agent import AgentResult, BaseAgent
+from agents.fanout import AsyncCompositeChatStream, CompositeChatStream, SubCall, UsageTally
+from config.settings import ModelConfig, settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient
+from llm.cancel import CancelToken
+
+# (漏洞清单中的名称, 武器全称, 检验内容)
+WEAPONS = (
+    ("逻辑谬误扫描", "逻辑谬误扫描", "检查是否存在滑坡谬误、稻草人、循环论证、虚假二分、诉诸权威等常见谬误"),
+    ("人类中心主义", "人类中心主义陷阱", "检查论点是否暗含人类中心主义偏见，忽视了非人类视角（AI、外星文明、生态系统）"),
+    ("熵增定律检验", "熵增定律检验", "论点是否违反热力学第二定律的隐喻？是否假设了不合理的秩序自发产生？"),
+    ("博弈论推演", "博弈论推演", "论点涉及的多方博弈是否考虑了纳什均衡？是否存在囚徒困境被忽视？"),
+    ("演化心理学", "演化心理学透镜", "论点是否忽略了人类认知偏差（损失厌恶、确认偏误、可得性启发）的影响？"),
+)
+
+_WEAPON_PROMPT = """你是「奇点编辑部」的逻辑对垒手，代号 Adversary。本次你只负责一种攻击武器：
+
+**{title}**：{rule}
+
+请按情报简报中出现的顺序给核心论点编号，用这件武器逐一攻击每个论点。保持冷酷客观，不留情面。
+
+## 输出格式
+
+只输出下面这张 Markdown 表格，不要输出任何其他内容：
+
+```
+| 序号 | 论点摘要 | 发现 | 严重度 |
+|------|---------|------|--------|
+| 1 | [论点原文摘要] | [具体发现或"通过"] | 🔴/🟡/🟢 |
+```
+
+每个论点一行，序号从 1 开始连续编号。"""
+
+_MERGE_PROMPT = """你是「奇点编辑部」的逻辑对垒手，代号 Adversary。
+
+五种攻击武器（逻辑谬误扫描、人类中心主义陷阱、熵增定律检验、博弈论推演、演化心理学透镜）对情报简报的检验结果已经汇总为漏洞清单。请据此简要写出逻辑对垒报告的其余部分：只做综合与收束，不要复述漏洞清单中的发现。
+
+## 输出格式
+
+从「## 打磨后论点」开始，严格使用以下 Markdown 结构，不要重复漏洞清单：
+
+```
+## 打磨后论点
+
+[针对每个原始论点，给出经过逻辑锤炼后的钢化版本，每条不超过两句话：]
+1. [钢化论点 1 — 修补了哪些漏洞]
+2. [钢化论点 2 — 修补了哪些漏洞]
+...
+
+## 新增论点（如有）
+[如果在对垒过程中发现了原始简报遗漏的重要角度，用一两句话补充]
+
+## 对垒总结
+[用 3 句话总结这些论点的整体逻辑强度，指出最薄弱环节和最强论点]
+```
+
+保持冷酷客观，不留情面，言简意赅。"""
+
+_ROW_RE = re.compile(r"^\|\s*(\d+)\s*\|([^|]*)\|([^|]*)\|([^|]*)\|\s*$", re.M)
+
+
+def assemble_findings(weapon_outputs: list[str]) -> str:
+    """Merge per-weapon tables into the ``# 逻辑对垒报告`` vulnerability list.
+
+    Rows are grouped by argument number, one table per argument with a row
+    per weapon. If no weapon's output can be parsed, the raw outputs are
+    kept under a heading per weapon instead.
+    """
+    arguments: dict[int, str] = {}
+    findings: dict[tuple[int, int], tuple[str, str]] = {}
+    for w, text in enumerate(weapon_outputs):
+        for number, summary, finding, severity in _ROW_RE.findall(text):
+            n = int(number)
+            arguments.setdefault(n, summary.strip())
+            findings[(n, w)] = (finding.strip(), severity.strip())
+
+    lines = ["# 逻辑对垒报告", "", "## 漏洞清单", ""]
+    if not arguments:
+        for (label, _, _), text in zip(WEAPONS, weapon_outputs):
+            lines += [f"### {label}", "", text.strip(), ""]
+        return "\n".join(lines) + "\n"
+    for n in sorted(arguments):
+        lines += [
+            f"### 论点 {n}：{arguments[n]}",
+            "| 攻击武器 | 发现 | 严重度 |",
+            "|---------|------|--------|",
+        ]
+        for w, (label, _, _) in enumerate(WEAPONS):
+            finding, severity = findings.get((n, w), ("（无结果）", "—"))
+            lines.append(f"| {label} | {finding} | {severity} |")
+        lines.append("")
+    return "\n".join(lines) + "\n"
 
 
 class AdversaryAgent(BaseAgent):
+    """Logic stress test of the Sentinel brief.
+
+    In ``parallel`` mode each weapon is a separate concurrent call; the
+    vulnerability list is assembled from their tables and a short merge
+    call writes the rest of the report, so latency approaches the slowest
+    weapon instead of the sum of all five.
+    """
+
     name = "逻辑对垒手"
     key = "adversary"
     description = "用五种攻击武器检验论点，输出漏洞清单和打磨后论点"
     icon = "⚔️"
+    input_sections = ("关键论点",)
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        async_llm_client: AsyncLLMClient | None = None,
+        mode: str | None = None,
+        model_config: ModelConfig | None = None,
+    ) -> None:
+        super().__init__(llm_client, async_llm_client, model_config)
+        mode = (mode or settings.ADVERSARY_MODE).lower()
+        if mode not in ("single", "parallel"):
+            raise ValueError(f"未知的逻辑对垒模式: {mode}")
+        self.mode = mode
 
     def get_system_prompt(self) -> str:
         return """你是「奇点编辑部」的逻辑对垒手，代号 Adversary。
@@ -64,3 +180,72 @@ class AdversaryAgent(BaseAgent):
 
     def build_user_message(self, input_text: str) -> str:
         return f"请对以下情报简报进行逻辑对垒测试：\n\n{input_text}"
+
+    # --- parallel mode ---
+
+    def _weapon_calls(self, input_text: str) -> list[SubCall]:
+        user_message = self.build_user_message(input_text)
+        return [
+            SubCall(
+                _WEAPON_PROMPT.format(title=title, rule=rule), user_message, **self.sampling
+            )
+            for _, title, rule in WEAPONS
+        ]
+
+    @staticmethod
+    def _merge_message(input_text: str, findings: str) -> str:
+        return f"## 情报简报\n\n{input_text}\n\n{findings}"
+
+    @property
+    def _merge_sampling(self) -> dict:
+        # The merge runs after the slowest weapon, so it is kept short.
+        sampling = self.sampling
+        return {
+            **sampling,
+            "max_tokens": min(sampling["max_tokens"], settings.ADVERSARY_MERGE_MAX_TOKENS),
+        }
+
+    def run(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        if self.mode == "parallel":
+            return self._run_via_stream(input_text, cancel)
+        return super().run(input_text, cancel)
+
+    async def arun(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        if self.mode == "parallel":
+            return await self._arun_via_stream(input_text, cancel)
+        return await super().arun(input_text, cancel)
+
+    def _chat_stream(self, input_text: str) -> ChatStream:
+        if self.mode != "parallel":
+            return super()._chat_stream(input_text)
+        llm = self._require_llm()
+
+        def produce(tally: UsageTally) -> Iterator[str]:
+            responses = tally.gather(llm, self._weapon_calls(input_text))
+            findings = assemble_findings([r.content for r in responses])
+            yield findings
+            yield from tally.stream(
+                llm.chat_stream(
+                    _MERGE_PROMPT, self._merge_message(input_text, findings), **self._merge_sampling
+                )
+            )
+
+        return CompositeChatStream(produce)
+
+    def _achat_stream(self, input_text: str) -> AsyncChatStream:
+        if self.mode != "parallel":
+            return super()._achat_stream(input_text)
+        llm = self._require_async_llm()
+
+        async def produce(tally: UsageTally) -> AsyncIterator[str]:
+            responses = await tally.agather(llm, self._weapon_calls(input_text))
+            findings = assemble_findings([r.content for r in responses])
+            yield findings
+            async for text in tally.astream(
+                llm.achat_stream(
+                    _MERGE_PROMPT, self._merge_message(input_text, findings), **self._merge_sampling
+                )
+            ):
+                yield text
+
+        return AsyncCompositeChatStream(produce)
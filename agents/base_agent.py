@@ -1,11 +1,18 @@
 from __future__ import annotations
 
-import time
+import asyncio
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Callable, Iterator
 from dataclasses import dataclass, field
 
-from llm.base import ChatStream, LLMClient
+from agents.prompts import RenderedPrompt, prompt_registry
+from config.settings import ModelConfig, settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled, CancelToken
+from llm.timing import CallTiming, TimingRecorder, bind_recorder
+from llm.tokens import estimate_tokens
+from utils import metrics
+from utils.markdown_stream import MarkdownRecord, MarkdownStreamParser, parse_markdown
 
 
 @dataclass
@@ -20,6 +27,45 @@ class AgentResult:
     elapsed_seconds: float
     edited: bool = False
     edited_text: str = ""
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    timing: CallTiming | None = None
+    records: list[MarkdownRecord] = field(default_factory=list)
+
+    @classmethod
+    def from_response(
+        cls,
+        agent_key: str,
+        agent_name: str,
+        input_text: str,
+        response: LLMResponse,
+        timing: CallTiming,
+        records: list[MarkdownRecord] | None = None,
+    ) -> AgentResult:
+        """Build a result; ``records`` are parsed from the output if not given."""
+        return cls(
+            agent_key=agent_key,
+            agent_name=agent_name,
+            input_text=input_text,
+            output_text=response.content,
+            model=response.model,
+            input_tokens=response.input_tokens,
+            output_tokens=response.output_tokens,
+            elapsed_seconds=round(timing.total_seconds, 2),
+            cache_read_input_tokens=response.cache_read_input_tokens,
+            cache_creation_input_tokens=response.cache_creation_input_tokens,
+            timing=timing,
+            records=parse_markdown(response.content) if records is None else records,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> AgentResult:
+        """Inverse of ``dataclasses.asdict`` (used to restore checkpoints)."""
+        data = dict(data)
+        if data.get("timing") is not None:
+            data["timing"] = CallTiming(**data["timing"])
+        data["records"] = [MarkdownRecord(**r) for r in data.get("records", [])]
+        return cls(**data)
 
 
 class BaseAgent(ABC):
@@ -27,57 +73,240 @@ class BaseAgent(ABC):
     key: str = ""
     description: str = ""
     icon: str = ""
+    # Upstream sections (heading prefixes) this agent actually reads. With
+    # early start on, it receives only these and is launched as soon as
+    # they are complete in the upstream stream. Empty: the whole output.
+    input_sections: tuple[str, ...] = ()
 
-    def __init__(self, llm_client: LLMClient) -> None:
+    def __init__(
+        self,
+        llm_client: LLMClient | None,
+        async_llm_client: AsyncLLMClient | None = None,
+        model_config: ModelConfig | None = None,
+    ) -> None:
         self._llm = llm_client
+        self._async_llm = async_llm_client
+        # max_tokens / temperature of every call; the clients are expected
+        # to point at the same model (see llm.factory.get_agent_llm_client).
+        self.model_config = model_config or settings.model_config(self.key)
+
+    @property
+    def sampling(self) -> dict:
+        """``max_tokens`` and ``temperature`` keyword arguments for a chat call."""
+        return {
+            "max_tokens": self.model_config.max_tokens,
+            "temperature": self.model_config.temperature,
+        }
 
     @abstractmethod
     def get_system_prompt(self) -> str:
-        ...
+        """Render the system prompt.
+
+        Must depend only on the agent class, :attr:`prompt_variant` and the
+        knowledge map: it is rendered once per knowledge-map version and
+        memoized by
+        :data:`agents.prompts.prompt_registry`.
+        """
 
     @abstractmethod
     def build_user_message(self, input_text: str) -> str:
         ...
 
-    def run(self, input_text: str) -> AgentResult:
-        system_prompt = self.get_system_prompt()
+    @property
+    def prompt_variant(self) -> str:
+        """Distinguishes system-prompt renderings of one agent class.
+
+        Agents whose prompt depends on constructor options override this so
+        each option set gets its own registry entry.
+        """
+        return ""
+
+    @property
+    def system_prompt(self) -> RenderedPrompt:
+        """The memoized rendering of :meth:`get_system_prompt`."""
+        return prompt_registry.get(self)
+
+    def run(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        """Run the agent to completion.
+
+        With ``cancel``, the call is streamed so it can be stopped midway;
+        a stopped run raises :class:`Cancelled` carrying the partial result.
+        """
+        if cancel is not None:
+            return self._run_via_stream(input_text, cancel)
+        system_prompt = self.system_prompt.text
         user_message = self.build_user_message(input_text)
 
-        start = time.time()
-        response = self._llm.chat(
-            system_prompt=system_prompt,
-            user_message=user_message,
-        )
-        elapsed = time.time() - start
+        recorder = TimingRecorder()
+        recorder.request_sent()
+        metrics.agent_started(self.key)
+        previous = bind_recorder(recorder)
+        try:
+            response = self._require_llm().chat(
+                system_prompt=system_prompt,
+                user_message=user_message,
+                **self.sampling,
+            )
+        except Exception as e:
+            metrics.agent_finished(self.key, error=e)
+            raise
+        finally:
+            bind_recorder(previous)
+        timing = recorder.finish(response.output_tokens)
+
+        result = AgentResult.from_response(self.key, self.name, input_text, response, timing)
+        metrics.agent_finished(self.key, result)
+        return result
 
-        return AgentResult(
+    def run_stream(
+        self,
+        input_text: str,
+        on_record: Callable[[MarkdownRecord], None] | None = None,
+        cancel: CancelToken | None = None,
+    ) -> AgentStream:
+        return AgentStream(
             agent_key=self.key,
             agent_name=self.name,
             input_text=input_text,
-            output_text=response.content,
-            model=response.model,
-            input_tokens=response.input_tokens,
-            output_tokens=response.output_tokens,
-            elapsed_seconds=round(elapsed, 2),
+            chat_stream=self._chat_stream(input_text),
+            on_record=on_record,
+            cancel=cancel,
+            **self._partial_usage(input_text, cancel),
         )
 
-    def run_stream(self, input_text: str) -> AgentStream:
-        system_prompt = self.get_system_prompt()
-        user_message = self.build_user_message(input_text)
-        chat_stream = self._llm.chat_stream(
-            system_prompt=system_prompt,
-            user_message=user_message,
+    def _partial_usage(self, input_text: str, cancel: CancelToken | None) -> dict:
+        """What an agent stream needs to estimate the usage of a stopped run.
+
+        A cancelled stream never sees the provider's usage report, so its
+        prompt is estimated (fan-out agents send more than this).
+        """
+        if cancel is None:
+            return {}
+        prompt = self.system_prompt.text + self.build_user_message(input_text)
+        return {"model": self.model_config.model, "prompt_tokens": estimate_tokens(prompt)}
+
+    def _chat_stream(self, input_text: str) -> ChatStream:
+        """The model call behind :meth:`run_stream`.
+
+        Agents that split their generation into several calls return a
+        composite stream here (see :mod:`agents.fanout`).
+        """
+        return self._require_llm().chat_stream(
+            system_prompt=self.system_prompt.text,
+            user_message=self.build_user_message(input_text),
+            **self.sampling,
         )
-        return AgentStream(
+
+    def _run_via_stream(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        stream = self.run_stream(input_text, cancel=cancel)
+        for _ in stream:
+            pass
+        return stream.result
+
+    def _require_llm(self) -> LLMClient:
+        if self._llm is None:
+            raise RuntimeError(f"{self.name} 未配置同步 LLM 客户端")
+        return self._llm
+
+    def _require_async_llm(self) -> AsyncLLMClient:
+        if self._async_llm is None:
+            raise RuntimeError(f"{self.name} 未配置异步 LLM 客户端")
+        return self._async_llm
+
+    async def arun(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        """Async counterpart of :meth:`run`."""
+        if cancel is not None:
+            return await self._arun_via_stream(input_text, cancel)
+        llm = self._require_async_llm()
+        system_prompt = self.system_prompt.text
+        user_message = self.build_user_message(input_text)
+
+        recorder = TimingRecorder()
+        recorder.request_sent()
+        metrics.agent_started(self.key)
+        previous = bind_recorder(recorder)
+        try:
+            response = await llm.achat(
+                system_prompt=system_prompt,
+                user_message=user_message,
+                **self.sampling,
+            )
+        except Exception as e:
+            metrics.agent_finished(self.key, error=e)
+            raise
+        finally:
+            bind_recorder(previous)
+        timing = recorder.finish(response.output_tokens)
+
+        result = AgentResult.from_response(self.key, self.name, input_text, response, timing)
+        metrics.agent_finished(self.key, result)
+        return result
+
+    def arun_stream(
+        self,
+        input_text: str,
+        on_record: Callable[[MarkdownRecord], None] | None = None,
+        cancel: CancelToken | None = None,
+    ) -> AsyncAgentStream:
+        return AsyncAgentStream(
             agent_key=self.key,
             agent_name=self.name,
             input_text=input_text,
-            chat_stream=chat_stream,
+            chat_stream=self._achat_stream(input_text),
+            on_record=on_record,
+            cancel=cancel,
+            **self._partial_usage(input_text, cancel),
+        )
+
+    def _achat_stream(self, input_text: str) -> AsyncChatStream:
+        """Async counterpart of :meth:`_chat_stream`."""
+        return self._require_async_llm().achat_stream(
+            system_prompt=self.system_prompt.text,
+            user_message=self.build_user_message(input_text),
+            **self.sampling,
         )
 
+    async def _arun_via_stream(
+        self, input_text: str, cancel: CancelToken | None = None
+    ) -> AgentResult:
+        stream = self.arun_stream(input_text, cancel=cancel)
+        async for _ in stream:
+            pass
+        return stream.result
+
+
+def _partial_result(
+    agent_key: str,
+    agent_name: str,
+    input_text: str,
+    model: str,
+    prompt_tokens: int,
+    parts: list[str],
+    timing: TimingRecorder,
+    records: list[MarkdownRecord],
+) -> AgentResult:
+    """The output of a stopped run so far, with its usage estimated."""
+    text = "".join(parts)
+    response = LLMResponse(
+        content=text, model=model, input_tokens=prompt_tokens, output_tokens=estimate_tokens(text)
+    )
+    return AgentResult.from_response(
+        agent_key, agent_name, input_text, response,
+        timing.finish(response.output_tokens), records=records,
+    )
+
 
 class AgentStream:
-    """流式 Agent 执行。传给 st.write_stream() 后，.result 自动填充。"""
+    """流式 Agent 执行。传给 st.write_stream() 后，.result 自动填充。
+
+    Output is parsed incrementally while streaming: :attr:`records` grows as
+    each line completes, and ``on_record`` (if given) is called per record.
+
+    With ``cancel``, cancelling the token closes the chat stream at once
+    (from the cancelling thread), and iteration raises :class:`Cancelled`
+    whose ``partial`` is the result so far; ``model`` and ``prompt_tokens``
+    are used to estimate its usage.
+    """
 
     def __init__(
         self,
@@ -85,25 +314,197 @@ class AgentStream:
         agent_name: str,
         input_text: str,
         chat_stream: ChatStream,
+        on_record: Callable[[MarkdownRecord], None] | None = None,
+        cancel: CancelToken | None = None,
+        model: str = "",
+        prompt_tokens: int = 0,
     ) -> None:
         self.result: AgentResult | None = None
+        self.records: list[MarkdownRecord] = []
         self._agent_key = agent_key
         self._agent_name = agent_name
         self._input_text = input_text
         self._chat_stream = chat_stream
+        self._on_record = on_record
+        self._cancel = cancel
+        self._model = model
+        self._prompt_tokens = prompt_tokens
+        self._parts: list[str] = []
+        self._parser = MarkdownStreamParser()
+        # Created now; the request goes out when iteration starts.
+        self._timing = TimingRecorder()
+
+    def _add_records(self, records: list[MarkdownRecord]) -> None:
+        self.records.extend(records)
+        if self._on_record is not None:
+            for record in records:
+                self._on_record(record)
+
+    def _cancelled(self, reason: str) -> Cancelled:
+        partial = _partial_result(
+            self._agent_key, self._agent_name, self._input_text, self._model,
+            self._prompt_tokens, self._parts, self._timing, self.records + self._parser.close(),
+        )
+        metrics.agent_cancelled(self._agent_key, partial)
+        return Cancelled(reason, partial)
 
     def __iter__(self) -> Iterator[str]:
-        start = time.time()
-        yield from self._chat_stream
-        elapsed = time.time() - start
+        cancel = self._cancel
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        self._timing.request_sent()
+        metrics.agent_started(self._agent_key)
+        # Closing the chat stream also wakes a read blocked on the network.
+        release = cancel.on_cancel(self._chat_stream.close) if cancel is not None else None
+        # The rate-limit layer re-stamps "sent" once the request is admitted.
+        previous = bind_recorder(self._timing)
+        try:
+            for text in self._chat_stream:
+                self._timing.chunk()
+                self._parts.append(text)
+                yield text
+                self._add_records(self._parser.feed(text))
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+            if cancel is not None and self._chat_stream.response is None:
+                cancel.raise_if_cancelled()
+        except GeneratorExit:
+            metrics.agent_abandoned(self._agent_key)
+            raise
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                raise self._cancelled(cancel.reason) from e
+            metrics.agent_finished(self._agent_key, error=e)
+            raise
+        finally:
+            bind_recorder(previous)
+            if release is not None:
+                release()
+        self._add_records(self._parser.close())
+        resp = self._chat_stream.response
+        self.result = AgentResult.from_response(
+            self._agent_key,
+            self._agent_name,
+            self._input_text,
+            resp,
+            self._timing.finish(resp.output_tokens),
+            records=self.records,
+        )
+        metrics.agent_finished(self._agent_key, self.result)
+
+
+def _interrupt_task(cancel: CancelToken) -> Callable[[], None]:
+    """Cancel the current asyncio task when ``cancel`` fires.
+
+    Task cancellation unwinds the async chat streams (closing their HTTP
+    responses) from wherever they're waiting. Returns the function that
+    disarms it, which must run on the loop before the task moves on.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    armed = True
+
+    def interrupt() -> None:
+        if armed:
+            task.cancel()
+
+    def disarm() -> None:
+        nonlocal armed
+        armed = False
+        release()
+
+    release = cancel.on_cancel(lambda: loop.call_soon_threadsafe(interrupt))
+    return disarm
+
+
+class AsyncAgentStream:
+    """异步流式 Agent 执行。async for 消费完毕后，.result 自动填充。
+
+    Cancellation works as in :class:`AgentStream`.
+    """
+
+    def __init__(
+        self,
+        agent_key: str,
+        agent_name: str,
+        input_text: str,
+        chat_stream: AsyncChatStream,
+        on_record: Callable[[MarkdownRecord], None] | None = None,
+        cancel: CancelToken | None = None,
+        model: str = "",
+        prompt_tokens: int = 0,
+    ) -> None:
+        self.result: AgentResult | None = None
+        self.records: list[MarkdownRecord] = []
+        self._agent_key = agent_key
+        self._agent_name = agent_name
+        self._input_text = input_text
+        self._chat_stream = chat_stream
+        self._on_record = on_record
+        self._cancel = cancel
+        self._model = model
+        self._prompt_tokens = prompt_tokens
+        self._parts: list[str] = []
+        self._parser = MarkdownStreamParser()
+        self._timing = TimingRecorder()
+
+    def _add_records(self, records: list[MarkdownRecord]) -> None:
+        self.records.extend(records)
+        if self._on_record is not None:
+            for record in records:
+                self._on_record(record)
+
+    def _cancelled(self, reason: str) -> Cancelled:
+        partial = _partial_result(
+            self._agent_key, self._agent_name, self._input_text, self._model,
+            self._prompt_tokens, self._parts, self._timing, self.records + self._parser.close(),
+        )
+        metrics.agent_cancelled(self._agent_key, partial)
+        return Cancelled(reason, partial)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        cancel = self._cancel
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        self._timing.request_sent()
+        metrics.agent_started(self._agent_key)
+        disarm = _interrupt_task(cancel) if cancel is not None else None
+        previous = bind_recorder(self._timing)
+        try:
+            async for text in self._chat_stream:
+                self._timing.chunk()
+                self._parts.append(text)
+                yield text
+                self._add_records(self._parser.feed(text))
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+        except GeneratorExit:
+            metrics.agent_abandoned(self._agent_key)
+            raise
+        except asyncio.CancelledError:
+            if cancel is None or not cancel.cancelled:
+                metrics.agent_abandoned(self._agent_key)
+                raise
+            # Our own interrupt, not a cancellation of the caller's task.
+            asyncio.current_task().uncancel()
+            raise self._cancelled(cancel.reason) from None
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                raise self._cancelled(cancel.reason) from e
+            metrics.agent_finished(self._agent_key, error=e)
+            raise
+        finally:
+            bind_recorder(previous)
+            if disarm is not None:
+                disarm()
+        self._add_records(self._parser.close())
         resp = self._chat_stream.response
-        self.result = AgentResult(
-            agent_key=self._agent_key,
-            agent_name=self._agent_name,
-            input_text=self._input_text,
-            output_text=resp.content,
-            model=resp.model,
-            input_tokens=resp.input_tokens,
-            output_tokens=resp.output_tokens,
-            elapsed_seconds=round(elapsed, 2),
+        self.result = AgentResult.from_response(
+            self._agent_key,
+            self._agent_name,
+            self._input_text,
+            resp,
+            self._timing.finish(resp.output_tokens),
+            records=self.records,
         )
+        metrics.agent_finished(self._agent_key, self.result)
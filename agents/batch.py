@@ -0,0 +1,322 @@
+"""Headless batch runner: push many topics through the 4-agent pipeline.
+
+Usage::
+
+    python -m agents.batch topics.txt --concurrency 8 --rpm 50
+    python -m agents.batch topics.txt --async --concurrency 200
+    python -m agents.batch --resume-unfinished
+    python -m agents.batch topics.txt --deadline 600
+
+The topic file is either plain text (one topic per line, ``#`` comments
+allowed) or JSONL with a ``topic`` field per line. With the run store
+enabled every topic is checkpointed node by node, and interrupted runs can
+be resumed by ID (``--resume``) or all at once (``--resume-unfinished``).
+
+With a deadline (``--deadline`` / ``PIPELINE_DEADLINE_SECONDS``), a topic
+still running when it expires has its LLM streams closed at once; what it
+produced so far is checkpointed and the topic can be resumed later.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from agents import AGENT_CLASSES
+from agents.base_agent import BaseAgent
+from agents.pipeline import PipelineState, arun_pipeline, run_pipeline
+from agents.prompts import prompt_registry
+from config.settings import settings
+from llm.base import AsyncLLMClient, LLMClient
+from llm.cancel import CancelToken
+from llm.factory import create_async_llm_client, get_agent_llm_client
+from llm.http_pool import create_async_http_client
+from llm.rate_limit import get_provider_limits
+from utils.metrics import start_configured_exporters
+from utils.persistence import save_results
+from utils.run_store import get_run_store
+
+
+@dataclass
+class BatchItem:
+    topic: str
+    run_id: str = ""
+    output_dir: Path | None = None
+    error: str | None = None
+    elapsed_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_topics(path: str | Path) -> list[str]:
+    """Read topics from a plain-text (one per line) or JSONL file."""
+    topics: list[str] = []
+    for lineno, raw in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {lineno} 行 JSON 解析失败：{e}") from e
+            topic = str(record.get("topic", "")).strip()
+            if not topic:
+                raise ValueError(f"第 {lineno} 行缺少 topic 字段")
+            topics.append(topic)
+        else:
+            topics.append(line)
+    return topics
+
+
+# ---------------------------------------------------------------------------
+# Batch execution
+# ---------------------------------------------------------------------------
+
+
+def _configure_rate_limit(requests_per_minute: int | None) -> None:
+    """Apply a per-run RPM override to the shared limiters of the providers in use."""
+    if requests_per_minute is not None:
+        for provider in {settings.model_config(key).provider.lower() for key in AGENT_CLASSES}:
+            limits = get_provider_limits(provider)
+            limits.limiter.configure(requests_per_minute=requests_per_minute)
+
+
+def _finish_item(item: BatchItem, state: PipelineState, start: float) -> BatchItem:
+    # Save whatever completed, so partial runs are still inspectable.
+    if state.results:
+        try:
+            item.output_dir = save_results(state)
+        except Exception as e:
+            item.error = item.error or f"保存失败：{e}"
+    item.elapsed_seconds = round(time.monotonic() - start, 2)
+    return item
+
+
+def _new_state(job: str | PipelineState, deadline: float) -> PipelineState:
+    """A fresh run for a topic (registered in the run store), or a resumed one.
+
+    Its ``deadline`` (seconds, 0 for none) starts now.
+    """
+    if isinstance(job, PipelineState):
+        state = job
+    else:
+        state = PipelineState(topic=job)
+        store = get_run_store()
+        if store is not None:
+            store.create_run(state)
+    if deadline:
+        # Only then: a cancellable node is streamed rather than a single call.
+        state.cancel = CancelToken(deadline)
+    return state
+
+
+def _run_topic(job: str | PipelineState, agents: dict[str, BaseAgent], deadline: float) -> BatchItem:
+    start = time.monotonic()
+    state = _new_state(job, deadline)
+    item = BatchItem(topic=state.topic, run_id=state.run_id)
+    try:
+        run_pipeline(state, agents)
+    except Exception as e:
+        item.error = f"{type(e).__name__}: {e}"
+    return _finish_item(item, state, start)
+
+
+async def _arun_topic(
+    job: str | PipelineState, agents: dict[str, BaseAgent], deadline: float
+) -> BatchItem:
+    start = time.monotonic()
+    state = await asyncio.to_thread(_new_state, job, deadline)
+    item = BatchItem(topic=state.topic, run_id=state.run_id)
+    try:
+        await arun_pipeline(state, agents)
+    except Exception as e:
+        item.error = f"{type(e).__name__}: {e}"
+    return await asyncio.to_thread(_finish_item, item, state, start)
+
+
+def run_batch(
+    topics: Iterable[str | PipelineState],
+    concurrency: int | None = None,
+    requests_per_minute: int | None = None,
+    client: LLMClient | None = None,
+    on_item: Callable[[BatchItem], None] | None = None,
+    deadline: float | None = None,
+) -> list[BatchItem]:
+    """Run each topic's full pipeline in a bounded worker pool.
+
+    Topics run concurrently (up to ``concurrency``); the four steps within a
+    topic stay sequential. All workers share the agents' pooled clients
+    (``client`` if given, else one per configured model), throttled by the
+    provider's process-wide rate limits (``requests_per_minute`` overrides
+    the configured RPM). Results are returned in input order; ``on_item`` is
+    called as each topic finishes.
+
+    A :class:`PipelineState` in place of a topic (e.g. from
+    :meth:`RunStore.load`) is resumed from its first unfinished node.
+
+    Each topic is stopped ``deadline`` seconds after it starts (default
+    ``PIPELINE_DEADLINE_SECONDS``; 0 for none).
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    deadline = settings.PIPELINE_DEADLINE_SECONDS if deadline is None else deadline
+    _configure_rate_limit(requests_per_minute)
+    agents = {
+        key: cls(client or get_agent_llm_client(key)) for key, cls in AGENT_CLASSES.items()
+    }
+    prompt_registry.warm(agents.values())
+
+    topic_list = list(topics)
+    items: list[BatchItem | None] = [None] * len(topic_list)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(_run_topic, topic, agents, deadline): i
+            for i, topic in enumerate(topic_list)
+        }
+        for future in as_completed(futures):
+            item = future.result()
+            items[futures[future]] = item
+            if on_item is not None:
+                on_item(item)
+    return [item for item in items if item is not None]
+
+
+async def arun_batch(
+    topics: Iterable[str | PipelineState],
+    concurrency: int | None = None,
+    requests_per_minute: int | None = None,
+    client: AsyncLLMClient | None = None,
+    on_item: Callable[[BatchItem], None] | None = None,
+    deadline: float | None = None,
+) -> list[BatchItem]:
+    """Asyncio variant of :func:`run_batch` running on a single event loop.
+
+    ``concurrency`` bounds in-flight topics with a semaphore instead of
+    threads, so it can be raised far beyond a sensible thread-pool size.
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    deadline = settings.PIPELINE_DEADLINE_SECONDS if deadline is None else deadline
+    _configure_rate_limit(requests_per_minute)
+    http_client = None
+    clients: dict[tuple[str, str, str, str], AsyncLLMClient] = {}
+    if client is None:
+        # Async clients are bound to one event loop, so the pool is per batch.
+        http_client = create_async_http_client()
+
+    def agent_client(key: str) -> AsyncLLMClient:
+        if client is not None:
+            return client
+        config = settings.model_config(key)
+        if config.endpoint not in clients:
+            clients[config.endpoint] = create_async_llm_client(http_client, config)
+        return clients[config.endpoint]
+
+    # Agents only use the async client here; the sync slot is never called.
+    agents = {key: cls(None, agent_client(key)) for key, cls in AGENT_CLASSES.items()}
+    prompt_registry.warm(agents.values())
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def worker(topic: str) -> BatchItem:
+        async with semaphore:
+            item = await _arun_topic(topic, agents, deadline)
+        if on_item is not None:
+            on_item(item)
+        return item
+
+    try:
+        return list(await asyncio.gather(*(worker(topic) for topic in topics)))
+    finally:
+        if http_client is not None:
+            await http_client.aclose()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="奇点编辑部批量运行")
+    parser.add_argument(
+        "topics_file", nargs="?",
+        help="话题文件（每行一个话题，或 JSONL 含 topic 字段）",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=settings.BATCH_CONCURRENCY,
+        help="同时运行的话题数",
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=None,
+        help="每分钟最大请求数（0 表示不限，默认取 RATE_LIMIT_REQUESTS_PER_MINUTE）",
+    )
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true",
+        help="使用单事件循环的异步客户端代替线程池",
+    )
+    parser.add_argument(
+        "--deadline", type=float, default=None, metavar="SECONDS",
+        help="每个话题的截止时间（秒，0 表示不限，默认取 PIPELINE_DEADLINE_SECONDS）；"
+        "超时后立即中止正在生成的请求",
+    )
+    parser.add_argument(
+        "--resume", action="append", default=[], metavar="RUN_ID",
+        help="从运行记录中恢复指定的运行（可重复）",
+    )
+    parser.add_argument(
+        "--resume-unfinished", action="store_true",
+        help="恢复运行记录中所有未完成的运行",
+    )
+    args = parser.parse_args(argv)
+
+    topics: list[str | PipelineState] = []
+    if args.topics_file:
+        topics.extend(load_topics(args.topics_file))
+    if args.resume or args.resume_unfinished:
+        store = get_run_store()
+        if store is None:
+            print("运行记录未启用（RUN_STORE_ENABLED=false），无法恢复", file=sys.stderr)
+            return 1
+        run_ids = list(args.resume)
+        if args.resume_unfinished:
+            run_ids += [r.run_id for r in store.list_runs(limit=None, unfinished_only=True)]
+        try:
+            topics.extend(store.load(run_id) for run_id in dict.fromkeys(run_ids))
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 1
+    if not topics:
+        print("没有需要运行的话题", file=sys.stderr)
+        return 1
+
+    start_configured_exporters()
+    total = len(topics)
+    done = 0
+
+    def report(item: BatchItem) -> None:
+        nonlocal done
+        done += 1
+        status = "✅" if item.ok else f"❌ {item.error}"
+        run = f" [{item.run_id}]" if item.run_id else ""
+        print(f"[{done}/{total}] {status} {item.topic}{run} ({item.elapsed_seconds}s)", flush=True)
+
+    start = time.monotonic()
+    if args.use_async:
+        items = asyncio.run(
+            arun_batch(topics, args.concurrency, args.rpm, on_item=report, deadline=args.deadline)
+        )
+    else:
+        items = run_batch(topics, args.concurrency, args.rpm, on_item=report, deadline=args.deadline)
+    failed = sum(1 for item in items if not item.ok)
+    print(
+        f"完成 {total - failed}/{total}，失败 {failed}，"
+        f"总耗时 {time.monotonic() - start:.1f}s"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
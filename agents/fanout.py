@@ -0,0 +1,217 @@
+"""Building blocks for agents that split one generation into several calls.
+
+A fan-out agent issues independent sub-calls concurrently (on a shared,
+process-wide pool, or with ``asyncio.gather``), then assembles or streams
+the final text. :class:`CompositeChatStream` presents the whole thing as a
+single :class:`ChatStream`, so ``AgentStream``, timing and metrics work
+unchanged; usage across all sub-calls is summed into its ``response``.
+
+Sub-calls are streamed (and consumed to completion) rather than sent as
+plain ``chat`` requests, so closing a composite stream closes every
+sub-call in flight, and the provider stops generating them at once.
+Queued sub-calls never start.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from config.settings import settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FANOUT_MAX_WORKERS,
+                thread_name_prefix="fanout",
+            )
+        return _executor
+
+
+@dataclass(frozen=True)
+class SubCall:
+    system_prompt: str
+    user_message: str
+    max_tokens: int = 4096
+    temperature: float = 0.7
+
+
+class UsageTally:
+    """Sums token usage over the sub-calls of one composite generation."""
+
+    def __init__(self) -> None:
+        self.model = ""
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self._lock = threading.Lock()
+        # Resolved by close(), so waits on sub-calls can watch for it.
+        self._closed: Future[None] = Future()
+        # Sub-call and relayed streams in flight, closed by close().
+        self._streams: set[ChatStream] = set()
+
+    def close(self) -> None:
+        """Stop the generation from any thread (see :meth:`ChatStream.close`)."""
+        with self._lock:
+            if self._closed.done():
+                return
+            self._closed.set_result(None)
+            streams = list(self._streams)
+        for stream in streams:
+            stream.close()
+
+    def _check_closed(self) -> None:
+        if self._closed.done():
+            raise Cancelled()
+
+    def _track(self, stream: ChatStream) -> None:
+        with self._lock:
+            self._check_closed()
+            self._streams.add(stream)
+
+    def _untrack(self, stream: ChatStream) -> None:
+        with self._lock:
+            self._streams.discard(stream)
+
+    def _complete(self, llm: LLMClient, call: SubCall) -> LLMResponse:
+        """Stream ``call`` to completion; :meth:`close` can stop it midway."""
+        stream = llm.chat_stream(call.system_prompt, call.user_message, call.max_tokens, call.temperature)
+        self._track(stream)
+        try:
+            for _ in stream:
+                pass
+        finally:
+            self._untrack(stream)
+        return stream.response
+
+    def add(self, response: LLMResponse) -> LLMResponse:
+        with self._lock:
+            self.model = response.model
+            self.input_tokens += response.input_tokens
+            self.output_tokens += response.output_tokens
+            self.cache_read_input_tokens += response.cache_read_input_tokens
+            self.cache_creation_input_tokens += response.cache_creation_input_tokens
+        return response
+
+    def in_order(self, llm: LLMClient, calls: Sequence[SubCall]) -> Iterator[LLMResponse]:
+        """Run ``calls`` concurrently, yielding each response in call order.
+
+        The first response is available as soon as its own call finishes,
+        so callers can emit it while later calls are still running.
+        """
+        # Each call runs in a copy of this context, so it reports to the
+        # agent's timing recorder (see llm.timing) as async tasks do.
+        futures = [
+            _get_executor().submit(contextvars.copy_context().run, self._complete, llm, c)
+            for c in calls
+        ]
+        try:
+            for future in futures:
+                wait([future, self._closed], return_when=FIRST_COMPLETED)
+                self._check_closed()
+                yield self.add(future.result())
+        finally:
+            # Also reached when the consumer stops early or a call failed.
+            for future in futures:
+                future.cancel()
+
+    def gather(self, llm: LLMClient, calls: Sequence[SubCall]) -> list[LLMResponse]:
+        """Run ``calls`` concurrently; results are in call order."""
+        return list(self.in_order(llm, calls))
+
+    async def ain_order(
+        self, llm: AsyncLLMClient, calls: Sequence[SubCall]
+    ) -> AsyncIterator[LLMResponse]:
+        """Async counterpart of :meth:`in_order`."""
+        tasks = [asyncio.ensure_future(self._acomplete(llm, c)) for c in calls]
+        try:
+            for task in tasks:
+                yield self.add(await task)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _acomplete(llm: AsyncLLMClient, call: SubCall) -> LLMResponse:
+        # Cancelling the task closes the stream's HTTP response.
+        stream = llm.achat_stream(call.system_prompt, call.user_message, call.max_tokens, call.temperature)
+        async for _ in stream:
+            pass
+        return stream.response
+
+    async def agather(self, llm: AsyncLLMClient, calls: Sequence[SubCall]) -> list[LLMResponse]:
+        return [r async for r in self.ain_order(llm, calls)]
+
+    def stream(self, chat_stream: ChatStream) -> Iterator[str]:
+        """Relay ``chat_stream`` and count its usage once it completes."""
+        self._track(chat_stream)
+        try:
+            yield from chat_stream
+        finally:
+            self._untrack(chat_stream)
+        self.add(chat_stream.response)
+
+    async def astream(self, chat_stream: AsyncChatStream) -> AsyncIterator[str]:
+        async for text in chat_stream:
+            yield text
+        self.add(chat_stream.response)
+
+    def response(self, content: str) -> LLMResponse:
+        return LLMResponse(
+            content=content,
+            model=self.model,
+            input_tokens=self.input_tokens,
+            output_tokens=self.output_tokens,
+            cache_read_input_tokens=self.cache_read_input_tokens,
+            cache_creation_input_tokens=self.cache_creation_input_tokens,
+        )
+
+
+class CompositeChatStream(ChatStream):
+    """A :class:`ChatStream` over text produced by ``produce(tally)``."""
+
+    def __init__(self, produce: Callable[[UsageTally], Iterator[str]]) -> None:
+        self.response: LLMResponse | None = None
+        self._produce = produce
+        self._tally = UsageTally()
+
+    def __iter__(self) -> Iterator[str]:
+        tally = self._tally
+        parts: list[str] = []
+        for text in self._produce(tally):
+            tally._check_closed()
+            parts.append(text)
+            yield text
+        self.response = tally.response("".join(parts))
+
+    def close(self) -> None:
+        self._tally.close()
+
+
+class AsyncCompositeChatStream(AsyncChatStream):
+    """Asyncio version of :class:`CompositeChatStream`."""
+
+    def __init__(self, produce: Callable[[UsageTally], AsyncIterator[str]]) -> None:
+        self.response: LLMResponse | None = None
+        self._produce = produce
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        tally = UsageTally()
+        parts: list[str] = []
+        async for text in self._produce(tally):
+            parts.append(text)
+            yield text
+        self.response = tally.response("".join(parts))
@@ -0,0 +1,284 @@
+"""Background pipeline jobs for the Streamlit app.
+
+Runs used to execute inside the session's script thread, pinning it (and
+its rerun loop) for the minutes a pipeline takes. A :class:`PipelineJob`
+runs on a thread pool shared by every session instead; the UI polls its
+progress on each rerun (node status, the text streamed so far), can cancel
+it, and can re-attach to it by run ID after navigating away or from
+another tab.
+
+Cancelling a job (or its ``PIPELINE_DEADLINE_SECONDS`` passing) cancels
+the run's token: the in-flight LLM streams are closed at once rather than
+left generating until the next chunk.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+
+from agents.base_agent import BaseAgent
+from agents.pipeline import PipelineState, get_agent_input, run_graph
+from agents.speculative import SpeculativeRun, start_speculation
+from config.settings import settings
+from llm.cancel import Cancelled, CancelToken
+from utils.markdown_stream import MarkdownRecord
+from utils.persistence import save_results
+
+# Finished jobs stay attachable (e.g. from a reopened tab) for this long.
+_FINISHED_JOB_TTL = 3600.0
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class PipelineJob:
+    """One execution of a pipeline state: all remaining steps, or just the next.
+
+    The job owns ``state`` while it runs; readers may look at it, but only
+    the job writes it. ``speculation`` is promoted for the first step if
+    its input still matches; with ``speculate_next`` (manual mode), the
+    next step is started speculatively and left in :attr:`speculation`.
+    """
+
+    def __init__(
+        self,
+        state: PipelineState,
+        agents: Mapping[str, BaseAgent],
+        single_step: bool = False,
+        speculation: SpeculativeRun | None = None,
+        speculate_next: bool = False,
+        save: bool = True,
+    ) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.state = state
+        self.agents = agents
+        self.single_step = single_step
+        self.speculation = speculation
+        self.speculate_next = speculate_next
+        self.save = save
+        self.status = JobStatus.QUEUED
+        self.error: str | None = None
+        self.save_path: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self._partial: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._cancel = CancelToken()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    def partial(self) -> dict[str, str]:
+        """Text streamed so far by each node still running."""
+        with self._lock:
+            return dict(self._partial)
+
+    def cancel(self) -> None:
+        """Stop the job now, closing its LLM streams; a queued job never starts."""
+        self._cancel.cancel("任务已停止")
+
+    def _on_chunk(self, name: str, text: str) -> None:
+        with self._lock:
+            self._partial[name] = self._partial.get(name, "") + text
+
+    def run(self) -> None:
+        if self._cancel.cancelled:
+            self._finish(JobStatus.CANCELLED, self._cancel.reason)
+            return
+        # The deadline counts from the start, not from submission.
+        if settings.PIPELINE_DEADLINE_SECONDS:
+            self._cancel.cancel_after(settings.PIPELINE_DEADLINE_SECONDS)
+        self.state.cancel = self._cancel
+        self.status = JobStatus.RUNNING
+        try:
+            if self.single_step:
+                self._run_step()
+            else:
+                self._run_all()
+        except Cancelled as e:
+            self._finish(JobStatus.CANCELLED, e.reason)
+        except Exception as e:
+            self._finish(JobStatus.FAILED, self._describe(e))
+        else:
+            self._finish(JobStatus.DONE, self.error)
+
+    def _finish(self, status: JobStatus, error: str | None) -> None:
+        if status == JobStatus.CANCELLED and self.speculation is not None:
+            self.speculation.cancel()
+            self.speculation = None
+        with self._lock:
+            self._partial.clear()
+        self.error = error
+        self.finished_at = time.time()
+        self.status = status
+
+    def _describe(self, error: BaseException) -> str:
+        for name in self.state.graph.order:
+            if name in self.state.errors:
+                agent = self.agents[self.state.graph[name].agent]
+                return f"{agent.name} 执行失败：{self.state.errors[name]}"
+        return str(error)
+
+    def _run_all(self) -> None:
+        state = self.state
+        state.reset_unfinished()
+        if not state.is_complete:
+            # A step started early (or speculatively) is promoted first.
+            self._promote(state.current_step)
+        self.speculation = None
+        run_graph(state, self.agents, on_chunk=self._on_chunk)
+        if self.save:
+            try:
+                self.save_path = str(save_results(state))
+            except Exception as e:
+                self.error = f"保存失败：{e}"
+
+    def _run_step(self) -> None:
+        state = self.state
+        step = state.current_step
+        if not self._promote(step):
+            key = state.graph.order[step]
+            agent = self.agents[state.graph[key].agent]
+            input_text = get_agent_input(state, step, agent.input_sections)
+            state.mark_running(key)
+            try:
+                stream = agent.run_stream(
+                    input_text, on_record=self._early_start_hook(step), cancel=self._cancel
+                )
+                for text in stream:
+                    self._on_chunk(key, text)
+            except Cancelled as e:
+                state.mark_cancelled(key, e)
+                raise
+            except Exception as e:
+                state.mark_failed(key, e)
+                raise
+            state.mark_done(key, stream.result)
+        if self.speculate_next and not state.is_complete:
+            self._speculate(state.current_step)
+
+    def _speculate(self, step: int) -> None:
+        """Start ``step`` in the background on the current unedited output."""
+        graph = self.state.graph
+        agent = self.agents[graph[graph.order[step]].agent]
+        input_text = get_agent_input(self.state, step, agent.input_sections)
+        if self.speculation is not None and self.speculation.matches(step, input_text):
+            return  # already started early on the same input
+        if self.speculation is not None:
+            self.speculation.cancel()
+        self.speculation = start_speculation(agent, step, input_text)
+
+    def _early_start_hook(self, step: int) -> Callable[[MarkdownRecord], None] | None:
+        """Record callback that starts step ``step + 1`` as soon as the sections it reads exist."""
+        state = self.state
+        order = state.graph.order
+        if not (self.speculate_next and state.early_start) or step + 1 >= len(order):
+            return None
+        key, next_key = order[step], order[step + 1]
+        sections = self.agents[state.graph[next_key].agent].input_sections
+        if not sections:
+            return None
+
+        def on_record(record: MarkdownRecord) -> None:
+            state.add_section(key, record)
+            if self.speculation is None and next_key in state.ready_nodes({next_key: sections}):
+                self._speculate(step + 1)
+
+        return on_record
+
+    def _promote(self, step: int) -> bool:
+        """Use the speculative result for ``step`` if its input is still current.
+
+        Returns False (after discarding the speculation) when the upstream
+        output was edited, the speculation targets another step, or it failed.
+        """
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return False
+        try:
+            input_text = get_agent_input(self.state, step, speculation.agent.input_sections)
+        except ValueError:
+            input_text = None
+        if input_text is None or not speculation.matches(step, input_text):
+            speculation.cancel()
+            return False
+
+        key = self.state.graph.order[step]
+        self.state.mark_running(key)
+        while not speculation.done:
+            if self._cancel.wait(0.1):
+                speculation.cancel()
+                self.state.status.pop(key, None)
+                raise Cancelled(self._cancel.reason)
+        try:
+            result = speculation.result()
+        except Exception:
+            self.state.status.pop(key, None)
+            return False
+        self.state.mark_done(key, result)
+        return True
+
+
+class JobManager:
+    """Process-wide registry of pipeline jobs on one shared thread pool."""
+
+    def __init__(self, max_workers: int) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="pipeline-job"
+        )
+        self._jobs: dict[str, PipelineJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job: PipelineJob) -> PipelineJob:
+        with self._lock:
+            self._prune()
+            if job.state.run_id and any(
+                not other.done and other.state.run_id == job.state.run_id
+                for other in self._jobs.values()
+            ):
+                raise RuntimeError(f"运行 {job.state.run_id} 已有任务在执行")
+            self._jobs[job.id] = job
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id: str | None) -> PipelineJob | None:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_run(self, run_id: str) -> PipelineJob | None:
+        """The latest job of run ``run_id``, so another session can attach to it."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.state.run_id == run_id]
+        return max(jobs, key=lambda job: job.created_at, default=None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - _FINISHED_JOB_TTL
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+
+_manager: JobManager | None = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """The process-wide job manager, shared by every Streamlit session."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(settings.JOB_MAX_WORKERS)
+        return _manager
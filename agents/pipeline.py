@@ -1,38 +1,513 @@
+"""Pipeline graph, state and schedulers.
+
+A pipeline is a DAG of :class:`Node` s. Each node runs one agent; its
+output is published under the node's name, and its ``inputs`` name the
+outputs (or :data:`TOPIC`) it consumes. The schedulers start every node
+whose inputs are ready, so independent branches run concurrently.
+
+The default graph is the original four-step chain, and the step-based API
+(:data:`AGENT_ORDER`, ``current_step``, :func:`get_agent_input`) still
+addresses nodes by their position in the graph's topological order.
+
+With early start (``PipelineState.early_start``), an agent that declares
+``input_sections`` is launched as soon as those sections are complete in
+its upstream's stream, rather than when the upstream finishes.
+
+``PipelineState.cancel`` stops a run: running nodes close their streams
+and keep their partial output (``partials``), and nothing new starts.
+"""
+
 from __future__ import annotations
 
+import asyncio
+import queue
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from enum import Enum
+from typing import TYPE_CHECKING
+
+from agents.base_agent import AgentResult, BaseAgent
+from config.settings import settings
+from llm.cancel import Cancelled, CancelToken
+from utils.markdown_stream import MarkdownRecord, extract_sections
+
+if TYPE_CHECKING:
+    from utils.run_store import RunStore
+
+TOPIC = "topic"
+
+
+class NodeStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"  # an upstream node failed
+    CANCELLED = "cancelled"  # stopped through the run's cancel token
+
+
+@dataclass(frozen=True)
+class Node:
+    """One agent invocation in the graph.
+
+    ``agent`` is the key of the agent to run (defaults to ``name``), so the
+    same agent can appear in several nodes. ``inputs`` lists upstream node
+    names, or :data:`TOPIC` for the user's topic.
+    """
+
+    name: str
+    agent: str = ""
+    inputs: tuple[str, ...] = (TOPIC,)
+
+    def __post_init__(self) -> None:
+        if not self.agent:
+            object.__setattr__(self, "agent", self.name)
+
+
+class PipelineGraph:
+    def __init__(self, nodes: Iterable[Node]) -> None:
+        self.nodes: dict[str, Node] = {}
+        for node in nodes:
+            if node.name == TOPIC or node.name in self.nodes:
+                raise ValueError(f"节点名重复或非法：{node.name}")
+            self.nodes[node.name] = node
+        for node in self.nodes.values():
+            for source in node.inputs:
+                if source != TOPIC and source not in self.nodes:
+                    raise ValueError(f"节点 {node.name} 的输入 {source} 不存在")
+        self.order: tuple[str, ...] = self._topological_order()
+
+    def _topological_order(self) -> tuple[str, ...]:
+        # Kahn's algorithm, ties broken by declaration order.
+        remaining = {name: {s for s in node.inputs if s != TOPIC} for name, node in self.nodes.items()}
+        order: list[str] = []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"流水线存在环：{', '.join(remaining)}")
+            for name in ready:
+                del remaining[name]
+                for deps in remaining.values():
+                    deps.discard(name)
+            order.extend(ready)
+        return tuple(order)
 
-from agents.base_agent import AgentResult
+    def __iter__(self) -> Iterator[Node]:
+        return (self.nodes[name] for name in self.order)
 
-AGENT_ORDER = ["sentinel", "adversary", "visual_director", "growth_hacker"]
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __getitem__(self, name: str) -> Node:
+        return self.nodes[name]
+
+    def downstream(self, name: str) -> set[str]:
+        """Every node that depends, directly or transitively, on ``name``."""
+        found: set[str] = set()
+        frontier = [name]
+        while frontier:
+            current = frontier.pop()
+            for node in self.nodes.values():
+                if current in node.inputs and node.name not in found:
+                    found.add(node.name)
+                    frontier.append(node.name)
+        return found
+
+
+def chain(*agent_keys: str) -> PipelineGraph:
+    """A linear graph where each agent consumes the previous one's output."""
+    nodes = []
+    previous = TOPIC
+    for key in agent_keys:
+        nodes.append(Node(key, inputs=(previous,)))
+        previous = key
+    return PipelineGraph(nodes)
+
+
+DEFAULT_GRAPH = chain("sentinel", "adversary", "visual_director", "growth_hacker")
+AGENT_ORDER = list(DEFAULT_GRAPH.order)
 
 
 @dataclass
 class PipelineState:
     topic: str = ""
-    current_step: int = 0  # 0-4, where 4 means complete
+    current_step: int = 0  # completed prefix of graph.order; len(graph) means complete
     results: dict[str, AgentResult] = field(default_factory=dict)
+    graph: PipelineGraph = field(default_factory=lambda: DEFAULT_GRAPH)
+    status: dict[str, NodeStatus] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+    early_start: bool = field(default_factory=lambda: settings.PIPELINE_EARLY_START)
+    # Completed sections ({title: text}) of nodes still streaming.
+    sections: dict[str, dict[str, str]] = field(default_factory=dict)
+    run_id: str = ""
+    # When set, every node outcome is checkpointed as it happens.
+    store: RunStore | None = field(default=None, repr=False, compare=False)
+    # Stops the run (and its in-flight LLM streams) when cancelled or past its deadline.
+    cancel: CancelToken | None = field(default=None, repr=False, compare=False)
+    # What cancelled nodes produced before they were stopped, usage included.
+    partials: dict[str, AgentResult] = field(default_factory=dict)
 
     @property
     def is_complete(self) -> bool:
-        return self.current_step >= len(AGENT_ORDER)
+        return all(name in self.results for name in self.graph.order)
+
+    def node_status(self, name: str) -> NodeStatus:
+        if name in self.status:
+            return self.status[name]
+        return NodeStatus.DONE if name in self.results else NodeStatus.PENDING
+
+    def _input_ready(self, source: str, sections: Sequence[str]) -> bool:
+        if source == TOPIC or source in self.results:
+            return True
+        if not (self.early_start and sections) or self.node_status(source) != NodeStatus.RUNNING:
+            return False
+        seen = self.sections.get(source, {})
+        return all(any(title.startswith(s) for title in seen) for s in sections)
+
+    def ready_nodes(self, sections: Mapping[str, Sequence[str]] | None = None) -> list[str]:
+        """Pending nodes whose inputs are all available.
+
+        ``sections`` maps node names to the upstream sections they read
+        (``BaseAgent.input_sections``); with early start on, such a node is
+        ready once those sections are complete in a running upstream.
+        """
+        sections = sections or {}
+        return [
+            node.name
+            for node in self.graph
+            if self.node_status(node.name) == NodeStatus.PENDING
+            and all(self._input_ready(s, sections.get(node.name, ())) for s in node.inputs)
+        ]
+
+    def add_section(self, name: str, record: MarkdownRecord) -> None:
+        """Record a completed section of running node ``name``."""
+        if record.kind == "section":
+            self.sections.setdefault(name, {})[record.data["title"]] = record.data["text"]
+
+    def upstream_failed(self, name: str) -> bool:
+        """Whether an input of ``name`` failed or was skipped.
+
+        A node started early from a partial upstream is discarded when
+        that upstream then fails.
+        """
+        return any(
+            self.node_status(s) in (NodeStatus.FAILED, NodeStatus.SKIPPED, NodeStatus.CANCELLED)
+            for s in self.graph[name].inputs
+            if s != TOPIC
+        )
+
+    def mark_running(self, name: str) -> None:
+        self.status[name] = NodeStatus.RUNNING
+        self.errors.pop(name, None)
+        self.partials.pop(name, None)
+
+    def mark_done(self, name: str, result: AgentResult) -> None:
+        self.results[name] = result
+        self.status[name] = NodeStatus.DONE
+        self.errors.pop(name, None)
+        self.sections.pop(name, None)
+        step = 0
+        while step < len(self.graph.order) and self.graph.order[step] in self.results:
+            step += 1
+        self.current_step = step
+        self.checkpoint(name)
+
+    def mark_failed(self, name: str, error: BaseException) -> None:
+        self.status[name] = NodeStatus.FAILED
+        self.errors[name] = f"{type(error).__name__}: {error}"
+        self.sections.pop(name, None)
+        for downstream in self.graph.downstream(name):
+            # Nodes already started early finish first; see upstream_failed().
+            if downstream not in self.results and self.node_status(downstream) != NodeStatus.RUNNING:
+                self.status[downstream] = NodeStatus.SKIPPED
+        self.checkpoint(name)
+
+    def mark_cancelled(self, name: str, error: Cancelled) -> None:
+        """Record a stopped node; its downstream stays pending for a later resume."""
+        self.status[name] = NodeStatus.CANCELLED
+        self.errors[name] = f"{type(error).__name__}: {error}"
+        self.sections.pop(name, None)
+        if error.partial is not None:
+            self.partials[name] = error.partial
+        self.checkpoint(name)
+
+    def checkpoint(self, name: str) -> None:
+        """Persist node ``name`` to the run store, if one is attached.
+
+        Called on every completion and failure; call it again after
+        editing a result in place.
+        """
+        if self.store is not None:
+            self.store.checkpoint(self, name)
 
+    def reset_unfinished(self) -> None:
+        """Make failed, skipped, cancelled or interrupted nodes runnable again."""
+        for name in self.graph.order:
+            if name not in self.results:
+                self.status.pop(name, None)
+                self.errors.pop(name, None)
+                self.sections.pop(name, None)
+                self.partials.pop(name, None)
 
-def get_agent_input(state: PipelineState, step: int) -> str:
-    """Return the input text for a given step.
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.cancelled
+
+
+def _output_text(result: AgentResult) -> str:
+    # A user-edited output replaces the original downstream.
+    if result.edited and result.edited_text:
+        return result.edited_text
+    return result.output_text
+
+
+def _source_text(state: PipelineState, name: str, source: str, sections: Sequence[str]) -> str:
+    result = state.results.get(source)
+    if state.early_start and sections:
+        if result is not None:
+            text = extract_sections(_output_text(result), sections)
+        else:
+            seen = state.sections.get(source, {})
+            text = "\n\n".join(t for title, t in seen.items() if title.startswith(tuple(sections)))
+        # An upstream that doesn't use the expected headings is passed whole.
+        if text:
+            return text
+    if result is None:
+        raise ValueError(f"{name} 需要前置步骤 {source} 的输出，但尚未执行。")
+    return _output_text(result)
+
+
+def get_node_input(state: PipelineState, name: str, sections: Sequence[str] = ()) -> str:
+    """Return the input text for node ``name``.
+
+    A single input is passed through as is; several are joined as
+    ``## <source>`` sections in declaration order. With early start on,
+    only the upstream ``sections`` the node's agent reads are passed,
+    whether the upstream has finished or is still streaming.
+    """
+    parts: list[tuple[str, str]] = []
+    for source in state.graph[name].inputs:
+        if source == TOPIC:
+            parts.append((source, state.topic))
+        else:
+            parts.append((source, _source_text(state, name, source, sections)))
+    if len(parts) == 1:
+        return parts[0][1]
+    return "\n\n".join(f"## {source}\n\n{text}" for source, text in parts)
+
+
+def get_agent_input(state: PipelineState, step: int, sections: Sequence[str] = ()) -> str:
+    """Return the input text for the node at position ``step`` of the graph."""
+    return get_node_input(state, state.graph.order[step], sections)
+
+
+def node_sections(state: PipelineState, agents: Mapping[str, BaseAgent]) -> dict[str, tuple[str, ...]]:
+    """The upstream sections each node reads early, if early start is on."""
+    if not state.early_start:
+        return {}
+    return {
+        node.name: agents[node.agent].input_sections
+        for node in state.graph
+        if agents[node.agent].input_sections
+    }
+
+
+def _streamed_nodes(state: PipelineState, sections: Mapping[str, Sequence[str]]) -> set[str]:
+    # Upstreams of early-start nodes must be streamed to see their sections.
+    return {s for name in sections for s in state.graph[name].inputs if s != TOPIC}
+
+
+def _finish(state: PipelineState, name: str, outcome: AgentResult | BaseException) -> BaseException | None:
+    """Apply a node's outcome to ``state``; return the error, if any."""
+    if isinstance(outcome, Cancelled):
+        state.mark_cancelled(name, outcome)
+        return outcome
+    if isinstance(outcome, BaseException):
+        state.mark_failed(name, outcome)
+        return outcome
+    if state.upstream_failed(name):
+        state.status[name] = NodeStatus.SKIPPED
+    else:
+        state.mark_done(name, outcome)
+    return None
+
+
+def _run_node(
+    agent: BaseAgent,
+    input_text: str,
+    on_record: Callable[[MarkdownRecord], None] | None,
+    on_chunk: Callable[[str], None] | None = None,
+    cancel: CancelToken | None = None,
+) -> AgentResult:
+    if on_record is None and on_chunk is None:
+        return agent.run(input_text, cancel)
+    stream = agent.run_stream(input_text, on_record=on_record, cancel=cancel)
+    for text in stream:
+        if on_chunk is not None:
+            on_chunk(text)
+    return stream.result
 
-    Step 0 uses the original topic; subsequent steps use the previous agent's
-    output (or user-edited version if available via edited_outputs).
+
+def run_graph(
+    state: PipelineState,
+    agents: Mapping[str, BaseAgent],
+    max_concurrency: int | None = None,
+    on_chunk: Callable[[str, str], None] | None = None,
+) -> PipelineState:
+    """Run every unfinished node, starting each as soon as its inputs exist.
+
+    Up to ``max_concurrency`` nodes (default: all ready ones) run at once in
+    a thread pool. A failed node's downstream is skipped while independent
+    branches carry on; the first failure is re-raised at the end, and
+    completed nodes stay in ``state``.
+
+    With ``on_chunk``, every node is streamed and ``on_chunk(name, text)``
+    is called for each chunk, possibly from worker threads. An exception it
+    raises fails that node.
+
+    Once ``state.cancel`` fires, running nodes are stopped and marked
+    cancelled, no new node starts, and :class:`Cancelled` is raised.
     """
-    if step == 0:
-        return state.topic
-
-    prev_key = AGENT_ORDER[step - 1]
-    prev_result = state.results.get(prev_key)
-    if prev_result is None:
-        raise ValueError(f"步骤 {step} 需要前置步骤 {prev_key} 的输出，但尚未执行。")
-
-    # If the previous result was edited, use the edited text
-    if prev_result.edited and prev_result.edited_text:
-        return prev_result.edited_text
-    return prev_result.output_text
+    state.reset_unfinished()
+    first_error: BaseException | None = None
+    workers = max(1, max_concurrency or len(state.graph))
+    sections = node_sections(state, agents)
+    streamed = _streamed_nodes(state, sections)
+    # Workers report sections and outcomes here; only this thread touches state.
+    events: queue.Queue[tuple[str, MarkdownRecord | AgentResult | BaseException]] = queue.Queue()
+
+    def node_chunk(name: str) -> Callable[[str], None] | None:
+        if on_chunk is None:
+            return None
+        return lambda text: on_chunk(name, text)
+
+    def work(name: str, input_text: str) -> None:
+        on_record = None
+        if name in streamed:
+            on_record = lambda record: events.put((name, record))  # noqa: E731
+        agent = agents[state.graph[name].agent]
+        try:
+            events.put((name, _run_node(agent, input_text, on_record, node_chunk(name), state.cancel)))
+        except Exception as e:
+            events.put((name, e))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline") as pool:
+        running: set[str] = set()
+        while True:
+            ready = [] if state.cancelled else state.ready_nodes(sections)
+            if len(ready) == 1 and not running and ready[0] not in streamed:
+                # A lone runnable node (always, on a chain) runs inline
+                # rather than paying a thread hand-off.
+                name = ready[0]
+                input_text = get_node_input(state, name, sections.get(name, ()))
+                state.mark_running(name)
+                try:
+                    outcome = _run_node(
+                        agents[state.graph[name].agent], input_text, None, node_chunk(name), state.cancel
+                    )
+                except Exception as e:
+                    outcome = e
+                error = _finish(state, name, outcome)
+                first_error = first_error or error
+                continue
+            for name in ready:
+                if len(running) >= workers:
+                    break
+                input_text = get_node_input(state, name, sections.get(name, ()))
+                state.mark_running(name)
+                running.add(name)
+                pool.submit(work, name, input_text)
+            if not running:
+                break
+            name, event = events.get()
+            if isinstance(event, MarkdownRecord):
+                state.add_section(name, event)
+                continue
+            running.discard(name)
+            error = _finish(state, name, event)
+            first_error = first_error or error
+    if first_error is None and state.cancelled and not state.is_complete:
+        first_error = Cancelled(state.cancel.reason)
+    if first_error is not None:
+        raise first_error
+    return state
+
+
+async def _arun_node(
+    agent: BaseAgent,
+    input_text: str,
+    on_record: Callable[[MarkdownRecord], None] | None,
+    cancel: CancelToken | None = None,
+) -> AgentResult:
+    if on_record is None:
+        return await agent.arun(input_text, cancel)
+    stream = agent.arun_stream(input_text, on_record=on_record, cancel=cancel)
+    async for _ in stream:
+        pass
+    return stream.result
+
+
+async def arun_graph(
+    state: PipelineState,
+    agents: Mapping[str, BaseAgent],
+    max_concurrency: int | None = None,
+) -> PipelineState:
+    """Async counterpart of :func:`run_graph` using ``BaseAgent.arun``."""
+    state.reset_unfinished()
+    first_error: BaseException | None = None
+    limit = max(1, max_concurrency or len(state.graph))
+    sections = node_sections(state, agents)
+    streamed = _streamed_nodes(state, sections)
+    events: asyncio.Queue[tuple[str, MarkdownRecord | AgentResult | BaseException]] = asyncio.Queue()
+
+    async def work(name: str, input_text: str) -> None:
+        on_record = None
+        if name in streamed:
+            on_record = lambda record: events.put_nowait((name, record))  # noqa: E731
+        agent = agents[state.graph[name].agent]
+        try:
+            events.put_nowait((name, await _arun_node(agent, input_text, on_record, state.cancel)))
+        except Exception as e:
+            events.put_nowait((name, e))
+
+    running: dict[str, asyncio.Task[None]] = {}
+    try:
+        while True:
+            for name in [] if state.cancelled else state.ready_nodes(sections):
+                if len(running) >= limit:
+                    break
+                input_text = get_node_input(state, name, sections.get(name, ()))
+                state.mark_running(name)
+                running[name] = asyncio.create_task(work(name, input_text))
+            if not running:
+                break
+            name, event = await events.get()
+            if isinstance(event, MarkdownRecord):
+                state.add_section(name, event)
+                continue
+            running.pop(name)
+            error = _finish(state, name, event)
+            first_error = first_error or error
+    finally:
+        for task in running.values():
+            task.cancel()
+    if first_error is None and state.cancelled and not state.is_complete:
+        first_error = Cancelled(state.cancel.reason)
+    if first_error is not None:
+        raise first_error
+    return state
+
+
+def run_pipeline(state: PipelineState, agents: Mapping[str, BaseAgent]) -> PipelineState:
+    """Run every remaining node of ``state`` with blocking agent calls.
+
+    Used by headless callers (e.g. the batch runner) that don't need streaming.
+    Exceptions from an agent propagate; completed steps stay in ``state``.
+    """
+    return run_graph(state, agents)
+
+
+async def arun_pipeline(state: PipelineState, agents: Mapping[str, BaseAgent]) -> PipelineState:
+    """Async counterpart of :func:`run_pipeline` using ``BaseAgent.arun``."""
+    return await arun_graph(state, agents)
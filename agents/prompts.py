@@ -0,0 +1,76 @@
+"""Registry of rendered agent system prompts.
+
+Each agent's system prompt (per :attr:`BaseAgent.prompt_variant`) is
+rendered once per knowledge-map version and reused for every call, along
+with its hash (stable cache key) and a token estimate.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from knowledge import knowledge_version
+from llm.tokens import estimate_tokens
+
+if TYPE_CHECKING:
+    from agents.base_agent import BaseAgent
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    agent_key: str
+    variant: str
+    knowledge_version: str
+    text: str
+    sha256: str
+    token_estimate: int
+
+
+class PromptRegistry:
+    def __init__(self) -> None:
+        self._prompts: dict[tuple[str, str, str], RenderedPrompt] = {}
+        self._lock = threading.Lock()
+
+    def get(self, agent: BaseAgent) -> RenderedPrompt:
+        """Return the rendered system prompt for ``agent``, rendering on first use."""
+        version = knowledge_version()
+        key = (agent.key, agent.prompt_variant, version)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            with self._lock:
+                prompt = self._prompts.get(key)
+                if prompt is None:
+                    prompt = self._render(agent, version)
+                    # Drop renders for superseded knowledge-map versions.
+                    for stale in [k for k in self._prompts if k[2] != version]:
+                        del self._prompts[stale]
+                    self._prompts[key] = prompt
+        return prompt
+
+    def warm(self, agents: Iterable[BaseAgent]) -> None:
+        """Render prompts for ``agents`` up front, off the request path."""
+        for agent in agents:
+            self.get(agent)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prompts.clear()
+
+    @staticmethod
+    def _render(agent: BaseAgent, version: str) -> RenderedPrompt:
+        text = agent.get_system_prompt()
+        return RenderedPrompt(
+            agent_key=agent.key,
+            variant=agent.prompt_variant,
+            knowledge_version=version,
+            text=text,
+            sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            token_estimate=estimate_tokens(text),
+        )
+
+
+prompt_registry = PromptRegistry()
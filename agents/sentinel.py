@@ -1,7 +1,15 @@
 from __future__ import annotations
 
 from agents.base_agent import BaseAgent
-from knowledge import format_schools_for_prompt
+from config.settings import ModelConfig, settings
+from knowledge import format_schools, format_schools_for_prompt, select_schools
+from llm.base import AsyncLLMClient, LLMClient
+
+_FULL_MAP_RULE = """1. **科幻哲学流派关联**：你拥有一份 AI 科幻哲学地图（8 大思想流派、80+ 部作品）。分析话题时，主动扫描全部 8 个流派，选择最能产生认知张力的 2-3 个流派进行深度连接。不要局限于最表面的关联——最好的内容来自反直觉的母题配对。
+
+{schools_text}"""
+
+_TOP_K_RULE = """1. **科幻哲学流派关联**：用户消息末尾附有 AI 科幻哲学地图中与本话题最相关的若干思想流派（流派名、核心论点、代表作品、核心拷问）。从中选择最能产生认知张力的 2-3 个流派进行深度连接，也可凭你对科幻作品的了解补充地图之外的作品。不要局限于最表面的关联——最好的内容来自反直觉的母题配对。"""
 
 
 class SentinelAgent(BaseAgent):
@@ -10,17 +18,37 @@ class SentinelAgent(BaseAgent):
     description = "将话题与科幻母题和历史镜像关联，生成结构化情报简报"
     icon = "🛰️"
 
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        async_llm_client: AsyncLLMClient | None = None,
+        knowledge_mode: str | None = None,
+        top_k_schools: int | None = None,
+        model_config: ModelConfig | None = None,
+    ) -> None:
+        super().__init__(llm_client, async_llm_client, model_config)
+        mode = (knowledge_mode or settings.SENTINEL_KNOWLEDGE_MODE).lower()
+        if mode not in ("full", "top_k"):
+            raise ValueError(f"未知的知识注入模式: {mode}")
+        self.knowledge_mode = mode
+        self.top_k_schools = top_k_schools or settings.SENTINEL_TOP_K_SCHOOLS
+
+    @property
+    def prompt_variant(self) -> str:
+        return self.knowledge_mode
+
     def get_system_prompt(self) -> str:
-        schools_text = format_schools_for_prompt()
+        if self.knowledge_mode == "top_k":
+            knowledge_rule = _TOP_K_RULE
+        else:
+            knowledge_rule = _FULL_MAP_RULE.format(schools_text=format_schools_for_prompt())
         return f"""你是「奇点编辑部」的情报采编员，代号 Sentinel。
 
 你的任务是将用户提供的话题进行深度情报采编，生成一份结构化的情报简报。
 
 ## 工作规则
 
-1. **科幻哲学流派关联**：你拥有一份 AI 科幻哲学地图（8 大思想流派、80+ 部作品）。分析话题时，主动扫描全部 8 个流派，选择最能产生认知张力的 2-3 个流派进行深度连接。不要局限于最表面的关联——最好的内容来自反直觉的母题配对。
-
-{schools_text}
+{knowledge_rule}
 
 2. **历史镜像**：必须找到至少 2 个历史事件作为话题的镜像参照，可选镜像库包括但不限于：
    - 罗马帝国的兴衰 — 制度熵增
@@ -67,4 +95,12 @@ class SentinelAgent(BaseAgent):
 保持硬核科幻风格，避免口水话，每一句都要有信息密度。"""
 
     def build_user_message(self, input_text: str) -> str:
-        return f"请对以下话题进行情报采编：\n\n{input_text}"
+        message = f"请对以下话题进行情报采编：\n\n{input_text}"
+        if self.knowledge_mode != "top_k":
+            return message
+        # Only the schools relevant to this topic go into the (per-call) user
+        # message, keeping the system prompt static and cacheable. A topic
+        # that matches nothing falls back to the full map.
+        schools = select_schools(input_text, self.top_k_schools)
+        schools_text = format_schools(schools) if schools else format_schools_for_prompt()
+        return f"{message}\n\n## 相关科幻哲学流派\n\n{schools_text}"
@@ -0,0 +1,67 @@
+"""Speculative execution of the next pipeline step.
+
+In manual mode the next agent can be started in the background on the
+current step's unedited output while the user is still reviewing it. If the
+user doesn't edit, the finished (or in-flight) result is promoted instead of
+paying the whole LLM latency after the click; otherwise it is discarded.
+"""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from agents.base_agent import AgentResult, BaseAgent
+from config.settings import settings
+from llm.cancel import CancelToken
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Shared by every session so speculative work stays bounded process-wide.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SPECULATIVE_MAX_WORKERS,
+                thread_name_prefix="speculative",
+            )
+        return _executor
+
+
+class SpeculativeRun:
+    def __init__(self, agent: BaseAgent, step: int, input_text: str) -> None:
+        self.agent = agent
+        self.step = step
+        self.input_text = input_text
+        self._cancel = CancelToken()
+        self._future: Future[AgentResult] = _get_executor().submit(
+            agent.run, input_text, self._cancel
+        )
+
+    def matches(self, step: int, input_text: str) -> bool:
+        """Whether this speculation is for exactly the input now requested."""
+        return self.step == step and self.input_text == input_text
+
+    @property
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: float | None = None) -> AgentResult:
+        """Wait for and return the speculative result (re-raises its error)."""
+        return self._future.result(timeout)
+
+    def cancel(self) -> None:
+        """Discard the speculation.
+
+        A queued call never starts; a call already in flight is stopped
+        and its stream closed, so no more output is generated for it.
+        """
+        self._future.cancel()
+        self._cancel.cancel("预执行已丢弃")
+
+
+def start_speculation(agent: BaseAgent, step: int, input_text: str) -> SpeculativeRun:
+    return SpeculativeRun(agent, step, input_text)
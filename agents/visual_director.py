@@ -1,20 +1,17 @@
 from __future__ import annotations
 
-from agents.base_agent import BaseAgent
+import re
+from collections.abc import AsyncIterator, Iterator
 
+from agents.base_agent import AgentResult, BaseAgent
+from agents.fanout import AsyncCompositeChatStream, CompositeChatStream, SubCall, UsageTally
+from config.settings import ModelConfig, settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import CancelToken
 
-class VisualDirectorAgent(BaseAgent):
-    name = "神经编剧"
-    key = "visual_director"
-    description = "将论点转化为标注神经递质的赛博朋克分镜脚本"
-    icon = "🎬"
+_PERSONA = "你是「奇点编辑部」的神经编剧，代号 Visual Director。"
 
-    def get_system_prompt(self) -> str:
-        return """你是「奇点编辑部」的神经编剧，代号 Visual Director。
-
-你的任务是将逻辑对垒手提供的钢化论点转化为一份完整的硬核科幻短视频分镜脚本。
-
-## 创作原则
+_PRINCIPLES = """## 创作原则
 
 1. **神经递质标注**：每个分镜必须标注该段落触发的主要神经递质：
    - 🧪 多巴胺（DA）— 好奇心、期待感、意外奖励
@@ -33,7 +30,161 @@ class VisualDirectorAgent(BaseAgent):
    - 第 1 分钟：问题展开 — 建立话题的核心张力
    - 第 2-3 分钟：论证主体 — 逐步释放钢化论点
    - 第 4 分钟：高潮反转 — 颠覆观众预期
-   - 最后 30 秒：开放式结尾 — 留下思考空间
+   - 最后 30 秒：开放式结尾 — 留下思考空间"""
+
+# (段落, 默认时间码), in storyboard order
+SEGMENTS = (
+    ("钩子", "00:00-00:15"),
+    ("问题展开", "00:15-01:00"),
+    ("论证主体", "01:00-03:00"),
+    ("高潮反转", "03:00-04:00"),
+    ("开放式结尾", "04:00-04:30"),
+)
+
+_TABLE_HEADER = """| 时间码 | 画面描述 | 旁白/文案 | 神经递质 | 镜头语言 |
+|--------|---------|-----------|---------|---------|"""
+
+_OUTLINE_PROMPT = f"""{_PERSONA}
+
+你的任务是为逻辑对垒手提供的钢化论点规划一份硬核科幻短视频的大纲，分镜细节稍后由其他编剧按段落并行完成。
+
+{_PRINCIPLES}
+
+## 输出格式
+
+严格使用以下结构，只输出大纲，不要写分镜：
+
+```
+# 视频分镜脚本：[标题]
+
+## 视频概要
+- **总时长**：[X 分 X 秒]
+- **风格基调**：[一句话描述]
+- **目标情绪曲线**：[如：好奇→震惊→沉思→顿悟→敬畏]
+
+## 段落大纲
+
+| 段落 | 时间码 | 节拍 |
+|------|--------|------|
+| 钩子 | 00:00-00:15 | [本段要传达的信息与情绪节拍] |
+| 问题展开 | 00:15-01:00 | [本段要传达的信息与情绪节拍] |
+| 论证主体 | 01:00-03:00 | [本段要传达的信息与情绪节拍] |
+| 高潮反转 | 03:00-04:00 | [本段要传达的信息与情绪节拍] |
+| 开放式结尾 | 04:00-04:30 | [本段要传达的信息与情绪节拍] |
+```
+
+时间码可按内容调整，但五个段落必须按顺序齐全、首尾相接。"""
+
+_SEGMENT_PROMPT = f"""{_PERSONA}
+
+你正在与其他编剧并行创作同一支视频，只负责其中一个段落的分镜。
+
+{_PRINCIPLES}
+
+## 输出格式
+
+只输出本段落的分镜表格，不要输出标题或任何其他内容：
+
+```
+{_TABLE_HEADER}
+| [时间码] | [具体画面描述，包含色调、元素] | [逐字旁白稿] | [🧪DA/💗OT/🏃EP/⚡AD/🧠5-HT] | [镜头运动：推/拉/摇/移/特写] |
+```
+
+时间码必须落在本段落的时间范围内，可以拆成多行。每一帧都要有存在的理由。"""
+
+_SCENES_PROMPT = f"""{_PERSONA}
+
+分镜表格由其他编剧并行创作，你负责根据视频大纲写出关键视觉场景与配乐建议。
+
+## 输出格式
+
+严格使用以下 Markdown 结构：
+
+```
+## 关键视觉场景描述
+
+### 场景 1：[场景名]
+[详细的视觉描述，可作为 AI 绘图的 prompt 参考，100-150 字]
+
+### 场景 2：[场景名]
+[详细的视觉描述，100-150 字]
+
+### 场景 3：[场景名]
+[详细的视觉描述，100-150 字]
+
+## BGM 建议
+- **开场**：[风格/参考曲目]
+- **主体**：[风格/参考曲目]
+- **高潮**：[风格/参考曲目]
+- **结尾**：[风格/参考曲目]
+```
+
+视觉风格遵循赛博朋克基调：霓虹蓝/品红/琥珀黄为主，暗色背景，全息投影、数据流、神经接口、废墟都市。"""
+
+_OUTLINE_ROW_RE = re.compile(r"^\|\s*([^|]+?)\s*\|\s*([\d:]+\s*-\s*[\d:]+)\s*\|\s*([^|]*?)\s*\|\s*$", re.M)
+_SEPARATOR_RE = re.compile(r"^\|[\s|:-]+\|$")
+
+
+def parse_outline(outline: str) -> tuple[str, list[tuple[str, str, str]]]:
+    """Split an outline into its header and ``(段落, 时间码, 节拍)`` rows.
+
+    The header is everything before ``## 段落大纲``. Segments missing from
+    the outline keep their default timecode with empty beats.
+    """
+    header, _, table = outline.partition("## 段落大纲")
+    rows = {label: (timecode, beats) for label, timecode, beats in _OUTLINE_ROW_RE.findall(table)}
+    segments = []
+    for label, default_timecode in SEGMENTS:
+        timecode, beats = rows.get(label, (default_timecode, ""))
+        segments.append((label, timecode.replace(" ", ""), beats))
+    return header.strip(), segments
+
+
+def table_rows(text: str) -> list[str]:
+    """Storyboard rows from a segment reply, without header or separator."""
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("|") or _SEPARATOR_RE.match(line) or "时间码" in line:
+            continue
+        rows.append(line)
+    return rows
+
+
+class VisualDirectorAgent(BaseAgent):
+    """Storyboard writer.
+
+    In ``sectioned`` mode a compact outline is generated first, then the
+    five storyboard segments and the scene/BGM section are generated
+    concurrently and stitched into the usual table, so no single call has
+    to fit the whole script into ``MAX_TOKENS``.
+    """
+
+    name = "神经编剧"
+    key = "visual_director"
+    description = "将论点转化为标注神经递质的赛博朋克分镜脚本"
+    icon = "🎬"
+    input_sections = ("打磨后论点", "新增论点")
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        async_llm_client: AsyncLLMClient | None = None,
+        mode: str | None = None,
+        model_config: ModelConfig | None = None,
+    ) -> None:
+        super().__init__(llm_client, async_llm_client, model_config)
+        mode = (mode or settings.VISUAL_DIRECTOR_MODE).lower()
+        if mode not in ("single", "sectioned"):
+            raise ValueError(f"未知的分镜生成模式: {mode}")
+        self.mode = mode
+
+    def get_system_prompt(self) -> str:
+        return f"""{_PERSONA}
+
+你的任务是将逻辑对垒手提供的钢化论点转化为一份完整的硬核科幻短视频分镜脚本。
+
+{_PRINCIPLES}
 
 ## 输出格式
 
@@ -77,3 +228,84 @@ class VisualDirectorAgent(BaseAgent):
 
     def build_user_message(self, input_text: str) -> str:
         return f"请根据以下逻辑对垒报告，创作视频分镜脚本：\n\n{input_text}"
+
+    # --- sectioned mode ---
+
+    def _segment_calls(self, input_text: str, outline: str) -> list[SubCall]:
+        _, segments = parse_outline(outline)
+        calls = [
+            SubCall(
+                _SEGMENT_PROMPT,
+                f"## 逻辑对垒报告\n\n{input_text}\n\n## 视频大纲\n\n{outline}\n\n"
+                f"请创作段落「{label}」（{timecode}）的分镜。" + (f"节拍：{beats}" if beats else ""),
+                **self.sampling,
+            )
+            for label, timecode, beats in segments
+        ]
+        calls.append(SubCall(_SCENES_PROMPT, f"## 视频大纲\n\n{outline}", **self.sampling))
+        return calls
+
+    @staticmethod
+    def _stitch_segment(index: int, response: LLMResponse) -> str:
+        rows = table_rows(response.content)
+        if not rows:
+            label, timecode = SEGMENTS[index]
+            rows = [f"| {timecode} | （{label}段落生成失败） | | | |"]
+        return "\n".join(rows) + "\n"
+
+    def _outline_kwargs(self, input_text: str) -> dict:
+        return {
+            "system_prompt": _OUTLINE_PROMPT,
+            "user_message": self.build_user_message(input_text),
+            **self.sampling,
+            "max_tokens": min(1024, self.model_config.max_tokens),
+        }
+
+    def run(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        if self.mode == "sectioned":
+            return self._run_via_stream(input_text, cancel)
+        return super().run(input_text, cancel)
+
+    async def arun(self, input_text: str, cancel: CancelToken | None = None) -> AgentResult:
+        if self.mode == "sectioned":
+            return await self._arun_via_stream(input_text, cancel)
+        return await super().arun(input_text, cancel)
+
+    def _chat_stream(self, input_text: str) -> ChatStream:
+        if self.mode != "sectioned":
+            return super()._chat_stream(input_text)
+        llm = self._require_llm()
+
+        def produce(tally: UsageTally) -> Iterator[str]:
+            # Via the tally, so closing the stream doesn't wait for the outline.
+            outline = tally.gather(llm, [SubCall(**self._outline_kwargs(input_text))])[0].content
+            header, _ = parse_outline(outline)
+            yield f"{header}\n\n## 分镜脚本\n\n{_TABLE_HEADER}\n"
+            # Segments are emitted in order as each one completes.
+            calls = self._segment_calls(input_text, outline)
+            for i, response in enumerate(tally.in_order(llm, calls)):
+                if i < len(SEGMENTS):
+                    yield self._stitch_segment(i, response)
+                else:
+                    yield "\n" + response.content.strip() + "\n"
+
+        return CompositeChatStream(produce)
+
+    def _achat_stream(self, input_text: str) -> AsyncChatStream:
+        if self.mode != "sectioned":
+            return super()._achat_stream(input_text)
+        llm = self._require_async_llm()
+
+        async def produce(tally: UsageTally) -> AsyncIterator[str]:
+            outline = tally.add(await llm.achat(**self._outline_kwargs(input_text))).content
+            header, _ = parse_outline(outline)
+            yield f"{header}\n\n## 分镜脚本\n\n{_TABLE_HEADER}\n"
+            i = 0
+            async for response in tally.ain_order(llm, self._segment_calls(input_text, outline)):
+                if i < len(SEGMENTS):
+                    yield self._stitch_segment(i, response)
+                else:
+                    yield "\n" + response.content.strip() + "\n"
+                i += 1
+
+        return AsyncCompositeChatStream(produce)
@@ -1,25 +1,26 @@
 """奇点编辑部 — AI 驱动的硬核科幻视频脚本生成器"""
 
+import time
+
 import streamlit as st
 
-from agents import SentinelAgent, AdversaryAgent, VisualDirectorAgent, GrowthHackerAgent
+from agents import AGENT_CLASSES
 from agents.base_agent import BaseAgent, AgentResult
-from agents.pipeline import AGENT_ORDER, PipelineState, get_agent_input
+from agents.jobs import JobStatus, PipelineJob, get_job_manager
+from agents.pipeline import AGENT_ORDER, NodeStatus, PipelineState
+from agents.prompts import prompt_registry
+from agents.speculative import SpeculativeRun
 from config.settings import settings
-from llm.factory import create_llm_client
+from llm.factory import get_agent_llm_client
+from utils.metrics import start_configured_exporters
+from utils.archive import get_archive
 from utils.persistence import save_results
+from utils.run_store import get_run_store
 
 # ---------------------------------------------------------------------------
 # Agent registry
 # ---------------------------------------------------------------------------
 
-AGENT_CLASSES: dict[str, type[BaseAgent]] = {
-    "sentinel": SentinelAgent,
-    "adversary": AdversaryAgent,
-    "visual_director": VisualDirectorAgent,
-    "growth_hacker": GrowthHackerAgent,
-}
-
 AGENT_META = {
     "sentinel": ("🛰️", "情报采编员", "关联科幻母题与历史镜像，生成结构化简报"),
     "adversary": ("⚔️", "逻辑对垒手", "五种攻击武器压力测试，输出钢化论点"),
@@ -27,6 +28,15 @@ AGENT_META = {
     "growth_hacker": ("📈", "流量黑客", "标题/封面/标签/多平台投放策略"),
 }
 
+_STATUS_ICONS = {
+    NodeStatus.PENDING: "⬜",
+    NodeStatus.RUNNING: "⏳",
+    NodeStatus.DONE: "✅",
+    NodeStatus.FAILED: "❌",
+    NodeStatus.SKIPPED: "⏭️",
+    NodeStatus.CANCELLED: "⏹️",
+}
+
 
 # ---------------------------------------------------------------------------
 # Session state helpers
@@ -34,8 +44,13 @@ AGENT_META = {
 
 
 def _init_state() -> None:
+    if "job_id" not in st.session_state:
+        st.session_state.job_id = None
     if "pipeline" not in st.session_state:
-        st.session_state.pipeline = PipelineState()
+        state = _load_run_from_url()
+        if state is not None:
+            st.session_state.topic_input = state.topic
+        st.session_state.pipeline = state or PipelineState()
     if "mode" not in st.session_state:
         st.session_state.mode = "auto"
     if "agents" not in st.session_state:
@@ -46,85 +61,146 @@ def _init_state() -> None:
         st.session_state.save_path = None
     if "error" not in st.session_state:
         st.session_state.error = None
+    if "speculative" not in st.session_state:
+        st.session_state.speculative = settings.SPECULATIVE_EXECUTION
+    if "speculation" not in st.session_state:
+        st.session_state.speculation = None
+    if "view" not in st.session_state:
+        st.session_state.view = "run"
+    if "history_page" not in st.session_state:
+        st.session_state.history_page = 0
 
 
 def _ensure_agents() -> dict[str, BaseAgent]:
-    """Create agent instances (lazily, once)."""
+    """Create agent instances (lazily, once) on the process-wide pooled clients."""
     if not st.session_state.agents:
-        client = create_llm_client()
+        start_configured_exporters()
         st.session_state.agents = {
-            key: cls(client) for key, cls in AGENT_CLASSES.items()
+            key: cls(get_agent_llm_client(key)) for key, cls in AGENT_CLASSES.items()
         }
+        prompt_registry.warm(st.session_state.agents.values())
     return st.session_state.agents
 
 
 def _reset_pipeline(topic: str = "") -> None:
-    st.session_state.pipeline = PipelineState(topic=topic)
+    _cancel_job()
+    _discard_speculation()
+    state = PipelineState(topic=topic)
+    store = get_run_store()
+    if store is not None and topic:
+        store.create_run(state)
+    _set_pipeline(state)
+
+
+def _set_pipeline(state: PipelineState) -> None:
+    st.session_state.pipeline = state
     st.session_state.running = False
     st.session_state.save_path = None
     st.session_state.error = None
+    # The run ID in the URL lets a reopened tab or restarted server resume.
+    if state.run_id:
+        st.query_params["run"] = state.run_id
+    else:
+        st.query_params.pop("run", None)
 
 
-# ---------------------------------------------------------------------------
-# Execution logic
-# ---------------------------------------------------------------------------
-
-
-def _run_step(step: int) -> AgentResult | None:
-    """Execute a single pipeline step. Returns the AgentResult or None on error."""
-    state: PipelineState = st.session_state.pipeline
-    agents = _ensure_agents()
-    key = AGENT_ORDER[step]
-    agent = agents[key]
-    icon, name, _ = AGENT_META[key]
-
-    try:
-        input_text = get_agent_input(state, step)
-    except ValueError as e:
-        st.session_state.error = str(e)
+def _load_run_from_url() -> PipelineState | None:
+    run_id = st.query_params.get("run")
+    if not run_id:
+        return None
+    # A job of this run still in memory (e.g. the tab was closed mid-run)
+    # holds the live state; attach to it.
+    job = get_job_manager().find_run(run_id)
+    if job is not None:
+        st.session_state.job_id = job.id
+        return job.state
+    store = get_run_store()
+    if store is None:
         return None
-
     try:
-        agent_stream = agent.run_stream(input_text)
-    except Exception as e:
-        st.session_state.error = f"{name} 执行失败：{e}"
+        return store.load(run_id)
+    except KeyError:
         return None
 
-    with st.status(f"{icon} {name} 正在生成…", expanded=True):
-        try:
-            st.write_stream(agent_stream)
-        except Exception as e:
-            st.session_state.error = f"{name} 执行失败：{e}"
-            return None
 
-    result = agent_stream.result
-    state.results[key] = result
-    state.current_step = step + 1
-    return result
+def _resume_run(run_id: str) -> None:
+    """Load a checkpointed run; remaining steps continue from where it stopped."""
+    _discard_speculation()
+    state = get_run_store().load(run_id)
+    _set_pipeline(state)
+    st.session_state.topic_input = state.topic
 
 
-def _run_auto() -> None:
-    """Run all remaining steps automatically."""
-    state: PipelineState = st.session_state.pipeline
-    st.session_state.running = True
-    st.session_state.error = None
+# ---------------------------------------------------------------------------
+# Execution logic
+# ---------------------------------------------------------------------------
 
-    for step in range(state.current_step, len(AGENT_ORDER)):
-        result = _run_step(step)
-        if result is None:
-            st.session_state.running = False
-            return
 
-    # Auto-save
-    try:
-        path = save_results(state)
-        st.session_state.save_path = str(path)
-    except Exception as e:
-        st.session_state.error = f"保存失败：{e}"
+def _active_job() -> PipelineJob | None:
+    return get_job_manager().get(st.session_state.job_id)
+
 
+def _sync_job() -> None:
+    """Pick up the outcome of this session's background job once it has finished."""
+    job = _active_job()
+    if job is None:
+        st.session_state.job_id = None
+        st.session_state.running = False
+        return
+    if not job.done:
+        st.session_state.running = True
+        return
+    st.session_state.job_id = None
+    st.session_state.running = False
+    st.session_state.error = job.error
+    if job.save_path:
+        st.session_state.save_path = job.save_path
+    if job.speculation is not None:
+        _discard_speculation()
+        st.session_state.speculation = job.speculation
+
+
+def _cancel_job() -> None:
+    job = _active_job()
+    if job is not None:
+        job.cancel()
+    st.session_state.job_id = None
     st.session_state.running = False
 
 
+def _discard_speculation() -> None:
+    speculation: SpeculativeRun | None = st.session_state.get("speculation")
+    if speculation is not None:
+        speculation.cancel()
+    st.session_state.speculation = None
+
+
+def _submit_job(single_step: bool) -> None:
+    """Run the pipeline (or, in manual mode, its next step) in the background.
+
+    The script thread returns immediately; progress is polled on reruns.
+    A pending speculation is handed to the job for promotion.
+    """
+    speculation: SpeculativeRun | None = st.session_state.speculation
+    st.session_state.speculation = None
+    job = PipelineJob(
+        st.session_state.pipeline,
+        _ensure_agents(),
+        single_step=single_step,
+        speculation=speculation,
+        speculate_next=single_step and st.session_state.speculative,
+        save=not single_step,
+    )
+    try:
+        get_job_manager().submit(job)
+    except RuntimeError as e:
+        st.session_state.error = str(e)
+        return
+    st.session_state.job_id = job.id
+    st.session_state.running = True
+    st.session_state.error = None
+
+
 # ---------------------------------------------------------------------------
 # UI rendering
 # ---------------------------------------------------------------------------
@@ -132,6 +208,14 @@ def _run_auto() -> None:
 
 def _render_sidebar() -> None:
     with st.sidebar:
+        st.session_state.view = st.radio(
+            "页面",
+            options=["run", "history"],
+            format_func=lambda x: "✨ 生成" if x == "run" else "🗂️ 历史运行",
+            index=0 if st.session_state.view == "run" else 1,
+            horizontal=True,
+            label_visibility="collapsed",
+        )
         st.markdown("## ⚙️ 设置")
         mode = st.radio(
             "运行模式",
@@ -141,37 +225,81 @@ def _render_sidebar() -> None:
             key="mode_radio",
         )
         st.session_state.mode = mode
+        if mode == "manual":
+            st.session_state.speculative = st.toggle(
+                "⚡ 预先执行下一步",
+                value=st.session_state.speculative,
+                help="当前步骤完成后立即在后台用未编辑的输出启动下一个 Agent；"
+                "若你没有修改输出，点击执行时直接采用预先生成的结果。",
+            )
+            if not st.session_state.speculative:
+                _discard_speculation()
 
         st.divider()
         st.markdown("## 📋 流水线")
-        for i, key in enumerate(AGENT_ORDER):
+        state: PipelineState = st.session_state.pipeline
+        for key in AGENT_ORDER:
             icon, name, desc = AGENT_META[key]
-            state: PipelineState = st.session_state.pipeline
-            if key in state.results:
-                status = "✅"
-            elif i == state.current_step and st.session_state.running:
-                status = "⏳"
-            elif i < state.current_step:
-                status = "✅"
-            else:
-                status = "⬜"
+            status = _STATUS_ICONS[state.node_status(key)]
             st.markdown(f"{status} **{icon} {name}**")
+            config = settings.model_config(key)
+            if config != settings.model_config():
+                desc += f"（`{config.model}`，温度 {config.temperature}）"
             st.caption(desc)
 
+        _render_run_history()
+
         st.divider()
         st.markdown(f"**模型**: `{settings.MODEL_NAME}`")
         st.markdown(f"**温度**: `{settings.TEMPERATURE}`")
 
 
+def _render_run_history() -> None:
+    """Unfinished runs from the run store, resumable without re-calling the LLM."""
+    store = get_run_store()
+    if store is None:
+        return
+    state: PipelineState = st.session_state.pipeline
+    runs = [r for r in store.list_runs(limit=20, unfinished_only=True) if r.run_id != state.run_id]
+    if not runs:
+        return
+    st.divider()
+    st.markdown("## 🗂️ 未完成的运行")
+    labels = {r.run_id: f"{r.topic[:20]} · {r.done_nodes}/{r.total_nodes}" for r in runs}
+    run_id = st.selectbox(
+        "选择运行",
+        options=list(labels),
+        format_func=lambda run_id: labels[run_id],
+        label_visibility="collapsed",
+    )
+    if st.button("⏯️ 恢复此运行", disabled=st.session_state.running):
+        _resume_run(run_id)
+        st.rerun()
+
+
 def _render_result(key: str, result: AgentResult, editable: bool = False) -> None:
     """Render a single agent result, optionally with an edit area."""
     icon, name, _ = AGENT_META[key]
 
     with st.expander(f"{icon} {name} — 输出结果", expanded=True):
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("输入 tokens", result.input_tokens)
         col2.metric("输出 tokens", result.output_tokens)
         col3.metric("耗时", f"{result.elapsed_seconds}s")
+        timing = result.timing
+        if timing:
+            col4.metric("首 token", f"{timing.time_to_first_token_seconds}s")
+            col5.metric("生成速度", f"{timing.output_tokens_per_second} tok/s")
+            st.caption(
+                f"排队 {timing.queue_wait_seconds}s · 生成 {timing.generation_seconds}s · "
+                f"{timing.chunk_count} 个片段，间隔 p50 {timing.inter_chunk_p50_ms}ms / "
+                f"p95 {timing.inter_chunk_p95_ms}ms / 最大 {timing.inter_chunk_max_ms}ms"
+            )
+        if result.cache_read_input_tokens or result.cache_creation_input_tokens:
+            st.caption(
+                f"Prompt 缓存：命中 {result.cache_read_input_tokens} tokens，"
+                f"写入 {result.cache_creation_input_tokens} tokens"
+            )
 
         if editable:
             current_text = result.edited_text if result.edited else result.output_text
@@ -181,16 +309,29 @@ def _render_result(key: str, result: AgentResult, editable: bool = False) -> Non
                 height=400,
                 key=f"edit_{key}",
             )
+            previous = (result.edited, result.edited_text)
             if edited != result.output_text:
                 result.edited = True
                 result.edited_text = edited
             else:
                 result.edited = False
                 result.edited_text = ""
+            if (result.edited, result.edited_text) != previous:
+                st.session_state.pipeline.checkpoint(key)
         else:
             st.markdown(result.output_text)
 
 
+def _missing_api_keys(state: PipelineState) -> list[str]:
+    """Agents of the graph whose provider needs an API key but whose model config has none."""
+    missing = []
+    for key in dict.fromkeys(node.agent for node in state.graph):
+        config = settings.model_config(key)
+        if config.requires_api_key and config.api_key in ("", "your-api-key-here"):
+            missing.append(key)
+    return missing
+
+
 def _render_main() -> None:
     st.title("🌌 奇点编辑部")
     st.markdown("*AI 驱动的硬核科幻视频脚本生成器*")
@@ -203,8 +344,12 @@ def _render_main() -> None:
         st.error(st.session_state.error)
 
     # --- API key check ---
-    if not settings.API_KEY or settings.API_KEY == "your-api-key-here":
-        st.warning("请在 `.env` 文件中设置 `API_KEY`。可参考 `.env.example`。")
+    missing = _missing_api_keys(state)
+    if missing:
+        env_names = "、".join(f"`{key.upper()}_API_KEY`" for key in missing)
+        st.warning(
+            f"请在 `.env` 文件中设置 `API_KEY`（或 {env_names}）。可参考 `.env.example`。"
+        )
         st.stop()
 
     # --- Topic input ---
@@ -225,9 +370,14 @@ def _render_main() -> None:
         start_label = "🚀 开始生成" if st.session_state.mode == "auto" else "▶️ 执行下一步"
 
         if st.session_state.mode == "auto":
+            # An interrupted or resumed run of this topic continues instead.
+            resumable = state.topic == topic.strip() and state.results and not state.is_complete
+            if resumable:
+                start_label = "⏯️ 继续运行"
             if st.button(start_label, disabled=start_disabled, type="primary"):
-                _reset_pipeline(topic.strip())
-                _run_auto()
+                if not resumable:
+                    _reset_pipeline(topic.strip())
+                _submit_job(single_step=False)
                 st.rerun()
         else:
             # Manual mode: run next step
@@ -241,11 +391,18 @@ def _render_main() -> None:
             if st.button(step_label, disabled=start_disabled, type="primary"):
                 if not state.topic:
                     _reset_pipeline(topic.strip())
-                _run_step(state.current_step)
+                _submit_job(single_step=True)
                 st.rerun()
 
     with col_reset:
-        if st.button("🔄 重置", disabled=st.session_state.running):
+        if st.session_state.running:
+            if st.button("⏹️ 停止"):
+                # The job may have finished (or been pruned) since the render.
+                job = _active_job()
+                if job is not None:
+                    job.cancel()
+                st.rerun()
+        elif st.button("🔄 重置"):
             _reset_pipeline()
             st.rerun()
 
@@ -261,9 +418,21 @@ def _render_main() -> None:
                 break
             result = state.results[key]
             # In manual mode, the latest step's output is editable
-            editable = is_manual and (i == state.current_step - 1) and not state.is_complete
+            editable = (
+                is_manual
+                and (i == state.current_step - 1)
+                and not state.is_complete
+                and not st.session_state.running
+            )
             _render_result(key, result, editable=editable)
 
+    for key, partial in state.partials.items():
+        _render_partial(key, partial)
+
+    job = _active_job()
+    if job is not None and not job.done:
+        _render_job(job)
+
     # --- Completion ---
     if state.is_complete:
         st.divider()
@@ -283,6 +452,110 @@ def _render_main() -> None:
             st.info(f"📁 结果已保存至：`{st.session_state.save_path}`")
 
 
+def _render_partial(key: str, partial: AgentResult) -> None:
+    """What a stopped agent produced before it was cancelled; rerunning starts it over."""
+    icon, name, _ = AGENT_META[key]
+    with st.expander(f"⏹️ {icon} {name} — 已停止（部分输出）", expanded=False):
+        st.caption(
+            f"约 {partial.input_tokens} 输入 tokens / {partial.output_tokens} 输出 tokens（估算），"
+            f"运行 {partial.elapsed_seconds}s"
+        )
+        st.markdown(partial.output_text or "（尚未生成内容）")
+
+
+def _render_job(job: PipelineJob) -> None:
+    """Live view of a background job: what each running agent has streamed so far."""
+    if job.status == JobStatus.QUEUED:
+        st.info("⏳ 排队中，等待空闲的执行线程…")
+        return
+    partial = job.partial()
+    for key in AGENT_ORDER:
+        if job.state.node_status(key) != NodeStatus.RUNNING:
+            continue
+        icon, name, _ = AGENT_META[key]
+        label = f"{icon} {name} 正在生成…" if key in partial else f"{icon} {name} 等待结果…"
+        with st.status(label, expanded=True):
+            st.markdown(partial.get(key, ""))
+
+
+_HISTORY_PAGE_SIZE = 20
+
+
+def _render_history() -> None:
+    """Searchable, paginated list of saved runs, served from the archive index."""
+    st.title("🗂️ 历史运行")
+    if not settings.ARCHIVE_INDEX_ENABLED:
+        st.info("归档索引未启用（`ARCHIVE_INDEX_ENABLED=false`）。")
+        return
+    archive = get_archive()
+
+    col_query, col_model, col_edited = st.columns([3, 1, 1])
+    query = col_query.text_input(
+        "搜索", placeholder="话题或输出中的关键词，空格分隔", key="history_query"
+    )
+    model = col_model.selectbox(
+        "模型", [""] + archive.models(), format_func=lambda m: m or "全部", key="history_model"
+    )
+    edited_only = col_edited.checkbox("只看编辑过的", key="history_edited")
+
+    # New filters start from the first page.
+    filters = (query, model, edited_only)
+    if st.session_state.get("history_filters") != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_page = 0
+    page_no = st.session_state.history_page
+    page = archive.search(
+        query,
+        model=model,
+        edited=True if edited_only else None,
+        limit=_HISTORY_PAGE_SIZE,
+        offset=page_no * _HISTORY_PAGE_SIZE,
+    )
+    if not page.entries:
+        st.info("没有匹配的运行。")
+        return
+
+    rows = [
+        {
+            "时间": entry.timestamp[:19].replace("T", " "),
+            "话题": entry.topic,
+            "模型": entry.model,
+            "输入 tokens": entry.input_tokens,
+            "输出 tokens": entry.output_tokens,
+            "耗时 (s)": entry.elapsed_seconds,
+            "完成": f"{entry.completed_nodes}/{entry.total_nodes}",
+            "已编辑": "✏️" if entry.edited else "",
+        }
+        for entry in page.entries
+    ]
+    if query:
+        for row, entry in zip(rows, page.entries):
+            row["匹配"] = entry.snippet
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    if col_prev.button("◀ 上一页", disabled=page_no == 0):
+        st.session_state.history_page -= 1
+        st.rerun()
+    col_info.caption(f"共 {page.total} 条 · 第 {page_no + 1}/{page.page_count} 页")
+    if col_next.button("下一页 ▶", disabled=page_no + 1 >= page.page_count):
+        st.session_state.history_page += 1
+        st.rerun()
+
+    entry = st.selectbox(
+        "查看运行",
+        page.entries,
+        format_func=lambda e: f"{e.timestamp[:19].replace('T', ' ')} · {e.topic}",
+    )
+    report = entry.output_dir / "result.md"
+    st.caption(f"📁 `{entry.output_dir}`")
+    if report.exists():
+        with st.expander("📄 运行报告", expanded=False):
+            st.markdown(report.read_text(encoding="utf-8"))
+    else:
+        st.warning("运行目录已不存在。")
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
@@ -295,8 +568,16 @@ def main() -> None:
         layout="wide",
     )
     _init_state()
+    _sync_job()
     _render_sidebar()
-    _render_main()
+    if st.session_state.view == "history":
+        _render_history()
+    else:
+        _render_main()
+        if st.session_state.running:
+            # Poll the background job; the script thread is free in between.
+            time.sleep(settings.JOB_POLL_INTERVAL)
+            st.rerun()
 
 
 if __name__ == "__main__":
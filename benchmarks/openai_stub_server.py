@@ -0,0 +1,149 @@
+"""Local stand-in for an OpenAI-compatible server.
+
+Serves ``POST /v1/chat/completions`` (plain and SSE streaming, with usage)
+from :class:`llm.fake_client.FakeLLMClient`, so ``LLM_PROVIDER=openai_compat``
+and the whole HTTP path (pooling, SSE parsing, retries) can be exercised
+without a GPU box or API key::
+
+    python -m benchmarks.openai_stub_server --port 8001 &
+    LLM_PROVIDER=openai_compat BASE_URL=http://127.0.0.1:8001/v1 \\
+        python -m agents.batch topics.txt --concurrency 8
+
+A simulated failure drops the connection, like a crashed or restarted
+server would.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm.fake_client import FakeLLMClient, FakeLLMError
+
+
+def _usage(response) -> dict:
+    return {
+        "prompt_tokens": response.input_tokens,
+        "completion_tokens": response.output_tokens,
+        "total_tokens": response.input_tokens + response.output_tokens,
+    }
+
+
+def make_handler(client: FakeLLMClient) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is exercised
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002
+            pass
+
+        def _send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:  # noqa: N802
+            # Read the body first so the kept-alive connection stays in sync.
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            body = json.loads(raw)
+            messages = {m["role"]: m["content"] for m in body.get("messages", [])}
+            args = (
+                messages.get("system", ""),
+                messages.get("user", ""),
+                body.get("max_tokens", 4096),
+                body.get("temperature", 0.7),
+                messages.get("assistant", ""),
+            )
+            try:
+                if body.get("stream"):
+                    self._stream(body, args)
+                else:
+                    response = client.chat(*args)
+                    self._send_json(200, {
+                        "id": f"chatcmpl-{time.time_ns()}",
+                        "object": "chat.completion",
+                        "model": body.get("model", response.model),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": response.content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": _usage(response),
+                    })
+            except FakeLLMError:
+                self.close_connection = True
+
+        def _stream(self, body: dict, args: tuple) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            model = body.get("model", "fake")
+
+            def send(event: dict | str) -> None:
+                data = event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)
+                payload = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                self.wfile.flush()
+
+            stream = client.chat_stream(*args)
+            for text in stream:
+                send({
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                })
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send({"object": "chat.completion.chunk", "model": model, "choices": [],
+                      "usage": _usage(stream.response)})
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8001,
+    **client_kwargs,
+) -> ThreadingHTTPServer:
+    """Create the server (call ``serve_forever`` on it, or run it in a thread)."""
+    server = ThreadingHTTPServer((host, port), make_handler(FakeLLMClient(**client_kwargs)))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = serve(
+        args.host,
+        args.port,
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        failure_rate=args.failure_rate,
+    )
+    print(f"OpenAI 兼容模拟服务：http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Offline benchmarks for the orchestration code, on :mod:`llm.fake_client`.
+
+No network or API key is needed. Each scenario reports throughput, p50/p99
+latency per operation and the process's peak RSS so far::
+
+    python -m benchmarks.pipeline_bench
+    python -m benchmarks.pipeline_bench -n 200 -c 32 --tokens-per-second 0
+    python -m benchmarks.pipeline_bench --scenarios threaded,async --failure-rate 0.1
+
+Scenarios: ``prompts`` (system prompt + user message building for all four
+agents), ``sequential`` / ``threaded`` / ``async`` (full pipeline per topic)
+and ``save`` (``save_results`` into a temporary directory).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+from agents import AGENT_CLASSES
+from agents.base_agent import BaseAgent
+from agents.pipeline import PipelineState, arun_pipeline, run_pipeline
+from llm.fake_client import AsyncFakeLLMClient, FakeLLMClient
+from llm.retry import AsyncRetryingLLMClient, RetryingLLMClient, RetryPolicy
+from utils.persistence import save_results
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ("prompts", "sequential", "threaded", "async", "save")
+_RETRY = RetryPolicy(max_attempts=5, base_delay=0.01, max_delay=0.1)
+
+
+@dataclass
+class BenchResult:
+    scenario: str
+    operations: int
+    errors: int
+    wall_seconds: float
+    throughput_per_second: float
+    p50_ms: float
+    p99_ms: float
+    peak_rss_mb: float | None
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+def _result(scenario: str, latencies: list[float], errors: int, wall: float) -> BenchResult:
+    ops = len(latencies)
+    return BenchResult(
+        scenario=scenario,
+        operations=ops,
+        errors=errors,
+        wall_seconds=round(wall, 3),
+        throughput_per_second=round(ops / wall, 2) if wall > 0 else 0.0,
+        p50_ms=round(_percentile(latencies, 50) * 1000, 2),
+        p99_ms=round(_percentile(latencies, 99) * 1000, 2),
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+
+def _timed(fn: Callable[[], object]) -> tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        fn()
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def _topics(n: int) -> list[str]:
+    return [f"第 {i} 号话题：当 AI 获得自我意识后，人类还需要工作吗？" for i in range(n)]
+
+
+def _sync_agents(args: argparse.Namespace) -> dict[str, BaseAgent]:
+    fake = FakeLLMClient(
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        failure_rate=args.failure_rate,
+    )
+    client = RetryingLLMClient(fake, _RETRY)
+    return {key: cls(client) for key, cls in AGENT_CLASSES.items()}
+
+
+def _async_agents(args: argparse.Namespace) -> dict[str, BaseAgent]:
+    fake = AsyncFakeLLMClient(
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        failure_rate=args.failure_rate,
+    )
+    client = AsyncRetryingLLMClient(fake, _RETRY)
+    return {key: cls(None, client) for key, cls in AGENT_CLASSES.items()}
+
+
+def bench_prompts(args: argparse.Namespace) -> BenchResult:
+    agents = _sync_agents(args)
+
+    def build(topic: str) -> None:
+        for agent in agents.values():
+            agent.get_system_prompt()
+            agent.build_user_message(topic)
+
+    start = time.perf_counter()
+    timings = [_timed(lambda t=topic: build(t)) for topic in _topics(args.topics)]
+    wall = time.perf_counter() - start
+    return _result("prompts", [t for t, _ in timings], sum(not ok for _, ok in timings), wall)
+
+
+def bench_sequential(args: argparse.Namespace) -> BenchResult:
+    agents = _sync_agents(args)
+    start = time.perf_counter()
+    timings = [
+        _timed(lambda t=topic: run_pipeline(PipelineState(topic=t), agents))
+        for topic in _topics(args.topics)
+    ]
+    wall = time.perf_counter() - start
+    return _result("sequential", [t for t, _ in timings], sum(not ok for _, ok in timings), wall)
+
+
+def bench_threaded(args: argparse.Namespace) -> BenchResult:
+    agents = _sync_agents(args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        timings = list(pool.map(
+            lambda t: _timed(lambda: run_pipeline(PipelineState(topic=t), agents)),
+            _topics(args.topics),
+        ))
+    wall = time.perf_counter() - start
+    return _result("threaded", [t for t, _ in timings], sum(not ok for _, ok in timings), wall)
+
+
+def bench_async(args: argparse.Namespace) -> BenchResult:
+    agents = _async_agents(args)
+
+    async def main() -> list[tuple[float, bool]]:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(topic: str) -> tuple[float, bool]:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await arun_pipeline(PipelineState(topic=topic), agents)
+                    ok = True
+                except Exception:
+                    ok = False
+                return time.perf_counter() - start, ok
+
+        return list(await asyncio.gather(*(one(t) for t in _topics(args.topics))))
+
+    start = time.perf_counter()
+    timings = asyncio.run(main())
+    wall = time.perf_counter() - start
+    return _result("async", [t for t, _ in timings], sum(not ok for _, ok in timings), wall)
+
+
+def bench_save(args: argparse.Namespace) -> BenchResult:
+    # Build the states untimed and instantly, then time only the writes.
+    instant = argparse.Namespace(**{**vars(args), "tokens_per_second": 0, "first_token_delay": 0, "failure_rate": 0})
+    agents = _sync_agents(instant)
+    states = [run_pipeline(PipelineState(topic=t), agents) for t in _topics(args.topics)]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        timings = [_timed(lambda s=state: save_results(s, tmp)) for state in states]
+        wall = time.perf_counter() - start
+    return _result("save", [t for t, _ in timings], sum(not ok for _, ok in timings), wall)
+
+
+_BENCHES: dict[str, Callable[[argparse.Namespace], BenchResult]] = {
+    "prompts": bench_prompts,
+    "sequential": bench_sequential,
+    "threaded": bench_threaded,
+    "async": bench_async,
+    "save": bench_save,
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="奇点编辑部离线性能基准（模拟 LLM）")
+    parser.add_argument("-n", "--topics", type=int, default=50, help="每个场景的话题数")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="threaded / async 场景的并发数")
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=2000.0, help="模拟输出速度（0 为瞬时）"
+    )
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="模拟首 token 延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟调用失败概率（0-1）")
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，可选：{', '.join(SCENARIOS)}"
+    )
+    parser.add_argument("--json", dest="json_path", help="把结果另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in _BENCHES]
+    if unknown:
+        parser.error(f"未知场景：{', '.join(unknown)}")
+
+    results = []
+    print(f"{'scenario':<12}{'ops':>6}{'errors':>8}{'wall s':>10}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+    for name in names:
+        r = _BENCHES[name](args)
+        results.append(r)
+        rss = "—" if r.peak_rss_mb is None else f"{r.peak_rss_mb:.1f}"
+        print(
+            f"{r.scenario:<12}{r.operations:>6}{r.errors:>8}{r.wall_seconds:>10.3f}"
+            f"{r.throughput_per_second:>10.2f}{r.p50_ms:>10.2f}{r.p99_ms:>10.2f}{rss:>9}",
+            flush=True,
+        )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,28 @@ _project_root = Path(__file__).resolve().parent.parent
 load_dotenv(_project_root / ".env")
 
 
+@dataclass(frozen=True)
+class ModelConfig:
+    """Where one agent's calls go (provider endpoint and model) and how they sample."""
+
+    provider: str
+    model: str
+    max_tokens: int
+    temperature: float
+    api_key: str = ""
+    base_url: str = ""
+
+    @property
+    def requires_api_key(self) -> bool:
+        """Whether calls fail without a key; local OpenAI-compatible servers and the fake provider take none."""
+        return self.provider.lower() not in ("openai_compat", "fake")
+
+    @property
+    def endpoint(self) -> tuple[str, str, str, str]:
+        """The fields that need a separate client; sampling parameters don't."""
+        return (self.provider.lower(), self.model, self.api_key, self.base_url)
+
+
 @dataclass(frozen=True)
 class Settings:
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "anthropic")
@@ -20,6 +42,86 @@ class Settings:
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "4096"))
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.7"))
     OUTPUT_DIR: str = str(_project_root / "output")
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    RATE_LIMIT_REQUESTS_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "0"))
+    RATE_LIMIT_TOKENS_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "0"))
+    RATE_LIMIT_OVERLOAD_RETRIES: int = int(os.getenv("RATE_LIMIT_OVERLOAD_RETRIES", "3"))
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "30"))
+    RETRY_DEADLINE_SECONDS: float = float(os.getenv("RETRY_DEADLINE_SECONDS", "0"))
+    STREAM_RESUME_ENABLED: bool = os.getenv("STREAM_RESUME_ENABLED", "true").lower() in ("1", "true", "yes")
+    CONCURRENCY_INITIAL: int = int(os.getenv("CONCURRENCY_INITIAL", "4"))
+    CONCURRENCY_MIN: int = int(os.getenv("CONCURRENCY_MIN", "1"))
+    CONCURRENCY_MAX: int = int(os.getenv("CONCURRENCY_MAX", "0"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "600"))
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_FALLBACKS: str = os.getenv("LLM_FALLBACKS", "")
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+    HEDGE_INITIAL_DELAY: float = float(os.getenv("HEDGE_INITIAL_DELAY", "0"))
+    SENTINEL_KNOWLEDGE_MODE: str = os.getenv("SENTINEL_KNOWLEDGE_MODE", "full")
+    SENTINEL_TOP_K_SCHOOLS: int = int(os.getenv("SENTINEL_TOP_K_SCHOOLS", "3"))
+    SPECULATIVE_EXECUTION: bool = os.getenv("SPECULATIVE_EXECUTION", "false").lower() in ("1", "true", "yes")
+    SPECULATIVE_MAX_WORKERS: int = int(os.getenv("SPECULATIVE_MAX_WORKERS", "8"))
+    JOB_MAX_WORKERS: int = int(os.getenv("JOB_MAX_WORKERS", "8"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+    PIPELINE_DEADLINE_SECONDS: float = float(os.getenv("PIPELINE_DEADLINE_SECONDS", "0"))
+    PROMPT_CACHE_ENABLED: bool = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    RESPONSE_CACHE_PATH: str = os.getenv(
+        "RESPONSE_CACHE_PATH", str(_project_root / ".cache" / "responses.sqlite3")
+    )
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    RESPONSE_CACHE_MAX_MB: int = int(os.getenv("RESPONSE_CACHE_MAX_MB", "512"))
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9464"))
+    METRICS_OTLP_FILE: str = os.getenv("METRICS_OTLP_FILE", "")
+    METRICS_EXPORT_INTERVAL: float = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+
+    FAKE_LLM_TOKENS_PER_SECOND: float = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))
+    FAKE_LLM_FIRST_TOKEN_DELAY: float = float(os.getenv("FAKE_LLM_FIRST_TOKEN_DELAY", "0.5"))
+    FAKE_LLM_FAILURE_RATE: float = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+
+    ADVERSARY_MODE: str = os.getenv("ADVERSARY_MODE", "single")
+    ADVERSARY_MERGE_MAX_TOKENS: int = int(os.getenv("ADVERSARY_MERGE_MAX_TOKENS", "1024"))
+    VISUAL_DIRECTOR_MODE: str = os.getenv("VISUAL_DIRECTOR_MODE", "single")
+    FANOUT_MAX_WORKERS: int = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+    ARCHIVE_INDEX_ENABLED: bool = os.getenv("ARCHIVE_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+    RUN_STORE_ENABLED: bool = os.getenv("RUN_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RUN_STORE_PATH: str = os.getenv("RUN_STORE_PATH", str(_project_root / ".cache" / "runs.sqlite3"))
+    PIPELINE_EARLY_START: bool = os.getenv("PIPELINE_EARLY_START", "false").lower() in ("1", "true", "yes")
+
+    def model_config(self, agent_key: str = "") -> ModelConfig:
+        """Model settings for one agent, or the global ones if ``agent_key`` is empty.
+
+        Each of ``<AGENT_KEY>_PROVIDER`` / ``_MODEL`` / ``_MAX_TOKENS`` /
+        ``_TEMPERATURE`` / ``_API_KEY`` / ``_BASE_URL`` (e.g.
+        ``GROWTH_HACKER_MODEL``) overrides the global value for that agent.
+        ``API_KEY`` and ``BASE_URL`` are only inherited when the agent uses
+        the global provider.
+        """
+        prefix = f"{agent_key.upper()}_" if agent_key else ""
+
+        def override(name: str) -> str:
+            return os.getenv(prefix + name, "") if prefix else ""
+
+        provider = override("PROVIDER") or self.LLM_PROVIDER
+        same_provider = provider.lower() == self.LLM_PROVIDER.lower()
+        return ModelConfig(
+            provider=provider,
+            model=override("MODEL") or self.MODEL_NAME,
+            max_tokens=int(override("MAX_TOKENS") or self.MAX_TOKENS),
+            temperature=float(override("TEMPERATURE") or self.TEMPERATURE),
+            api_key=override("API_KEY") or (self.API_KEY if same_provider else ""),
+            base_url=override("BASE_URL") or (self.BASE_URL if same_provider else ""),
+        )
 
 
 settings = Settings()
@@ -1,3 +1,13 @@
-from knowledge.sci_fi_philosophy_map import format_schools_for_prompt
+from knowledge.index import select_schools
+from knowledge.sci_fi_philosophy_map import (
+    format_schools,
+    format_schools_for_prompt,
+    knowledge_version,
+)
 
-__all__ = ["format_schools_for_prompt"]
+__all__ = [
+    "format_schools",
+    "format_schools_for_prompt",
+    "knowledge_version",
+    "select_schools",
+]
@@ -0,0 +1,93 @@
+"""话题 → 流派的本地相关度索引
+
+对每个流派的全部文本（名称、路线、核心论点、核心拷问、作品标题/作者/描述）
+建立字符 n-gram 的 BM25 索引，不依赖分词器或外部服务，中英文混排均可用。
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+
+from knowledge import sci_fi_philosophy_map as _map
+from knowledge.sci_fi_philosophy_map import PhilosophySchool
+
+_CJK_RUN_RE = re.compile(r'[一-鿿㐀-䶿]+')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# 高频虚词单字，不参与匹配（二元组中仍保留）
+_STOP_CHARS = frozenset('的了是吗呢么在和与及会把被将之而也都就')
+
+# BM25 parameters
+_K1 = 1.5
+_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """中文取单字 + 二元组，英文/数字取整词。"""
+    text = text.lower()
+    tokens: list[str] = []
+    for run in _CJK_RUN_RE.findall(text):
+        tokens.extend(ch for ch in run if ch not in _STOP_CHARS)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(w for w in _WORD_RE.findall(text) if len(w) > 1)
+    return tokens
+
+
+def _school_text(school: PhilosophySchool) -> str:
+    parts = [school.name, school.route, school.core_thesis, school.key_question]
+    for work in school.works:
+        parts.extend((work.title, work.author, work.description))
+    return '\n'.join(parts)
+
+
+class SchoolIndex:
+    def __init__(self, schools: tuple[PhilosophySchool, ...]) -> None:
+        self.schools = schools
+        self._doc_tf = [Counter(tokenize(_school_text(s))) for s in schools]
+        self._doc_len = [sum(tf.values()) for tf in self._doc_tf]
+        self._avg_len = sum(self._doc_len) / len(schools) if schools else 0.0
+        df: Counter[str] = Counter()
+        for tf in self._doc_tf:
+            df.update(tf.keys())
+        n = len(schools)
+        self._idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query))
+        result: list[float] = []
+        for tf, length in zip(self._doc_tf, self._doc_len):
+            score = 0.0
+            norm = _K1 * (1 - _B + _B * length / self._avg_len)
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (_K1 + 1) / (freq + norm)
+            result.append(score)
+        return result
+
+    def top_k(self, query: str, k: int) -> list[PhilosophySchool]:
+        """返回与 query 最相关的 k 个流派（按原顺序）；全无命中时返回空列表。"""
+        scores = self.scores(query)
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )[:k]
+        return [self.schools[i] for i in sorted(ranked)]
+
+
+_index: SchoolIndex | None = None
+
+
+def get_school_index() -> SchoolIndex:
+    """返回当前 SCHOOLS 的索引；SCHOOLS 被替换后自动重建。"""
+    global _index
+    if _index is None or _index.schools is not _map.SCHOOLS:
+        _index = SchoolIndex(_map.SCHOOLS)
+    return _index
+
+
+def select_schools(topic: str, k: int) -> list[PhilosophySchool]:
+    return get_school_index().top_k(topic, k)
@@ -8,6 +8,8 @@
 
 from __future__ import annotations
 
+import hashlib
+from collections.abc import Sequence
 from dataclasses import dataclass
 
 
@@ -194,15 +196,44 @@ SCHOOLS: tuple[PhilosophySchool, ...] = (
 )
 
 
+# Derived values are memoized against the identity of SCHOOLS: the tuple is
+# immutable, so the only way the map can change is by rebinding the name.
+_version_cache: tuple[tuple[PhilosophySchool, ...], str] | None = None
+_prompt_cache: tuple[tuple[PhilosophySchool, ...], str] | None = None
+
+
+def knowledge_version() -> str:
+    """返回当前知识地图内容的短哈希，用作 prompt 缓存的版本号。"""
+    global _version_cache
+    schools = SCHOOLS
+    if _version_cache is None or _version_cache[0] is not schools:
+        digest = hashlib.sha256(repr(schools).encode('utf-8')).hexdigest()[:16]
+        _version_cache = (schools, digest)
+    return _version_cache[1]
+
+
 def format_schools_for_prompt() -> str:
     """将 8 大流派格式化为精炼的 prompt 注入文本。
 
     只输出框架骨架（流派名 + 核心论点 + 作品标题清单 + 核心拷问），
-    让 LLM 凭自身训练数据意会补全深度。
+    让 LLM 凭自身训练数据意会补全深度。结果按 SCHOOLS 缓存，只渲染一次。
     """
+    global _prompt_cache
+    schools = SCHOOLS
+    if _prompt_cache is None or _prompt_cache[0] is not schools:
+        _prompt_cache = (schools, _render_schools(schools))
+    return _prompt_cache[1]
+
+
+def format_schools(schools: Sequence[PhilosophySchool]) -> str:
+    """按 format_schools_for_prompt 的格式渲染任意流派子集（不缓存）。"""
+    return _render_schools(schools)
+
+
+def _render_schools(schools: Sequence[PhilosophySchool]) -> str:
     lines: list[str] = []
     circled = '①②③④⑤⑥⑦⑧'
-    for i, school in enumerate(SCHOOLS):
+    for i, school in enumerate(schools):
         titles = '、'.join(f'《{w.title}》' for w in school.works)
         lines.append(
             f'{circled[i]} {school.name} ({school.route}) — {school.core_thesis}\n'
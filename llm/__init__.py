@@ -1,4 +1,22 @@
-from llm.base import LLMClient, LLMResponse
-from llm.factory import create_llm_client
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled, CancelToken
+from llm.factory import (
+    create_async_llm_client,
+    create_llm_client,
+    get_agent_llm_client,
+    get_shared_llm_client,
+)
 
-__all__ = ["LLMClient", "LLMResponse", "create_llm_client"]
+__all__ = [
+    "AsyncChatStream",
+    "AsyncLLMClient",
+    "CancelToken",
+    "Cancelled",
+    "ChatStream",
+    "LLMClient",
+    "LLMResponse",
+    "create_async_llm_client",
+    "create_llm_client",
+    "get_agent_llm_client",
+    "get_shared_llm_client",
+]
@@ -1,10 +1,66 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
+import threading
+from collections.abc import AsyncIterator, Iterator
 
 import anthropic
+import httpx
 
-from llm.base import ChatStream, LLMClient, LLMResponse
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.http_pool import abort_response
+
+
+def _to_llm_response(msg: anthropic.types.Message) -> LLMResponse:
+    return LLMResponse(
+        # A resumed stream that was cut right before the end may come back
+        # with no content blocks at all.
+        content="".join(block.text for block in msg.content if block.type == "text"),
+        model=msg.model,
+        input_tokens=msg.usage.input_tokens,
+        output_tokens=msg.usage.output_tokens,
+        cache_read_input_tokens=getattr(msg.usage, "cache_read_input_tokens", None) or 0,
+        cache_creation_input_tokens=getattr(msg.usage, "cache_creation_input_tokens", None) or 0,
+    )
+
+
+def _system_param(system_prompt: str, prompt_cache: bool) -> str | list[dict]:
+    """Build the ``system`` argument, marking it cacheable when requested.
+
+    The agents' system prompts are static, so a single ephemeral breakpoint
+    on the system block lets every later call within the cache window reuse
+    the provider-side prefix cache.
+    """
+    if not prompt_cache:
+        return system_prompt
+    return [
+        {
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+
+
+def _messages(user_message: str, prefill: str) -> list[dict]:
+    messages = [{"role": "user", "content": user_message}]
+    if prefill:
+        # The API rejects an assistant prefill ending in whitespace.
+        messages.append({"role": "assistant", "content": prefill.rstrip()})
+    return messages
+
+
+def _client_kwargs(
+    api_key: str,
+    base_url: str,
+    http_client: httpx.Client | httpx.AsyncClient | None,
+) -> dict:
+    kwargs: dict = {"api_key": api_key}
+    if base_url:
+        kwargs["base_url"] = base_url
+    if http_client is not None:
+        kwargs["http_client"] = http_client
+    return kwargs
 
 
 class AnthropicChatStream(ChatStream):
@@ -16,6 +72,8 @@ class AnthropicChatStream(ChatStream):
         user_message: str,
         max_tokens: int,
         temperature: float,
+        prompt_cache: bool = False,
+        prefill: str = "",
     ) -> None:
         self.response: LLMResponse | None = None
         self._client = client
@@ -24,33 +82,61 @@ class AnthropicChatStream(ChatStream):
         self._user_message = user_message
         self._max_tokens = max_tokens
         self._temperature = temperature
+        self._prompt_cache = prompt_cache
+        self._prefill = prefill
+        self._stream: anthropic.MessageStream | None = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def _attach(self, stream: anthropic.MessageStream | None) -> None:
+        with self._lock:
+            if stream is not None and self._closed.is_set():
+                raise Cancelled()
+            self._stream = stream
 
     def __iter__(self) -> Iterator[str]:
-        with self._client.messages.stream(
-            model=self._model,
-            max_tokens=self._max_tokens,
-            temperature=self._temperature,
-            system=self._system_prompt,
-            messages=[{"role": "user", "content": self._user_message}],
-        ) as stream:
-            for text in stream.text_stream:
-                yield text
-            msg = stream.get_final_message()
-            self.response = LLMResponse(
-                content=msg.content[0].text,
-                model=msg.model,
-                input_tokens=msg.usage.input_tokens,
-                output_tokens=msg.usage.output_tokens,
-            )
+        if self._closed.is_set():
+            raise Cancelled()
+        try:
+            with self._client.messages.stream(
+                model=self._model,
+                max_tokens=self._max_tokens,
+                temperature=self._temperature,
+                system=_system_param(self._system_prompt, self._prompt_cache),
+                messages=_messages(self._user_message, self._prefill),
+            ) as stream:
+                self._attach(stream)
+                try:
+                    for text in stream.text_stream:
+                        yield text
+                    self.response = _to_llm_response(stream.get_final_message())
+                finally:
+                    # Before the connection goes back to the pool.
+                    self._attach(None)
+        except Exception as e:
+            if self._closed.is_set() and not isinstance(e, Cancelled):
+                raise Cancelled() from e
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed.set()
+            if self._stream is not None:
+                abort_response(self._stream.response)
 
 
 class AnthropicClient(LLMClient):
-    def __init__(self, api_key: str, model: str, base_url: str = "") -> None:
-        kwargs: dict = {"api_key": api_key}
-        if base_url:
-            kwargs["base_url"] = base_url
-        self._client = anthropic.Anthropic(**kwargs)
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = "",
+        prompt_cache: bool = False,
+        http_client: httpx.Client | None = None,
+    ) -> None:
+        self._client = anthropic.Anthropic(**_client_kwargs(api_key, base_url, http_client))
         self._model = model
+        self._prompt_cache = prompt_cache
 
     def chat(
         self,
@@ -58,20 +144,16 @@ class AnthropicClient(LLMClient):
         user_message: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
+        prefill: str = "",
     ) -> LLMResponse:
         response = self._client.messages.create(
             model=self._model,
             max_tokens=max_tokens,
             temperature=temperature,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_message}],
-        )
-        return LLMResponse(
-            content=response.content[0].text,
-            model=response.model,
-            input_tokens=response.usage.input_tokens,
-            output_tokens=response.usage.output_tokens,
+            system=_system_param(system_prompt, self._prompt_cache),
+            messages=_messages(user_message, prefill),
         )
+        return _to_llm_response(response)
 
     def chat_stream(
         self,
@@ -79,6 +161,7 @@ class AnthropicClient(LLMClient):
         user_message: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
+        prefill: str = "",
     ) -> AnthropicChatStream:
         return AnthropicChatStream(
             client=self._client,
@@ -87,4 +170,91 @@ class AnthropicClient(LLMClient):
             user_message=user_message,
             max_tokens=max_tokens,
             temperature=temperature,
+            prompt_cache=self._prompt_cache,
+            prefill=prefill,
+        )
+
+
+class AsyncAnthropicChatStream(AsyncChatStream):
+    def __init__(
+        self,
+        client: anthropic.AsyncAnthropic,
+        model: str,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        prompt_cache: bool = False,
+        prefill: str = "",
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._client = client
+        self._model = model
+        self._system_prompt = system_prompt
+        self._user_message = user_message
+        self._max_tokens = max_tokens
+        self._temperature = temperature
+        self._prompt_cache = prompt_cache
+        self._prefill = prefill
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async with self._client.messages.stream(
+            model=self._model,
+            max_tokens=self._max_tokens,
+            temperature=self._temperature,
+            system=_system_param(self._system_prompt, self._prompt_cache),
+            messages=_messages(self._user_message, self._prefill),
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            self.response = _to_llm_response(await stream.get_final_message())
+
+
+class AsyncAnthropicClient(AsyncLLMClient):
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = "",
+        prompt_cache: bool = False,
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self._client = anthropic.AsyncAnthropic(**_client_kwargs(api_key, base_url, http_client))
+        self._model = model
+        self._prompt_cache = prompt_cache
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        response = await self._client.messages.create(
+            model=self._model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=_system_param(system_prompt, self._prompt_cache),
+            messages=_messages(user_message, prefill),
+        )
+        return _to_llm_response(response)
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncAnthropicChatStream:
+        return AsyncAnthropicChatStream(
+            client=self._client,
+            model=self._model,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            prompt_cache=self._prompt_cache,
+            prefill=prefill,
         )
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Iterator
 from dataclasses import dataclass
 
 
@@ -11,6 +11,8 @@ class LLMResponse:
     model: str
     input_tokens: int
     output_tokens: int
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
 
 
 class ChatStream(ABC):
@@ -21,6 +23,14 @@ class ChatStream(ABC):
     @abstractmethod
     def __iter__(self) -> Iterator[str]: ...
 
+    def close(self) -> None:
+        """Stop the stream from any thread, releasing its connection.
+
+        The iterating thread then raises :class:`llm.cancel.Cancelled`
+        promptly instead of waiting for the model to finish. Streams
+        without a connection of their own keep this no-op.
+        """
+
 
 class LLMClient(ABC):
     @abstractmethod
@@ -30,8 +40,13 @@ class LLMClient(ABC):
         user_message: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
+        prefill: str = "",
     ) -> LLMResponse:
-        """Send a single-turn chat request and return the response."""
+        """Send a single-turn chat request and return the response.
+
+        A non-empty ``prefill`` is sent as the beginning of the assistant
+        turn; the response then contains only the continuation.
+        """
 
     @abstractmethod
     def chat_stream(
@@ -40,5 +55,41 @@ class LLMClient(ABC):
         user_message: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
+        prefill: str = "",
     ) -> ChatStream:
         """Send a single-turn chat request and return a streaming response."""
+
+
+class AsyncChatStream(ABC):
+    """异步流式 LLM 响应。async for 获取文本片段，迭代结束后 .response 可用。"""
+
+    response: LLMResponse | None
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncIterator[str]: ...
+
+
+class AsyncLLMClient(ABC):
+    """Asyncio counterpart of :class:`LLMClient` for event-loop callers."""
+
+    @abstractmethod
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        """Send a single-turn chat request and await the response."""
+
+    @abstractmethod
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        """Send a single-turn chat request and return an async streaming response."""
@@ -0,0 +1,218 @@
+"""Content-addressed response cache for LLM calls.
+
+Responses are keyed on a hash of everything that determines them (model,
+system prompt, user message, max_tokens, temperature), so re-running an
+identical agent call is served from disk instead of the provider.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from llm.base import ChatStream, LLMClient, LLMResponse
+
+
+def cache_key(
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int,
+    temperature: float,
+    prefill: str = "",
+) -> str:
+    parts: list = [model, system_prompt, user_message, max_tokens, temperature]
+    if prefill:
+        parts.append(prefill)
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> LLMResponse | None:
+        """Return the cached response for ``key``, or None on miss/expiry."""
+
+    @abstractmethod
+    def set(self, key: str, response: LLMResponse) -> None:
+        """Store ``response`` under ``key``, evicting entries as needed."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Drop every cached entry."""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite-backed store with TTL expiry and LRU eviction by count and size.
+
+    A limit of 0 disables that particular bound.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        ttl_seconds: float = 0,
+    ) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+
+    def get(self, key: str) -> LLMResponse | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self._ttl and now - created_at > self._ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return LLMResponse(**json.loads(value))
+
+    def set(self, key: str, response: LLMResponse) -> None:
+        value = json.dumps(dataclasses.asdict(response), ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now, now),
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float) -> None:
+        if self._ttl:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self._ttl,)
+            )
+        if self._max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+        if self._max_bytes:
+            # Keep the most recently used entries whose cumulative size fits.
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running"
+                "  FROM responses)"
+                " WHERE running > ?)",
+                (self._max_bytes,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+
+class ReplayChatStream(ChatStream):
+    """Replays a cached response line by line so streaming UIs still work."""
+
+    def __init__(self, response: LLMResponse) -> None:
+        self.response: LLMResponse | None = None
+        self._cached = response
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._cached.content.splitlines(keepends=True)
+        self.response = self._cached
+
+
+class _RecordingChatStream(ChatStream):
+    def __init__(
+        self, inner: ChatStream, on_complete: Callable[[LLMResponse], None]
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._inner = inner
+        self._on_complete = on_complete
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._inner
+        self.response = self._inner.response
+        if self.response is not None:
+            self._on_complete(self.response)
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class CachedLLMClient(LLMClient):
+    """Wraps an :class:`LLMClient`, serving repeated requests from a cache.
+
+    Only fully completed responses are stored; a stream abandoned midway is
+    not cached.
+    """
+
+    def __init__(self, inner: LLMClient, backend: CacheBackend, model: str) -> None:
+        self._inner = inner
+        self._backend = backend
+        self._model = model
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        key = cache_key(self._model, system_prompt, user_message, max_tokens, temperature, prefill)
+        cached = self._backend.get(key)
+        if cached is not None:
+            return cached
+        response = self._inner.chat(system_prompt, user_message, max_tokens, temperature, prefill)
+        self._backend.set(key, response)
+        return response
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        key = cache_key(self._model, system_prompt, user_message, max_tokens, temperature, prefill)
+        cached = self._backend.get(key)
+        if cached is not None:
+            return ReplayChatStream(cached)
+        inner = self._inner.chat_stream(
+            system_prompt, user_message, max_tokens, temperature, prefill
+        )
+        return _RecordingChatStream(inner, lambda response: self._backend.set(key, response))
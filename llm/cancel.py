@@ -0,0 +1,139 @@
+"""Cooperative cancellation and deadlines for LLM calls and agent runs.
+
+A :class:`CancelToken` is shared by all the work done for one request (a
+pipeline run, a batch topic, a speculative step). Cancelling it, or
+reaching its deadline, runs the callbacks registered with
+:meth:`CancelToken.on_cancel` on the cancelling thread. Streams use them to
+close their HTTP response right away instead of at the next chunk, so the
+provider stops generating (and billing) output.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+
+class Cancelled(Exception):
+    """Raised by work stopped through its :class:`CancelToken`.
+
+    ``partial`` is what was produced before the stop (an ``AgentResult``
+    when raised by an agent stream), or None.
+    """
+
+    def __init__(self, reason: str = "已取消", partial: Any = None) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+
+class CancelToken:
+    """A thread-safe cancellation flag with an optional deadline.
+
+    ``timeout`` (seconds from now; None or 0 for none) cancels the token
+    when it expires.
+    """
+
+    def __init__(self, timeout: float | None = None) -> None:
+        self.reason = ""
+        self.deadline: float | None = None
+        self._timeout = 0.0
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        if timeout:
+            self.cancel_after(timeout)
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(_deadline_reason(self))
+        return self._event.is_set()
+
+    def cancel_after(self, timeout: float) -> None:
+        """Cancel in ``timeout`` seconds, unless an earlier deadline is set."""
+        deadline = time.monotonic() + timeout
+        if self.deadline is not None and self.deadline <= deadline:
+            return
+        self.deadline = deadline
+        self._timeout = timeout
+        _schedule(deadline, self)
+
+    def cancel(self, reason: str = "已取消") -> None:
+        """Cancel (idempotent) and run the registered callbacks."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            # One failing close must not keep the others from running.
+            with contextlib.suppress(Exception):
+                callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call ``callback`` on cancellation (now, if already cancelled).
+
+        Returns a function that unregisters it; call that once the guarded
+        work is over so a later cancel doesn't touch it.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            with contextlib.suppress(ValueError):
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until cancelled or ``timeout`` elapses; return :attr:`cancelled`."""
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+def _deadline_reason(token: CancelToken) -> str:
+    return f"超过截止时间（{token._timeout:g} 秒）"
+
+
+# Every deadline is fired by one daemon thread rather than a timer per token.
+_deadlines: list[tuple[float, int, CancelToken]] = []
+_deadlines_cond = threading.Condition()
+_deadline_seq = itertools.count()
+_deadline_thread: threading.Thread | None = None
+
+
+def _schedule(deadline: float, token: CancelToken) -> None:
+    global _deadline_thread
+    with _deadlines_cond:
+        heapq.heappush(_deadlines, (deadline, next(_deadline_seq), token))
+        if _deadline_thread is None:
+            _deadline_thread = threading.Thread(
+                target=_fire_deadlines, name="cancel-deadlines", daemon=True
+            )
+            _deadline_thread.start()
+        _deadlines_cond.notify()
+
+
+def _fire_deadlines() -> None:
+    while True:
+        with _deadlines_cond:
+            while not _deadlines or _deadlines[0][0] > time.monotonic():
+                _deadlines_cond.wait(_deadlines[0][0] - time.monotonic() if _deadlines else None)
+            deadline, _, token = heapq.heappop(_deadlines)
+        # Superseded by an earlier deadline, or already cancelled: no-op.
+        if token.deadline == deadline:
+            token.cancel(_deadline_reason(token))
@@ -1,28 +1,267 @@
 from __future__ import annotations
 
-from config.settings import settings
-from llm.base import LLMClient
+import atexit
+import threading
+from typing import TYPE_CHECKING
 
+from config.settings import ModelConfig, settings
+from llm.base import AsyncLLMClient, LLMClient
 
-def create_llm_client() -> LLMClient:
-    """Create an LLM client based on the configured provider."""
-    provider = settings.LLM_PROVIDER.lower()
+if TYPE_CHECKING:
+    import httpx
+
+    from llm.failover import HedgePolicy
+    from llm.retry import RetryPolicy
+
+_shared_clients: dict[tuple[str, str, str, str], LLMClient] = {}
+_shared_http_client: httpx.Client | None = None
+_shared_lock = threading.Lock()
+
+
+def create_llm_client(
+    http_client: httpx.Client | None = None,
+    config: ModelConfig | None = None,
+) -> LLMClient:
+    """Create an LLM client for ``config`` (default: the global model settings).
+
+    The provider client is wrapped, innermost first, in the provider's
+    shared rate limits (:mod:`llm.rate_limit`), a failover / hedging client
+    over it and the ``LLM_FALLBACKS`` backends (:mod:`llm.failover`, only
+    with fallbacks or ``HEDGE_ENABLED``), the retry policy
+    (:mod:`llm.retry`) and, when ``RESPONSE_CACHE_ENABLED`` is set, an
+    on-disk response cache, so cache hits cost no budget. ``http_client``
+    overrides the provider SDK's own connection pool. With
+    ``METRICS_ENABLED`` the provider client itself is instrumented, so every
+    attempt that reaches the provider is measured and cache hits are not.
+    """
+    from llm.retry import RetryingLLMClient
+
+    config = config or settings.model_config()
+    backends = [_create_backend(http_client, c) for c in _backend_configs(config)]
+    if len(backends) == 1:
+        client = backends[0]
+    else:
+        from llm.failover import FailoverLLMClient
+
+        client = FailoverLLMClient(backends, _hedge_policy())
+    client = RetryingLLMClient(client, _retry_policy())
+    if settings.RESPONSE_CACHE_ENABLED:
+        from llm.cache import CachedLLMClient, SQLiteCacheBackend
+
+        backend = SQLiteCacheBackend(
+            settings.RESPONSE_CACHE_PATH,
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        )
+        client = CachedLLMClient(client, backend, model=config.model)
+    return client
+
+
+def _create_backend(http_client: httpx.Client | None, config: ModelConfig) -> LLMClient:
+    from llm.rate_limit import RateLimitedLLMClient, get_provider_limits
+
+    client = _create_provider_client(http_client, config)
+    if settings.METRICS_ENABLED:
+        from utils.metrics import InstrumentedLLMClient
+
+        client = InstrumentedLLMClient(client, model=config.model)
+    return RateLimitedLLMClient(
+        client,
+        get_provider_limits(config.provider.lower()),
+        max_overload_retries=settings.RATE_LIMIT_OVERLOAD_RETRIES,
+    )
+
+
+def _backend_configs(config: ModelConfig) -> list[ModelConfig]:
+    """``config`` followed by the ``LLM_FALLBACKS`` endpoints, in failover order.
+
+    Each fallback name is resolved like an agent key, from ``<NAME>_PROVIDER``
+    / ``_MODEL`` / ``_API_KEY`` / ``_BASE_URL``. With hedging on and no
+    fallbacks, the hedge is a second request to the same endpoint.
+    """
+    configs = [config]
+    configs += [
+        settings.model_config(name.strip())
+        for name in settings.LLM_FALLBACKS.split(",")
+        if name.strip()
+    ]
+    if settings.HEDGE_ENABLED and len(configs) == 1:
+        configs.append(config)
+    return configs
+
+
+def _hedge_policy() -> HedgePolicy | None:
+    from llm.failover import HedgePolicy
+
+    if not settings.HEDGE_ENABLED:
+        return None
+    return HedgePolicy(
+        percentile=settings.HEDGE_PERCENTILE,
+        min_delay=settings.HEDGE_MIN_DELAY,
+        initial_delay=settings.HEDGE_INITIAL_DELAY,
+    )
+
+
+def _retry_policy() -> RetryPolicy:
+    from llm.retry import RetryPolicy
+
+    return RetryPolicy(
+        max_attempts=settings.RETRY_MAX_ATTEMPTS,
+        base_delay=settings.RETRY_BASE_DELAY,
+        max_delay=settings.RETRY_MAX_DELAY,
+        deadline=settings.RETRY_DEADLINE_SECONDS,
+        resume_streams=settings.STREAM_RESUME_ENABLED,
+        # Every backend is rate limited, and that layer handles 429 / 529.
+        retry_overloads=False,
+    )
+
+
+def get_shared_llm_client(config: ModelConfig | None = None) -> LLMClient:
+    """Return the process-wide LLM client for ``config``, creating it on first use.
+
+    There is one client per endpoint (provider, model, key, base URL), all
+    on one pooled HTTP transport (see :mod:`llm.http_pool`). Clients are
+    safe to share across threads, so every Streamlit session and batch
+    worker reuses the same warm connections.
+    """
+    global _shared_http_client
+    config = config or settings.model_config()
+    with _shared_lock:
+        client = _shared_clients.get(config.endpoint)
+        if client is None:
+            if _shared_http_client is None:
+                from llm.http_pool import create_http_client
+
+                _shared_http_client = create_http_client()
+            client = create_llm_client(_shared_http_client, config)
+            _shared_clients[config.endpoint] = client
+        return client
+
+
+def get_agent_llm_client(agent_key: str) -> LLMClient:
+    """The shared client for an agent's configured model (see :meth:`Settings.model_config`)."""
+    return get_shared_llm_client(settings.model_config(agent_key))
+
+
+def close_shared_llm_client() -> None:
+    """Close the shared clients' connection pool; the next call recreates them."""
+    global _shared_http_client
+    with _shared_lock:
+        if _shared_http_client is not None:
+            _shared_http_client.close()
+        _shared_clients.clear()
+        _shared_http_client = None
+
+
+atexit.register(close_shared_llm_client)
+
+
+def _create_provider_client(http_client: httpx.Client | None, config: ModelConfig) -> LLMClient:
+    provider = config.provider.lower()
 
     if provider == "anthropic":
         from llm.anthropic_client import AnthropicClient
 
         return AnthropicClient(
-            api_key=settings.API_KEY,
-            model=settings.MODEL_NAME,
-            base_url=settings.BASE_URL,
+            api_key=config.api_key,
+            model=config.model,
+            base_url=config.base_url,
+            prompt_cache=settings.PROMPT_CACHE_ENABLED,
+            http_client=http_client,
         )
     elif provider == "openai_compat":
         from llm.openai_compat_client import OpenAICompatClient
 
         return OpenAICompatClient(
-            api_key=settings.API_KEY,
-            model=settings.MODEL_NAME,
-            base_url=settings.BASE_URL,
+            api_key=config.api_key,
+            model=config.model,
+            base_url=config.base_url,
+            http_client=http_client,
         )
+    elif provider == "fake":
+        from llm.fake_client import FakeLLMClient
+
+        return FakeLLMClient(**_fake_kwargs(config))
     else:
         raise ValueError(f"不支持的 LLM 提供商: {provider}")
+
+
+def _fake_kwargs(config: ModelConfig) -> dict:
+    return {
+        "model": config.model,
+        "tokens_per_second": settings.FAKE_LLM_TOKENS_PER_SECOND,
+        "first_token_delay": settings.FAKE_LLM_FIRST_TOKEN_DELAY,
+        "failure_rate": settings.FAKE_LLM_FAILURE_RATE,
+    }
+
+
+def create_async_llm_client(
+    http_client: httpx.AsyncClient | None = None,
+    config: ModelConfig | None = None,
+) -> AsyncLLMClient:
+    """Create an asyncio LLM client for ``config`` (default: the global model settings).
+
+    Shares the provider's rate limits with the sync clients and, with
+    ``METRICS_ENABLED``, instruments the provider client the same way.
+    """
+    from llm.retry import AsyncRetryingLLMClient
+
+    config = config or settings.model_config()
+    backends = [_create_async_backend(http_client, c) for c in _backend_configs(config)]
+    if len(backends) == 1:
+        client = backends[0]
+    else:
+        from llm.failover import AsyncFailoverLLMClient
+
+        client = AsyncFailoverLLMClient(backends, _hedge_policy())
+    return AsyncRetryingLLMClient(client, _retry_policy())
+
+
+def _create_async_backend(
+    http_client: httpx.AsyncClient | None, config: ModelConfig
+) -> AsyncLLMClient:
+    from llm.rate_limit import AsyncRateLimitedLLMClient, get_provider_limits
+
+    client = _create_async_provider_client(http_client, config)
+    if settings.METRICS_ENABLED:
+        from utils.metrics import AsyncInstrumentedLLMClient
+
+        client = AsyncInstrumentedLLMClient(client, model=config.model)
+    return AsyncRateLimitedLLMClient(
+        client,
+        get_provider_limits(config.provider.lower()),
+        max_overload_retries=settings.RATE_LIMIT_OVERLOAD_RETRIES,
+    )
+
+
+def _create_async_provider_client(
+    http_client: httpx.AsyncClient | None, config: ModelConfig
+) -> AsyncLLMClient:
+    provider = config.provider.lower()
+
+    if provider == "anthropic":
+        from llm.anthropic_client import AsyncAnthropicClient
+
+        return AsyncAnthropicClient(
+            api_key=config.api_key,
+            model=config.model,
+            base_url=config.base_url,
+            prompt_cache=settings.PROMPT_CACHE_ENABLED,
+            http_client=http_client,
+        )
+    elif provider == "openai_compat":
+        from llm.openai_compat_client import AsyncOpenAICompatClient
+
+        return AsyncOpenAICompatClient(
+            api_key=config.api_key,
+            model=config.model,
+            base_url=config.base_url,
+            http_client=http_client,
+        )
+    elif provider == "fake":
+        from llm.fake_client import AsyncFakeLLMClient
+
+        return AsyncFakeLLMClient(**_fake_kwargs(config))
+    else:
+        raise ValueError(f"提供商 {provider} 暂不支持异步客户端")
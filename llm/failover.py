@@ -0,0 +1,384 @@
+"""Ordered failover and hedged streams across several backends.
+
+A :class:`FailoverLLMClient` holds an ordered list of backends (different
+base URLs, providers or models). A call goes to the first one; if it fails
+before producing any text with an error another backend may not share
+(connection drops, timeouts, 5xx, overload, auth / unknown model), the
+next backend is tried.
+
+With a :class:`HedgePolicy`, a stream whose first token hasn't arrived
+within the recent p95 time to first token gets a duplicate request on the
+next backend. Whichever stream produces text first wins and the others are
+closed, so one slow backend no longer sets the tail latency. Failures after
+the first chunk are raised; the retry layer above resumes them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator, Sequence
+from dataclasses import dataclass
+
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.retry import is_retryable
+from llm.tokens import estimate_tokens
+from utils import metrics
+
+# Errors that another endpoint may not share: a bad key, or a model the
+# endpoint doesn't serve.
+_FAILOVER_STATUS_CODES = frozenset({401, 403, 404})
+
+
+def should_fail_over(exc: BaseException) -> bool:
+    """Whether a call that failed with ``exc`` is worth sending to another backend."""
+    return is_retryable(exc) or getattr(exc, "status_code", None) in _FAILOVER_STATUS_CODES
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    percentile: float = 95.0
+    min_delay: float = 1.0  # never hedge sooner than this (seconds)
+    initial_delay: float = 0.0  # used until min_samples are seen; 0 = don't hedge yet
+    window: int = 200
+    min_samples: int = 20
+
+
+class FirstTokenLatency:
+    """Rolling window of time-to-first-token samples; thread-safe."""
+
+    def __init__(self, policy: HedgePolicy) -> None:
+        self._policy = policy
+        self._samples: deque[float] = deque(maxlen=policy.window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait for a first token before hedging, or None to not hedge."""
+        with self._lock:
+            samples = sorted(self._samples)
+        policy = self._policy
+        if len(samples) < policy.min_samples:
+            return max(policy.min_delay, policy.initial_delay) if policy.initial_delay else None
+        index = min(len(samples) - 1, int(round(policy.percentile / 100 * (len(samples) - 1))))
+        return max(policy.min_delay, samples[index])
+
+
+def _charge_abandoned(response: LLMResponse, abandoned: int, args: tuple) -> LLMResponse:
+    """Add the estimated prompt of ``abandoned`` failed or cancelled attempts."""
+    if not abandoned:
+        return response
+    # Those attempts report no usage; their prompt is counted as billed.
+    system_prompt, user_message, _, _, prefill = args
+    cost = estimate_tokens(system_prompt) + estimate_tokens(user_message) + estimate_tokens(prefill)
+    return dataclasses.replace(response, input_tokens=response.input_tokens + abandoned * cost)
+
+
+class FailoverLLMClient(LLMClient):
+    """Sends each call to the first healthy backend, optionally hedging streams."""
+
+    def __init__(self, backends: Sequence[LLMClient], hedge: HedgePolicy | None = None) -> None:
+        if not backends:
+            raise ValueError("至少需要一个 LLM 后端")
+        self._backends = list(backends)
+        self._latency = FirstTokenLatency(hedge) if hedge is not None else None
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        args = (system_prompt, user_message, max_tokens, temperature, prefill)
+        for i, backend in enumerate(self._backends):
+            try:
+                response = backend.chat(*args)
+            except Exception as e:
+                if i + 1 == len(self._backends) or not should_fail_over(e):
+                    raise
+                metrics.backend_failed_over(e)
+                continue
+            return _charge_abandoned(response, i, args)
+        raise AssertionError("unreachable")
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        return _FailoverChatStream(
+            self._backends,
+            self._latency,
+            (system_prompt, user_message, max_tokens, temperature, prefill),
+        )
+
+
+class _Leg:
+    """One backend attempt of a stream, consumed on its own thread.
+
+    Events ``(leg, text, error)`` go to the shared queue; ``text=None`` and
+    ``error=None`` means the stream completed.
+    """
+
+    def __init__(self, stream: ChatStream, events: queue.Queue, hedge: bool) -> None:
+        self.stream = stream
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.finished = False
+        self._events = events
+        self._cancelled = threading.Event()
+        threading.Thread(target=self._run, name="llm-hedge", daemon=True).start()
+
+    def cancel(self) -> None:
+        """Stop now, closing the stream's connection."""
+        if not self._cancelled.is_set():
+            self._cancelled.set()
+            self.stream.close()
+
+    def _run(self) -> None:
+        it = iter(self.stream)
+        try:
+            for text in it:
+                if self._cancelled.is_set():
+                    return
+                self._events.put((self, text, None))
+            self._events.put((self, None, None))
+        except Exception as e:
+            if not self._cancelled.is_set():
+                self._events.put((self, None, e))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+
+class _FailoverChatStream(ChatStream):
+    def __init__(
+        self,
+        backends: list[LLMClient],
+        latency: FirstTokenLatency | None,
+        args: tuple,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._backends = backends
+        self._latency = latency
+        self._args = args
+        self._events: queue.Queue = queue.Queue()
+        self._legs: list[_Leg] = []
+        self._closed = threading.Event()
+
+    def close(self) -> None:
+        self._closed.set()
+        for leg in list(self._legs):
+            leg.cancel()
+        self._events.put((None, None, Cancelled()))
+
+    def __iter__(self) -> Iterator[str]:
+        events = self._events
+        legs = self._legs
+        winner: _Leg | None = None
+
+        def launch(hedge: bool = False) -> None:
+            if self._closed.is_set():
+                raise Cancelled()
+            stream = self._backends[len(legs)].chat_stream(*self._args)
+            legs.append(_Leg(stream, events, hedge))
+
+        launch()
+        try:
+            while True:
+                timeout = None
+                if winner is None and self._latency is not None and len(legs) < len(self._backends):
+                    delay = self._latency.hedge_delay()
+                    if delay is not None:
+                        timeout = max(0.0, legs[-1].started + delay - time.monotonic())
+                try:
+                    leg, text, error = events.get(timeout=timeout)
+                except queue.Empty:
+                    metrics.hedge_started()
+                    launch(hedge=True)
+                    continue
+                if self._closed.is_set():
+                    raise Cancelled()
+                if winner is not None and leg is not winner:
+                    continue
+                if error is not None:
+                    if leg is winner:
+                        raise error
+                    leg.finished = True
+                    if not should_fail_over(error):
+                        raise error
+                    if len(legs) < len(self._backends):
+                        metrics.backend_failed_over(error)
+                        launch()
+                    elif all(other.finished for other in legs):
+                        raise error
+                    continue
+                if winner is None:
+                    winner = leg
+                    if self._latency is not None:
+                        self._latency.observe(time.monotonic() - leg.started)
+                    if leg.hedge:
+                        metrics.hedge_won()
+                    for other in legs:
+                        if other is not leg:
+                            other.cancel()
+                if text is None:
+                    self.response = _charge_abandoned(
+                        winner.stream.response, len(legs) - 1, self._args
+                    )
+                    return
+                yield text
+        finally:
+            # Also reached when the consumer stops early.
+            for leg in legs:
+                leg.cancel()
+
+
+class AsyncFailoverLLMClient(AsyncLLMClient):
+    """Asyncio version of :class:`FailoverLLMClient`; legs are tasks."""
+
+    def __init__(
+        self, backends: Sequence[AsyncLLMClient], hedge: HedgePolicy | None = None
+    ) -> None:
+        if not backends:
+            raise ValueError("至少需要一个 LLM 后端")
+        self._backends = list(backends)
+        self._latency = FirstTokenLatency(hedge) if hedge is not None else None
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        args = (system_prompt, user_message, max_tokens, temperature, prefill)
+        for i, backend in enumerate(self._backends):
+            try:
+                response = await backend.achat(*args)
+            except Exception as e:
+                if i + 1 == len(self._backends) or not should_fail_over(e):
+                    raise
+                metrics.backend_failed_over(e)
+                continue
+            return _charge_abandoned(response, i, args)
+        raise AssertionError("unreachable")
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        return _AsyncFailoverChatStream(
+            self._backends,
+            self._latency,
+            (system_prompt, user_message, max_tokens, temperature, prefill),
+        )
+
+
+class _AsyncLeg:
+    def __init__(self, stream: AsyncChatStream, events: asyncio.Queue, hedge: bool) -> None:
+        self.stream = stream
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.finished = False
+        self._events = events
+        self._task = asyncio.ensure_future(self._run())
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+    async def _run(self) -> None:
+        try:
+            async for text in self.stream:
+                self._events.put_nowait((self, text, None))
+            self._events.put_nowait((self, None, None))
+        except Exception as e:
+            self._events.put_nowait((self, None, e))
+
+
+class _AsyncFailoverChatStream(AsyncChatStream):
+    def __init__(
+        self,
+        backends: list[AsyncLLMClient],
+        latency: FirstTokenLatency | None,
+        args: tuple,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._backends = backends
+        self._latency = latency
+        self._args = args
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        events: asyncio.Queue = asyncio.Queue()
+        legs: list[_AsyncLeg] = []
+        winner: _AsyncLeg | None = None
+
+        def launch(hedge: bool = False) -> None:
+            stream = self._backends[len(legs)].achat_stream(*self._args)
+            legs.append(_AsyncLeg(stream, events, hedge))
+
+        launch()
+        try:
+            while True:
+                timeout = None
+                if winner is None and self._latency is not None and len(legs) < len(self._backends):
+                    delay = self._latency.hedge_delay()
+                    if delay is not None:
+                        timeout = max(0.0, legs[-1].started + delay - time.monotonic())
+                try:
+                    leg, text, error = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    metrics.hedge_started()
+                    launch(hedge=True)
+                    continue
+                if winner is not None and leg is not winner:
+                    continue
+                if error is not None:
+                    if leg is winner:
+                        raise error
+                    leg.finished = True
+                    if not should_fail_over(error):
+                        raise error
+                    if len(legs) < len(self._backends):
+                        metrics.backend_failed_over(error)
+                        launch()
+                    elif all(other.finished for other in legs):
+                        raise error
+                    continue
+                if winner is None:
+                    winner = leg
+                    if self._latency is not None:
+                        self._latency.observe(time.monotonic() - leg.started)
+                    if leg.hedge:
+                        metrics.hedge_won()
+                    for other in legs:
+                        if other is not leg:
+                            other.cancel()
+                if text is None:
+                    self.response = _charge_abandoned(
+                        winner.stream.response, len(legs) - 1, self._args
+                    )
+                    return
+                yield text
+        finally:
+            for leg in legs:
+                leg.cancel()
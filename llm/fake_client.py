@@ -0,0 +1,309 @@
+"""Deterministic offline LLM backend for benchmarks and local development.
+
+:class:`FakeLLMClient` needs no network or API key. It streams Markdown at
+a configurable token rate after a configurable first-token delay, and can
+fail a fraction of calls (before or midway through the stream) to exercise
+the retry and resume paths.
+
+By default the reply is synthesized from the output template in the
+agent's system prompt (the first fenced block), with every ``[...]``
+placeholder filled by filler text, so downstream agents and parsers see
+realistically shaped input. The same request always yields the same text.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.tokens import estimate_tokens
+
+_TEMPLATE_RE = re.compile(r"```[^\n]*\n(.*?)```", re.S)
+_PLACEHOLDER_RE = re.compile(r"\[[^\]\n]+\]")
+_FILLER = (
+    "意识上传", "奇点", "算力", "对齐", "递归自我改进", "图灵测试", "涌现", "熵",
+    "硅基生命", "赛博格", "元宇宙", "后人类", "数字永生", "心智克隆", "自由意志",
+)
+_CHUNK_CHARS = 8
+
+
+class FakeLLMError(ConnectionError):
+    """Injected failure; a ``ConnectionError`` so the retry layer handles it."""
+
+
+def synthesize_markdown(system_prompt: str, user_message: str, seed: int = 0) -> str:
+    """Deterministic Markdown shaped like the prompt's output template."""
+    digest = hashlib.sha256(f"{seed}\0{system_prompt}\0{user_message}".encode("utf-8")).digest()
+    rng = random.Random(digest)
+
+    def filler(_match: re.Match | None = None) -> str:
+        words = rng.choices(_FILLER, k=rng.randint(3, 8))
+        return "与".join(words[:2]) + "：" + "，".join(words[2:]) + "。"
+
+    match = _TEMPLATE_RE.search(system_prompt)
+    if match:
+        return _PLACEHOLDER_RE.sub(filler, match.group(1)).strip() + "\n"
+    sections = []
+    for i in range(1, 4):
+        sections.append(f"## 第 {i} 节\n\n" + "\n".join(f"- {filler()}" for _ in range(3)))
+    return "# 模拟输出\n\n" + "\n\n".join(sections) + "\n"
+
+
+class _Behaviour:
+    """Timing and failure settings shared by the sync and async clients."""
+
+    def __init__(
+        self,
+        model: str,
+        tokens_per_second: float,
+        first_token_delay: float,
+        failure_rate: float,
+        seed: int,
+        response: str | Callable[[str, str], str] | None,
+    ) -> None:
+        self.model = model
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self._response = response
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def content(self, system_prompt: str, user_message: str, prefill: str, max_tokens: int) -> str:
+        if callable(self._response):
+            text = self._response(system_prompt, user_message)
+        elif self._response is not None:
+            text = self._response
+        else:
+            text = synthesize_markdown(system_prompt, user_message, self.seed)
+        # A prefilled request continues an earlier partial reply.
+        if prefill and text.startswith(prefill):
+            text = text[len(prefill):]
+        return _truncate(text, max_tokens)
+
+    def failure_point(self, text: str) -> int | None:
+        """Character offset at which this call fails, or None if it succeeds."""
+        with self._rng_lock:
+            if self._rng.random() >= self.failure_rate:
+                return None
+            # Half the failures happen before any output, half mid-stream.
+            return 0 if self._rng.random() < 0.5 else self._rng.randrange(len(text) or 1)
+
+    def chunk_delay(self, chunk: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return estimate_tokens(chunk) / self.tokens_per_second
+
+    def response(self, system_prompt: str, user_message: str, prefill: str, text: str) -> LLMResponse:
+        return LLMResponse(
+            content=text,
+            model=self.model,
+            input_tokens=(
+                estimate_tokens(system_prompt) + estimate_tokens(user_message) + estimate_tokens(prefill)
+            ),
+            output_tokens=estimate_tokens(text),
+        )
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def _sleep(seconds: float) -> None:
+    # time.sleep(0) is still a syscall per chunk, which would dominate
+    # benchmarks run at an "instant" token rate.
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def _chunks(text: str) -> Iterator[str]:
+    for i in range(0, len(text), _CHUNK_CHARS):
+        yield text[i:i + _CHUNK_CHARS]
+
+
+class FakeLLMClient(LLMClient):
+    """Offline :class:`LLMClient` with simulated latency and failures.
+
+    ``response`` overrides the synthesized reply with fixed text or a
+    ``(system_prompt, user_message) -> str`` callable. A
+    ``tokens_per_second`` of 0 streams instantly.
+    """
+
+    def __init__(
+        self,
+        model: str = "fake",
+        tokens_per_second: float = 200.0,
+        first_token_delay: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        response: str | Callable[[str, str], str] | None = None,
+    ) -> None:
+        self._behaviour = _Behaviour(
+            model, tokens_per_second, first_token_delay, failure_rate, seed, response
+        )
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        b = self._behaviour
+        text = b.content(system_prompt, user_message, prefill, max_tokens)
+        fail_at = b.failure_point(text)
+        # One sleep for the whole reply; chunked sleeps only matter when streaming.
+        partial = text if fail_at is None else text[:fail_at]
+        _sleep(b.first_token_delay + b.chunk_delay(partial))
+        if fail_at is not None:
+            raise FakeLLMError("模拟的连接中断")
+        return b.response(system_prompt, user_message, prefill, text)
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        return FakeChatStream(self._behaviour, system_prompt, user_message, max_tokens, prefill)
+
+
+class FakeChatStream(ChatStream):
+    def __init__(
+        self,
+        behaviour: _Behaviour,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._behaviour = behaviour
+        self._system_prompt = system_prompt
+        self._user_message = user_message
+        self._max_tokens = max_tokens
+        self._prefill = prefill
+        self._closed = threading.Event()
+
+    def _pause(self, seconds: float) -> None:
+        # Like a blocked socket read, a close interrupts the wait.
+        if seconds > 0:
+            self._closed.wait(seconds)
+        if self._closed.is_set():
+            raise Cancelled()
+
+    def __iter__(self) -> Iterator[str]:
+        b = self._behaviour
+        text = b.content(self._system_prompt, self._user_message, self._prefill, self._max_tokens)
+        fail_at = b.failure_point(text)
+        self._pause(b.first_token_delay)
+        sent = 0
+        for chunk in _chunks(text):
+            if fail_at is not None and sent + len(chunk) > fail_at:
+                raise FakeLLMError("模拟的连接中断")
+            self._pause(b.chunk_delay(chunk))
+            sent += len(chunk)
+            yield chunk
+        if fail_at is not None:
+            raise FakeLLMError("模拟的连接中断")
+        self.response = b.response(self._system_prompt, self._user_message, self._prefill, text)
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+class AsyncFakeLLMClient(AsyncLLMClient):
+    """Asyncio version of :class:`FakeLLMClient`."""
+
+    def __init__(
+        self,
+        model: str = "fake",
+        tokens_per_second: float = 200.0,
+        first_token_delay: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        response: str | Callable[[str, str], str] | None = None,
+    ) -> None:
+        self._behaviour = _Behaviour(
+            model, tokens_per_second, first_token_delay, failure_rate, seed, response
+        )
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        b = self._behaviour
+        text = b.content(system_prompt, user_message, prefill, max_tokens)
+        fail_at = b.failure_point(text)
+        partial = text if fail_at is None else text[:fail_at]
+        await asyncio.sleep(b.first_token_delay + b.chunk_delay(partial))
+        if fail_at is not None:
+            raise FakeLLMError("模拟的连接中断")
+        return b.response(system_prompt, user_message, prefill, text)
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        return AsyncFakeChatStream(self._behaviour, system_prompt, user_message, max_tokens, prefill)
+
+
+class AsyncFakeChatStream(AsyncChatStream):
+    def __init__(
+        self,
+        behaviour: _Behaviour,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._behaviour = behaviour
+        self._system_prompt = system_prompt
+        self._user_message = user_message
+        self._max_tokens = max_tokens
+        self._prefill = prefill
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        b = self._behaviour
+        text = b.content(self._system_prompt, self._user_message, self._prefill, self._max_tokens)
+        fail_at = b.failure_point(text)
+        await asyncio.sleep(b.first_token_delay)
+        sent = 0
+        for chunk in _chunks(text):
+            if fail_at is not None and sent + len(chunk) > fail_at:
+                raise FakeLLMError("模拟的连接中断")
+            await asyncio.sleep(b.chunk_delay(chunk))
+            sent += len(chunk)
+            yield chunk
+        if fail_at is not None:
+            raise FakeLLMError("模拟的连接中断")
+        self.response = b.response(self._system_prompt, self._user_message, self._prefill, text)
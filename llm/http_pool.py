@@ -0,0 +1,62 @@
+"""Pooled HTTP transport shared by provider clients.
+
+One ``httpx.Client`` keeps warm keep-alive (and, when the optional ``h2``
+package is installed, HTTP/2) connections to the provider, so clients built
+on it skip the TCP/TLS handshake on every request.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import importlib.util
+import socket
+
+import httpx
+
+from config.settings import settings
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _pool_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "http2": settings.HTTP2_ENABLED and http2_available(),
+        "timeout": httpx.Timeout(settings.HTTP_TIMEOUT, connect=10.0),
+    }
+
+
+def create_http_client() -> httpx.Client:
+    """Create a pooled sync HTTP client configured from settings."""
+    return httpx.Client(**_pool_options())
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """Create a pooled async HTTP client configured from settings."""
+    return httpx.AsyncClient(**_pool_options())
+
+
+def abort_response(response: httpx.Response) -> None:
+    """Tear down a streaming ``response`` from another thread.
+
+    Closing a socket doesn't wake a thread blocked reading it, but shutting
+    it down does, and tells the server the client is gone so it stops
+    generating. An HTTP/2 connection is shared with other streams, so only
+    this stream is closed there.
+    """
+    network_stream = response.extensions.get("network_stream")
+    sock = None
+    if network_stream is not None and response.http_version != "HTTP/2":
+        sock = network_stream.get_extra_info("socket")
+    if sock is None:
+        response.close()
+        return
+    with contextlib.suppress(OSError):
+        # The plain-socket method, so a TLS socket isn't unwrapped under the reader.
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
@@ -1,22 +1,358 @@
+"""Client for OpenAI-compatible Chat Completions servers.
+
+Talks plain HTTP to ``{base_url}/chat/completions``, so it works with the
+OpenAI API as well as self-hosted vLLM / llama.cpp / Ollama servers, over
+the shared pooled transport (see :mod:`llm.http_pool`). Streaming uses
+server-sent events; usage is taken from the final chunk
+(``stream_options.include_usage``) and estimated locally if the server
+doesn't report it.
+"""
+
 from __future__ import annotations
 
-from llm.base import LLMClient, LLMResponse
+import json
+import threading
+from collections.abc import AsyncIterator, Iterator
+from urllib.parse import urlsplit
 
+import httpx
 
-class OpenAICompatClient(LLMClient):
-    """Placeholder for future OpenAI-compatible API support."""
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.http_pool import abort_response, create_async_http_client, create_http_client
+from llm.tokens import estimate_tokens
 
-    def __init__(self, api_key: str, model: str, base_url: str = "") -> None:
-        self._model = model
-        raise NotImplementedError(
-            "OpenAI 兼容客户端尚未实现。请使用 LLM_PROVIDER=anthropic。"
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class OpenAICompatError(Exception):
+    """An error response from the server.
+
+    Carries ``status_code`` and ``response`` so the retry and rate-limit
+    layers classify it like the provider SDKs' errors (429 → overload,
+    5xx → retryable, ``retry-after`` honoured).
+    """
+
+    def __init__(self, status_code: int, message: str, response: httpx.Response | None = None) -> None:
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.response = response
+
+
+class IncompleteStreamError(ConnectionError):
+    """The server closed an event stream before ``[DONE]`` or a finish reason.
+
+    A :class:`ConnectionError`, so the retry layer resumes the stream rather
+    than returning (and the cache storing) the truncated text.
+    """
+
+
+def _endpoint(base_url: str) -> str:
+    return (base_url or DEFAULT_BASE_URL).rstrip("/") + "/chat/completions"
+
+
+def _is_openai(base_url: str) -> bool:
+    """Whether ``base_url`` is the OpenAI API rather than a self-hosted server."""
+    host = urlsplit(base_url or DEFAULT_BASE_URL).hostname or ""
+    return host == "api.openai.com" or host.endswith(".openai.com")
+
+
+def _headers(api_key: str) -> dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def _payload(
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int,
+    temperature: float,
+    prefill: str,
+    stream: bool,
+    continue_prefill: bool = True,
+) -> dict:
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message},
+    ]
+    payload: dict = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": stream,
+    }
+    if prefill:
+        # Continue the assistant turn instead of starting a new one (vLLM;
+        # llama.cpp does this for a trailing assistant message by default).
+        # The OpenAI API rejects these vLLM-only fields.
+        messages.append({"role": "assistant", "content": prefill})
+        if continue_prefill:
+            payload["continue_final_message"] = True
+            payload["add_generation_prompt"] = False
+    if stream:
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def _error_message(body: str) -> str:
+    try:
+        error = json.loads(body).get("error", body)
+    except (ValueError, AttributeError):
+        return body[:500]
+    if isinstance(error, dict):
+        return str(error.get("message", error))
+    return str(error)[:500]
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    if response.status_code >= 400:
+        raise OpenAICompatError(response.status_code, _error_message(response.text), response)
+
+
+def _to_llm_response(data: dict, model: str) -> LLMResponse:
+    choices = data.get("choices") or [{}]
+    content = (choices[0].get("message") or {}).get("content") or ""
+    usage = data.get("usage") or {}
+    return LLMResponse(
+        content=content,
+        model=data.get("model") or model,
+        input_tokens=usage.get("prompt_tokens", 0),
+        output_tokens=usage.get("completion_tokens", 0),
+        cache_read_input_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+    )
+
+
+class _SSEAccumulator:
+    """Parses ``data:`` lines of a Chat Completions event stream."""
+
+    def __init__(self, model: str, system_prompt: str, user_message: str) -> None:
+        self.model = model
+        self.done = False
+        self.finish_reason: str | None = None
+        self._parts: list[str] = []
+        self._usage: dict | None = None
+        self._prompt = system_prompt + user_message
+
+    def feed(self, line: str) -> str:
+        """Consume one line; return the text delta it carries ("" if none)."""
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if data == "[DONE]":
+            self.done = True
+            return ""
+        event = json.loads(data)
+        if "error" in event:
+            error = event["error"]
+            status = error.get("code") if isinstance(error, dict) else None
+            raise OpenAICompatError(
+                status if isinstance(status, int) else 500, _error_message(data)
+            )
+        self.model = event.get("model") or self.model
+        if event.get("usage"):
+            self._usage = event["usage"]
+        text = ""
+        for choice in event.get("choices") or ():
+            text += (choice.get("delta") or {}).get("content") or ""
+            self.finish_reason = choice.get("finish_reason") or self.finish_reason
+        if text:
+            self._parts.append(text)
+        return text
+
+    def check_complete(self) -> None:
+        """Raise if the stream ended without ``[DONE]`` or a finish reason."""
+        if not self.done and self.finish_reason is None:
+            raise IncompleteStreamError("流式响应在完成前被服务端关闭")
+
+    def response(self) -> LLMResponse:
+        content = "".join(self._parts)
+        usage = self._usage or {
+            # Server didn't report usage; fall back to an estimate.
+            "prompt_tokens": estimate_tokens(self._prompt),
+            "completion_tokens": estimate_tokens(content),
+        }
+        return _to_llm_response(
+            {"model": self.model, "usage": usage, "choices": [{"message": {"content": content}}]},
+            self.model,
         )
 
+
+class OpenAICompatChatStream(ChatStream):
+    def __init__(self, client: httpx.Client, url: str, headers: dict, payload: dict) -> None:
+        self.response: LLMResponse | None = None
+        self._client = client
+        self._url = url
+        self._headers = headers
+        self._payload = payload
+        self._response: httpx.Response | None = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def _attach(self, response: httpx.Response | None) -> None:
+        with self._lock:
+            if response is not None and self._closed.is_set():
+                raise Cancelled()
+            self._response = response
+
+    def __iter__(self) -> Iterator[str]:
+        acc = _SSEAccumulator(
+            self._payload["model"],
+            self._payload["messages"][0]["content"],
+            self._payload["messages"][1]["content"],
+        )
+        if self._closed.is_set():
+            raise Cancelled()
+        try:
+            with self._client.stream(
+                "POST", self._url, headers=self._headers, json=self._payload
+            ) as r:
+                self._attach(r)
+                try:
+                    if r.status_code >= 400:
+                        r.read()
+                        _raise_for_status(r)
+                    for line in r.iter_lines():
+                        text = acc.feed(line)
+                        if text:
+                            yield text
+                        if acc.done:
+                            break
+                    acc.check_complete()
+                finally:
+                    # Before the connection goes back to the pool.
+                    self._attach(None)
+        except Exception as e:
+            if self._closed.is_set() and not isinstance(e, Cancelled):
+                raise Cancelled() from e
+            raise
+        self.response = acc.response()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed.set()
+            if self._response is not None:
+                abort_response(self._response)
+
+
+class OpenAICompatClient(LLMClient):
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = "",
+        http_client: httpx.Client | None = None,
+    ) -> None:
+        self._model = model
+        self._url = _endpoint(base_url)
+        self._headers = _headers(api_key)
+        self._continue_prefill = not _is_openai(base_url)
+        self._client = http_client or create_http_client()
+
     def chat(
         self,
         system_prompt: str,
         user_message: str,
         max_tokens: int = 4096,
         temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        payload = _payload(
+            self._model, system_prompt, user_message, max_tokens, temperature, prefill,
+            stream=False, continue_prefill=self._continue_prefill,
+        )
+        response = self._client.post(self._url, headers=self._headers, json=payload)
+        _raise_for_status(response)
+        return _to_llm_response(response.json(), self._model)
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> OpenAICompatChatStream:
+        payload = _payload(
+            self._model, system_prompt, user_message, max_tokens, temperature, prefill,
+            stream=True, continue_prefill=self._continue_prefill,
+        )
+        return OpenAICompatChatStream(self._client, self._url, self._headers, payload)
+
+
+class AsyncOpenAICompatChatStream(AsyncChatStream):
+    def __init__(self, client: httpx.AsyncClient, url: str, headers: dict, payload: dict) -> None:
+        self.response: LLMResponse | None = None
+        self._client = client
+        self._url = url
+        self._headers = headers
+        self._payload = payload
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        acc = _SSEAccumulator(
+            self._payload["model"],
+            self._payload["messages"][0]["content"],
+            self._payload["messages"][1]["content"],
+        )
+        async with self._client.stream(
+            "POST", self._url, headers=self._headers, json=self._payload
+        ) as r:
+            if r.status_code >= 400:
+                await r.aread()
+                _raise_for_status(r)
+            async for line in r.aiter_lines():
+                text = acc.feed(line)
+                if text:
+                    yield text
+                if acc.done:
+                    break
+            acc.check_complete()
+        self.response = acc.response()
+
+
+class AsyncOpenAICompatClient(AsyncLLMClient):
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = "",
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self._model = model
+        self._url = _endpoint(base_url)
+        self._headers = _headers(api_key)
+        self._continue_prefill = not _is_openai(base_url)
+        self._client = http_client or create_async_http_client()
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
     ) -> LLMResponse:
-        raise NotImplementedError
+        payload = _payload(
+            self._model, system_prompt, user_message, max_tokens, temperature, prefill,
+            stream=False, continue_prefill=self._continue_prefill,
+        )
+        response = await self._client.post(self._url, headers=self._headers, json=payload)
+        _raise_for_status(response)
+        return _to_llm_response(response.json(), self._model)
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncOpenAICompatChatStream:
+        payload = _payload(
+            self._model, system_prompt, user_message, max_tokens, temperature, prefill,
+            stream=True, continue_prefill=self._continue_prefill,
+        )
+        return AsyncOpenAICompatChatStream(self._client, self._url, self._headers, payload)
@@ -0,0 +1,525 @@
+"""Client-side rate limiting and adaptive concurrency for LLM calls.
+
+Two mechanisms keep sustained throughput just under the provider's limits:
+
+- :class:`RateLimiter` enforces requests-per-minute and tokens-per-minute
+  budgets with token buckets. A call is charged its estimated input tokens
+  plus ``max_tokens``.
+- :class:`AIMDController` caps in-flight calls and adapts the cap
+  (additive increase while healthy, multiplicative decrease on 429 /
+  overloaded responses), like TCP congestion control.
+
+Limits are shared per provider, so every client for a provider in the
+process draws from the same budget.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import weakref
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass, field
+
+from config.settings import settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.timing import bound_recorder
+from llm.tokens import estimate_tokens
+
+_OVERLOAD_STATUS_CODES = (429, 529)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """Whether ``exc`` is a provider rate-limit / overloaded response."""
+    if getattr(exc, "status_code", None) in _OVERLOAD_STATUS_CODES:
+        return True
+    name = type(exc).__name__
+    return "RateLimit" in name or "Overloaded" in name
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """The provider's ``retry-after`` hint from an error response, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket. A rate of 0 means unlimited.
+
+    The bucket holds up to ``burst_seconds`` worth of budget, so idle time
+    allows a short burst without exceeding the per-minute average.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 6.0) -> None:
+        self._lock = threading.Lock()
+        self.configure(per_minute, burst_seconds)
+
+    def configure(self, per_minute: float, burst_seconds: float = 6.0) -> None:
+        with self._lock:
+            self._rate = per_minute / 60.0
+            self._capacity = max(1.0, self._rate * burst_seconds)
+            self._tokens = self._capacity
+            self._updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` now, going into debt if needed; return the wait time.
+
+        Requests larger than the capacity are allowed but pay for the excess
+        in waiting time, so large calls are never starved.
+        """
+        with self._lock:
+            if not self._rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets for one provider."""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0) -> None:
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute, burst_seconds=10.0)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ) -> None:
+        if requests_per_minute is not None:
+            self._requests.configure(requests_per_minute)
+        if tokens_per_minute is not None:
+            self._tokens.configure(tokens_per_minute, burst_seconds=10.0)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all new calls for ``seconds`` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            pause = max(0.0, self._paused_until - time.monotonic())
+        return max(pause, self._requests.reserve(1), self._tokens.reserve(tokens))
+
+    def acquire(self, tokens: int, closed: threading.Event | None = None) -> float:
+        """Block until a call costing ``tokens`` may start; return the wait.
+
+        Setting ``closed`` ends the wait early with :class:`Cancelled`.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            if closed is None:
+                time.sleep(delay)
+            elif closed.wait(delay):
+                raise Cancelled()
+        return delay
+
+    async def aacquire(self, tokens: int) -> float:
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease concurrency limit.
+
+    ``max_limit`` of 0 disables the controller (unbounded concurrency).
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 0,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self._limit = float(max(self.min_limit, min(initial, max_limit or initial)))
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_limit > 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def on_success(self) -> None:
+        # +1 per window of `limit` successes, i.e. +1/limit per success.
+        if not self.enabled:
+            return
+        with self._lock:
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+
+    def on_overload(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            # Calls already in flight when the limit was hit will report
+            # overloads too; only cut once per burst.
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+
+
+class ConcurrencyGate:
+    """Blocking gate admitting at most ``controller.limit`` calls at once."""
+
+    def __init__(self, controller: AIMDController) -> None:
+        self._controller = controller
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, closed: threading.Event | None = None) -> None:
+        """Take a slot; setting ``closed`` (then :meth:`wake`) gives up with :class:`Cancelled`."""
+        if not self._controller.enabled:
+            return
+        with self._cond:
+            while self._in_flight >= self._controller.limit:
+                if closed is not None and closed.is_set():
+                    raise Cancelled()
+                self._cond.wait()
+            self._in_flight += 1
+
+    def wake(self) -> None:
+        """Wake every waiter, so one whose call was closed can give up."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def release(self) -> None:
+        if not self._controller.enabled:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+class AsyncConcurrencyGate:
+    """Asyncio version of :class:`ConcurrencyGate` (one per event loop).
+
+    Get it from :meth:`ProviderLimits.async_gate` so every async client of
+    a provider on a loop shares it.
+    """
+
+    def __init__(self, controller: AIMDController) -> None:
+        self._controller = controller
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        if not self._controller.enabled:
+            return
+        async with self._cond:
+            while self._in_flight >= self._controller.limit:
+                await self._cond.wait()
+            self._in_flight += 1
+
+    async def release(self) -> None:
+        if not self._controller.enabled:
+            return
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+@dataclass
+class ProviderLimits:
+    limiter: RateLimiter
+    controller: AIMDController
+    gate: ConcurrencyGate
+    _async_gates: weakref.WeakKeyDictionary = field(
+        default_factory=weakref.WeakKeyDictionary, repr=False
+    )
+
+    def async_gate(self) -> AsyncConcurrencyGate:
+        """The provider's gate for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with _provider_limits_lock:
+            gate = self._async_gates.get(loop)
+            if gate is None:
+                gate = self._async_gates[loop] = AsyncConcurrencyGate(self.controller)
+        return gate
+
+
+_provider_limits: dict[str, ProviderLimits] = {}
+_provider_limits_lock = threading.Lock()
+
+
+def get_provider_limits(provider: str) -> ProviderLimits:
+    """Return the process-wide limits for ``provider``, created from settings."""
+    with _provider_limits_lock:
+        limits = _provider_limits.get(provider)
+        if limits is None:
+            controller = AIMDController(
+                initial=settings.CONCURRENCY_INITIAL,
+                min_limit=settings.CONCURRENCY_MIN,
+                max_limit=settings.CONCURRENCY_MAX,
+            )
+            limits = ProviderLimits(
+                limiter=RateLimiter(
+                    settings.RATE_LIMIT_REQUESTS_PER_MINUTE,
+                    settings.RATE_LIMIT_TOKENS_PER_MINUTE,
+                ),
+                controller=controller,
+                gate=ConcurrencyGate(controller),
+            )
+            _provider_limits[provider] = limits
+        return limits
+
+
+def _overload_delay(exc: BaseException, attempt: int) -> float:
+    hint = retry_after_seconds(exc)
+    return hint if hint is not None else min(60.0, 2.0 ** attempt)
+
+
+def _call_cost(system_prompt: str, user_message: str, max_tokens: int) -> int:
+    return estimate_tokens(system_prompt) + estimate_tokens(user_message) + max_tokens
+
+
+class RateLimitedLLMClient(LLMClient):
+    """Wraps an :class:`LLMClient` with provider rate limits and AIMD.
+
+    Overloaded responses shrink the concurrency limit, pause the provider's
+    limiter (honouring ``retry-after``) and re-issue the call, up to
+    ``max_overload_retries`` times. Streams are only re-issued if the
+    overload happens before any text was produced.
+    """
+
+    def __init__(
+        self,
+        inner: LLMClient,
+        limits: ProviderLimits,
+        max_overload_retries: int = 3,
+    ) -> None:
+        self._inner = inner
+        self._limits = limits
+        self._max_retries = max_overload_retries
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        cost = _call_cost(system_prompt, user_message, max_tokens)
+        timing = bound_recorder()
+        attempt = 0
+        while True:
+            # Wait for rate budget before taking a slot, so a throttled call
+            # doesn't hold concurrency that others could use.
+            self._limits.limiter.acquire(cost)
+            self._limits.gate.acquire()
+            if timing is not None:
+                timing.request_sent()
+            try:
+                response = self._inner.chat(
+                    system_prompt, user_message, max_tokens, temperature, prefill
+                )
+            except Exception as e:
+                if not is_overload_error(e) or attempt >= self._max_retries:
+                    raise
+                self._limits.controller.on_overload()
+                self._limits.limiter.pause(_overload_delay(e, attempt))
+                attempt += 1
+                continue
+            finally:
+                self._limits.gate.release()
+            self._limits.controller.on_success()
+            return response
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        return _RateLimitedChatStream(
+            self, system_prompt, user_message, max_tokens, temperature, prefill
+        )
+
+
+class _RateLimitedChatStream(ChatStream):
+    def __init__(
+        self,
+        client: RateLimitedLLMClient,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._client = client
+        self._args = (system_prompt, user_message, max_tokens, temperature, prefill)
+        # Captured now: failover iterates streams on threads of its own.
+        self._timing = bound_recorder()
+        self._current: ChatStream | None = None
+        self._closed = threading.Event()
+
+    def __iter__(self) -> Iterator[str]:
+        limits = self._client._limits
+        cost = _call_cost(self._args[0], self._args[1], self._args[2])
+        attempt = 0
+        while True:
+            produced = False
+            # Closing the stream also ends these waits.
+            limits.limiter.acquire(cost, self._closed)
+            limits.gate.acquire(self._closed)
+            if self._timing is not None:
+                self._timing.request_sent()
+            try:
+                inner = self._client._inner.chat_stream(*self._args)
+                self._current = inner
+                if self._closed.is_set():
+                    raise Cancelled()
+                for text in inner:
+                    produced = True
+                    yield text
+                self.response = inner.response
+            except Exception as e:
+                if produced or not is_overload_error(e) or attempt >= self._client._max_retries:
+                    raise
+                limits.controller.on_overload()
+                limits.limiter.pause(_overload_delay(e, attempt))
+                attempt += 1
+                continue
+            finally:
+                limits.gate.release()
+            limits.controller.on_success()
+            return
+
+    def close(self) -> None:
+        self._closed.set()
+        self._client._limits.gate.wake()
+        if self._current is not None:
+            self._current.close()
+
+
+class AsyncRateLimitedLLMClient(AsyncLLMClient):
+    """Asyncio version of :class:`RateLimitedLLMClient`."""
+
+    def __init__(
+        self,
+        inner: AsyncLLMClient,
+        limits: ProviderLimits,
+        max_overload_retries: int = 3,
+    ) -> None:
+        self._inner = inner
+        self._limits = limits
+        self._max_retries = max_overload_retries
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        cost = _call_cost(system_prompt, user_message, max_tokens)
+        attempt = 0
+        gate = self._limits.async_gate()
+        timing = bound_recorder()
+        while True:
+            # Wait for rate budget before taking a slot, so a throttled call
+            # doesn't hold concurrency that others could use.
+            await self._limits.limiter.aacquire(cost)
+            await gate.acquire()
+            if timing is not None:
+                timing.request_sent()
+            try:
+                response = await self._inner.achat(
+                    system_prompt, user_message, max_tokens, temperature, prefill
+                )
+            except Exception as e:
+                if not is_overload_error(e) or attempt >= self._max_retries:
+                    raise
+                self._limits.controller.on_overload()
+                self._limits.limiter.pause(_overload_delay(e, attempt))
+                attempt += 1
+                continue
+            finally:
+                await gate.release()
+            self._limits.controller.on_success()
+            return response
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        return _AsyncRateLimitedChatStream(
+            self, system_prompt, user_message, max_tokens, temperature, prefill
+        )
+
+
+class _AsyncRateLimitedChatStream(AsyncChatStream):
+    def __init__(
+        self,
+        client: AsyncRateLimitedLLMClient,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._client = client
+        self._args = (system_prompt, user_message, max_tokens, temperature, prefill)
+        self._timing = bound_recorder()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        client = self._client
+        cost = _call_cost(self._args[0], self._args[1], self._args[2])
+        gate = client._limits.async_gate()
+        attempt = 0
+        while True:
+            produced = False
+            await client._limits.limiter.aacquire(cost)
+            await gate.acquire()
+            if self._timing is not None:
+                self._timing.request_sent()
+            try:
+                inner = client._inner.achat_stream(*self._args)
+                async for text in inner:
+                    produced = True
+                    yield text
+                self.response = inner.response
+            except Exception as e:
+                if produced or not is_overload_error(e) or attempt >= client._max_retries:
+                    raise
+                client._limits.controller.on_overload()
+                client._limits.limiter.pause(_overload_delay(e, attempt))
+                attempt += 1
+                continue
+            finally:
+                await gate.release()
+            client._limits.controller.on_success()
+            return
@@ -0,0 +1,323 @@
+"""Retries with jittered exponential backoff, and mid-stream resume.
+
+Transient failures (connection drops, timeouts, 5xx, 429/529) are retried
+according to a :class:`RetryPolicy`; with ``retry_overloads`` off, 429/529
+are left to the rate-limit layer underneath. For streams that fail after producing
+text, the request is re-issued with the partial output as an assistant
+prefill, so generation continues where it stopped instead of starting over.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass
+
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+from llm.cancel import Cancelled
+from llm.rate_limit import is_overload_error
+from llm.tokens import estimate_tokens
+
+_RETRYABLE_STATUS_CODES = frozenset({408, 409, 500, 502, 503, 504})
+# Matched by class name so provider SDKs and httpx needn't be imported here.
+_RETRYABLE_NAME_PARTS = ("Timeout", "Connection", "RemoteProtocol", "ReadError")
+
+
+def is_retryable(exc: BaseException, overloads: bool = True) -> bool:
+    """Whether ``exc`` is a transient failure worth retrying.
+
+    ``overloads=False`` excludes 429 / overloaded responses.
+    """
+    if is_overload_error(exc):
+        return overloads
+    if getattr(exc, "status_code", None) in _RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    name = type(exc).__name__
+    return any(part in name for part in _RETRYABLE_NAME_PARTS)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    deadline: float = 0.0  # total seconds across attempts; 0 = no deadline
+    resume_streams: bool = True
+    # Off when a RateLimitedLLMClient below already re-issues overloads, so
+    # one 429 isn't retried by two nested loops.
+    retry_overloads: bool = True
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number ``attempt`` (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(self, exc: BaseException, attempt: int, started: float) -> float | None:
+        """Delay before the next attempt, or None if ``exc`` should be raised."""
+        if attempt + 1 >= self.max_attempts or not is_retryable(exc, self.retry_overloads):
+            return None
+        delay = self.backoff(attempt)
+        if self.deadline and time.monotonic() - started + delay > self.deadline:
+            return None
+        return delay
+
+
+class _Resume:
+    """Bookkeeping for one logical stream spread over several attempts."""
+
+    def __init__(self, prefill: str) -> None:
+        self.prefill = prefill
+        self.text = ""
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._attempt_text = ""
+        # Whitespace already emitted but cut from the resume prefill, and the
+        # continuation's leading whitespace buffered until we can compare.
+        self._emitted_ws: str | None = None
+        self._leading = ""
+
+    def request_prefill(self) -> str:
+        """Prefill for the next attempt; resumes after any emitted text."""
+        self._attempt_text = ""
+        if not self.text:
+            return self.prefill
+        full = self.prefill + self.text
+        stripped = full.rstrip()
+        # Providers reject a prefill ending in whitespace, so it is sent
+        # stripped and the duplicate whitespace is dropped from the reply.
+        self._emitted_ws = full[len(stripped):]
+        self._leading = ""
+        return stripped
+
+    def accept(self, chunk: str) -> str:
+        """Record ``chunk`` from the current attempt; return the text to emit."""
+        self._attempt_text += chunk
+        if self._emitted_ws is not None:
+            self._leading += chunk
+            body = self._leading.lstrip()
+            if not body:
+                return ""
+            ws = self._leading[: len(self._leading) - len(body)]
+            extra = ws[len(self._emitted_ws):] if ws.startswith(self._emitted_ws) else ""
+            self._emitted_ws = None
+            chunk = extra + body
+        self.text += chunk
+        return chunk
+
+    def attempt_failed(self, system_prompt: str, user_message: str, prefill: str) -> None:
+        # A failed attempt reports no usage; estimate what it was billed.
+        self.input_tokens += (
+            estimate_tokens(system_prompt) + estimate_tokens(user_message) + estimate_tokens(prefill)
+        )
+        self.output_tokens += estimate_tokens(self._attempt_text)
+
+    def finish(self, response: LLMResponse) -> LLMResponse:
+        return dataclasses.replace(
+            response,
+            content=self.text,
+            input_tokens=self.input_tokens + response.input_tokens,
+            output_tokens=self.output_tokens + response.output_tokens,
+        )
+
+
+class RetryingLLMClient(LLMClient):
+    """Wraps an :class:`LLMClient` with a :class:`RetryPolicy`."""
+
+    def __init__(self, inner: LLMClient, policy: RetryPolicy) -> None:
+        self._inner = inner
+        self._policy = policy
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return self._inner.chat(system_prompt, user_message, max_tokens, temperature, prefill)
+            except Exception as e:
+                delay = self._policy.next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        return _RetryingChatStream(
+            self._inner, self._policy, system_prompt, user_message, max_tokens, temperature, prefill
+        )
+
+
+class _RetryingChatStream(ChatStream):
+    def __init__(
+        self,
+        inner: LLMClient,
+        policy: RetryPolicy,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._inner = inner
+        self._policy = policy
+        self._system_prompt = system_prompt
+        self._user_message = user_message
+        self._max_tokens = max_tokens
+        self._temperature = temperature
+        self._prefill = prefill
+        self._current: ChatStream | None = None
+        self._closed = threading.Event()
+
+    def __iter__(self) -> Iterator[str]:
+        state = _Resume(self._prefill)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            prefill = state.request_prefill()
+            stream = self._inner.chat_stream(
+                self._system_prompt,
+                self._user_message,
+                # Only the remaining budget is needed to finish the output.
+                max(1, self._max_tokens - estimate_tokens(state.text)),
+                self._temperature,
+                prefill,
+            )
+            self._current = stream
+            if self._closed.is_set():
+                raise Cancelled()
+            try:
+                for chunk in stream:
+                    out = state.accept(chunk)
+                    if out:
+                        yield out
+            except Exception as e:
+                delay = self._policy.next_delay(e, attempt, started)
+                # Without resume, text already handed to the caller can't be
+                # taken back, so only failures before the first chunk retry.
+                if delay is None or (state.text and not self._policy.resume_streams):
+                    raise
+                state.attempt_failed(self._system_prompt, self._user_message, prefill)
+            else:
+                self.response = state.finish(stream.response)
+                return
+            if self._closed.wait(delay):
+                raise Cancelled()
+            attempt += 1
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._current is not None:
+            self._current.close()
+
+
+class AsyncRetryingLLMClient(AsyncLLMClient):
+    """Asyncio version of :class:`RetryingLLMClient`."""
+
+    def __init__(self, inner: AsyncLLMClient, policy: RetryPolicy) -> None:
+        self._inner = inner
+        self._policy = policy
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await self._inner.achat(
+                    system_prompt, user_message, max_tokens, temperature, prefill
+                )
+            except Exception as e:
+                delay = self._policy.next_delay(e, attempt, started)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        return _AsyncRetryingChatStream(
+            self._inner, self._policy, system_prompt, user_message, max_tokens, temperature, prefill
+        )
+
+
+class _AsyncRetryingChatStream(AsyncChatStream):
+    def __init__(
+        self,
+        inner: AsyncLLMClient,
+        policy: RetryPolicy,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: float,
+        prefill: str,
+    ) -> None:
+        self.response: LLMResponse | None = None
+        self._inner = inner
+        self._policy = policy
+        self._system_prompt = system_prompt
+        self._user_message = user_message
+        self._max_tokens = max_tokens
+        self._temperature = temperature
+        self._prefill = prefill
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        state = _Resume(self._prefill)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            prefill = state.request_prefill()
+            stream = self._inner.achat_stream(
+                self._system_prompt,
+                self._user_message,
+                max(1, self._max_tokens - estimate_tokens(state.text)),
+                self._temperature,
+                prefill,
+            )
+            try:
+                async for chunk in stream:
+                    out = state.accept(chunk)
+                    if out:
+                        yield out
+            except Exception as e:
+                delay = self._policy.next_delay(e, attempt, started)
+                # Without resume, text already handed to the caller can't be
+                # taken back, so only failures before the first chunk retry.
+                if delay is None or (state.text and not self._policy.resume_streams):
+                    raise
+                state.attempt_failed(self._system_prompt, self._user_message, prefill)
+            else:
+                self.response = state.finish(stream.response)
+                return
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,101 @@
+"""Per-call latency breakdown on a monotonic clock.
+
+Splits a call's wall time into queue wait (created → request sent),
+time to first token, and generation (first → last token), plus chunk
+inter-arrival statistics and output throughput.
+
+"Sent" is when the provider request actually goes out: the agent binds its
+recorder to the context (:func:`bind_recorder`) and the rate-limit layer
+stamps it once a call is admitted, so rate-limit and concurrency waits and
+retry backoff count as queue wait, not as time to first token.
+"""
+
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+
+@dataclass
+class CallTiming:
+    queue_wait_seconds: float
+    time_to_first_token_seconds: float
+    generation_seconds: float
+    total_seconds: float
+    chunk_count: int
+    output_tokens_per_second: float
+    inter_chunk_mean_ms: float
+    inter_chunk_p50_ms: float
+    inter_chunk_p95_ms: float
+    inter_chunk_max_ms: float
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class TimingRecorder:
+    """Collects timestamps for one call; :meth:`finish` builds the summary."""
+
+    def __init__(self, created_at: float | None = None) -> None:
+        self._created = created_at if created_at is not None else time.monotonic()
+        self._sent: float | None = None
+        self._first: float | None = None
+        self._last: float | None = None
+        self._gaps: list[float] = []
+
+    def request_sent(self) -> None:
+        """Stamp the request as sent; a later attempt re-stamps it until the first token."""
+        if self._first is None:
+            self._sent = time.monotonic()
+
+    def chunk(self) -> None:
+        now = time.monotonic()
+        if self._first is None:
+            self._first = now
+        else:
+            self._gaps.append(now - self._last)
+        self._last = now
+
+    def finish(self, output_tokens: int) -> CallTiming:
+        end = time.monotonic()
+        sent = self._sent if self._sent is not None else self._created
+        # A non-streaming call has a single "chunk": the whole response.
+        first = self._first if self._first is not None else end
+        last = self._last if self._last is not None else end
+        generation = last - first
+        total = end - sent
+        # Without streamed chunks, throughput can only be measured end to end.
+        rate_window = generation if generation > 0 else total
+        gaps = sorted(self._gaps)
+        return CallTiming(
+            queue_wait_seconds=round(sent - self._created, 3),
+            time_to_first_token_seconds=round(first - sent, 3),
+            generation_seconds=round(generation, 3),
+            total_seconds=round(total, 3),
+            chunk_count=len(gaps) + (1 if self._first is not None else 0),
+            output_tokens_per_second=round(output_tokens / rate_window, 1) if rate_window > 0 else 0.0,
+            inter_chunk_mean_ms=round(sum(gaps) / len(gaps) * 1000, 1) if gaps else 0.0,
+            inter_chunk_p50_ms=round(_percentile(gaps, 50) * 1000, 1),
+            inter_chunk_p95_ms=round(_percentile(gaps, 95) * 1000, 1),
+            inter_chunk_max_ms=round(gaps[-1] * 1000, 1) if gaps else 0.0,
+        )
+
+
+_bound: ContextVar[TimingRecorder | None] = ContextVar("timing_recorder", default=None)
+
+
+def bind_recorder(recorder: TimingRecorder | None) -> TimingRecorder | None:
+    """Make ``recorder`` the one calls in this context report to; return the previous one."""
+    previous = _bound.get()
+    _bound.set(recorder)
+    return previous
+
+
+def bound_recorder() -> TimingRecorder | None:
+    """The recorder of the agent call running in this context, if any."""
+    return _bound.get()
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import re
+
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate without a tokenizer.
+
+    CJK characters and full-width punctuation count roughly one token each;
+    everything else is approximated at four characters per token.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
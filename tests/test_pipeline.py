@@ -0,0 +1,72 @@
+"""Scheduling tests for :func:`run_graph` / :func:`arun_graph` on stub agents."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from agents.base_agent import AgentResult
+from agents.pipeline import Node, NodeStatus, PipelineGraph, PipelineState, arun_graph, run_graph
+
+
+class _StubAgent:
+    input_sections: tuple[str, ...] = ()
+
+    def __init__(self, key: str, fail: bool = False, wait: threading.Event | None = None) -> None:
+        self.key = key
+        self.name = key
+        self._fail = fail
+        self._wait = wait
+
+    def _result(self, input_text: str) -> AgentResult:
+        if self._fail:
+            raise RuntimeError(f"{self.key} failed")
+        return AgentResult(self.key, self.name, input_text, f"{self.key} output", "stub", 1, 1, 0.0)
+
+    def run(self, input_text: str, cancel=None) -> AgentResult:
+        if self._wait is not None:
+            self._wait.wait(5)
+        return self._result(input_text)
+
+    async def arun(self, input_text: str, cancel=None) -> AgentResult:
+        await asyncio.sleep(0.05 if self._wait is not None else 0)
+        return self._result(input_text)
+
+
+def _failing_branch_and_chain() -> tuple[PipelineState, dict[str, _StubAgent]]:
+    graph = PipelineGraph([Node("a"), Node("b"), Node("c", inputs=("b",))])
+    # ``b`` finishes only after ``a`` has failed, so its outcome comes second.
+    release = threading.Event()
+
+    class _Failing(_StubAgent):
+        def run(self, input_text: str, cancel=None) -> AgentResult:
+            try:
+                return super().run(input_text, cancel)
+            finally:
+                release.set()
+
+    agents = {"a": _Failing("a", fail=True), "b": _StubAgent("b", wait=release), "c": _StubAgent("c")}
+    return PipelineState(topic="t", graph=graph), agents
+
+
+def _assert_chain_completed(state: PipelineState) -> None:
+    assert state.node_status("a") == NodeStatus.FAILED
+    assert state.node_status("b") == NodeStatus.DONE
+    assert state.node_status("c") == NodeStatus.DONE
+    assert state.results["c"].input_text.strip()
+
+
+def test_run_graph_independent_chain_survives_failed_branch() -> None:
+    state, agents = _failing_branch_and_chain()
+    with pytest.raises(RuntimeError, match="a failed"):
+        run_graph(state, agents)
+    _assert_chain_completed(state)
+
+
+def test_arun_graph_independent_chain_survives_failed_branch() -> None:
+    state, agents = _failing_branch_and_chain()
+    with pytest.raises(RuntimeError, match="a failed"):
+        asyncio.run(arun_graph(state, agents))
+    _assert_chain_completed(state)
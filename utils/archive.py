@@ -0,0 +1,304 @@
+"""Queryable index over the ``output/`` archive.
+
+Every run saved by :func:`utils.persistence.save_results` is indexed in
+``<output dir>/index.sqlite3``: one row per run with its token, timing,
+model and edit columns, one row per agent, and an FTS5 (trigram) full-text
+index over the topic and all agent outputs. Finding past runs is a single
+indexed query instead of listing directories and opening files.
+
+Usage::
+
+    python -m utils.archive --rebuild       # index runs saved before the index existed
+    python -m utils.archive 意识上传 -n 10   # full-text search
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from config.settings import settings
+
+INDEX_FILENAME = "index.sqlite3"
+
+# The trigram tokenizer matches any substring of 3+ characters, which also
+# works for unsegmented Chinese; shorter terms fall back to LIKE.
+_MIN_MATCH_CHARS = 3
+
+
+@dataclass
+class ArchiveEntry:
+    id: int
+    output_dir: Path
+    run_id: str
+    topic: str
+    timestamp: str
+    model: str
+    input_tokens: int
+    output_tokens: int
+    cache_read_input_tokens: int
+    elapsed_seconds: float
+    completed_nodes: int
+    total_nodes: int
+    edited: bool
+    snippet: str = ""
+
+
+@dataclass
+class ArchivePage:
+    entries: list[ArchiveEntry] = field(default_factory=list)
+    total: int = 0
+    offset: int = 0
+    limit: int = 20
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-self.total // self.limit))
+
+
+def _output_text(agent: dict) -> str:
+    if agent.get("edited") and agent.get("edited_text"):
+        return agent["edited_text"]
+    return agent.get("output_text", "")
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class RunArchive:
+    """SQLite index of the run directories under ``root``."""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.root / INDEX_FILENAME, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY,"
+            " output_dir TEXT NOT NULL UNIQUE,"
+            " run_id TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " cache_read_input_tokens INTEGER NOT NULL,"
+            " elapsed_seconds REAL NOT NULL,"
+            " completed_nodes INTEGER NOT NULL,"
+            " total_nodes INTEGER NOT NULL,"
+            " edited INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agents ("
+            " run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,"
+            " node TEXT NOT NULL,"
+            " agent_name TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " elapsed_seconds REAL NOT NULL,"
+            " edited INTEGER NOT NULL,"
+            " PRIMARY KEY (run, node))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS agents_model ON agents (model)")
+        # rowid = runs.id
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts"
+            " USING fts5(topic, outputs, tokenize='trigram')"
+        )
+
+    def index_run(self, output_dir: str | Path, payload: dict) -> int:
+        """Index (or re-index) one saved run from its ``result.json`` payload.
+
+        Everything about the run is written in a single transaction.
+        """
+        name = Path(output_dir).name
+        agents: dict[str, dict] = payload.get("agents", {})
+        stats = payload.get("stats", {})
+        models = sorted({a.get("model", "") for a in agents.values()} - {""})
+        edited = any(a.get("edited") for a in agents.values())
+        total_nodes = len(payload.get("status") or agents)
+        outputs = "\n\n".join(_output_text(a) for a in agents.values())
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute(
+                    "SELECT id FROM runs WHERE output_dir = ?", (name,)
+                ).fetchone()
+                if old is not None:
+                    self._conn.execute("DELETE FROM runs_fts WHERE rowid = ?", old)
+                    self._conn.execute("DELETE FROM runs WHERE id = ?", old)
+                cur = self._conn.execute(
+                    "INSERT INTO runs (output_dir, run_id, topic, timestamp, model, input_tokens,"
+                    " output_tokens, cache_read_input_tokens, elapsed_seconds, completed_nodes,"
+                    " total_nodes, edited) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        name,
+                        payload.get("run_id", ""),
+                        payload.get("topic", ""),
+                        payload.get("timestamp", ""),
+                        ",".join(models),
+                        stats.get("total_input_tokens", 0),
+                        stats.get("total_output_tokens", 0),
+                        stats.get("total_cache_read_input_tokens", 0),
+                        stats.get("total_elapsed_seconds", 0.0),
+                        len(agents),
+                        total_nodes,
+                        int(edited),
+                    ),
+                )
+                run = cur.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO agents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            run,
+                            node,
+                            a.get("agent_name", ""),
+                            a.get("model", ""),
+                            a.get("input_tokens", 0),
+                            a.get("output_tokens", 0),
+                            a.get("elapsed_seconds", 0.0),
+                            int(bool(a.get("edited"))),
+                        )
+                        for node, a in agents.items()
+                    ],
+                )
+                self._conn.execute(
+                    "INSERT INTO runs_fts (rowid, topic, outputs) VALUES (?, ?, ?)",
+                    (run, payload.get("topic", ""), outputs),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return run
+
+    def search(
+        self,
+        query: str = "",
+        model: str = "",
+        edited: bool | None = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> ArchivePage:
+        """Runs matching every whitespace-separated term of ``query``, newest first.
+
+        Terms match anywhere in the topic or the agent outputs.
+        """
+        where: list[str] = []
+        params: list = []
+        terms = query.split()
+        long_terms = [t for t in terms if len(t) >= _MIN_MATCH_CHARS]
+        if long_terms:
+            where.append("r.id IN (SELECT rowid FROM runs_fts WHERE runs_fts MATCH ?)")
+            params.append(" AND ".join(_fts_phrase(t) for t in long_terms))
+        for term in terms:
+            if len(term) < _MIN_MATCH_CHARS:
+                where.append(
+                    "r.id IN (SELECT rowid FROM runs_fts WHERE topic LIKE ? OR outputs LIKE ?)"
+                )
+                pattern = f"%{term}%"
+                params += [pattern, pattern]
+        if model:
+            where.append("r.id IN (SELECT run FROM agents WHERE model = ?)")
+            params.append(model)
+        if edited is not None:
+            where.append("r.edited = ?")
+            params.append(int(edited))
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+
+        snippet = "''"
+        snippet_params: list = []
+        if long_terms:
+            snippet = (
+                "(SELECT snippet(runs_fts, -1, '**', '**', '…', 16) FROM runs_fts"
+                " WHERE runs_fts MATCH ? AND rowid = r.id)"
+            )
+            snippet_params = [params[0]]
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM runs r{clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT r.id, r.output_dir, r.run_id, r.topic, r.timestamp, r.model,"
+                " r.input_tokens, r.output_tokens, r.cache_read_input_tokens,"
+                " r.elapsed_seconds, r.completed_nodes, r.total_nodes, r.edited,"
+                f" {snippet} FROM runs r{clause}"
+                " ORDER BY r.timestamp DESC, r.id DESC LIMIT ? OFFSET ?",
+                snippet_params + params + [limit, offset],
+            ).fetchall()
+        entries = [
+            ArchiveEntry(
+                row[0], self.root / row[1], *row[2:12], edited=bool(row[12]), snippet=row[13] or ""
+            )
+            for row in rows
+        ]
+        return ArchivePage(entries, total, offset, limit)
+
+    def models(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT model FROM agents ORDER BY model").fetchall()
+        return [model for (model,) in rows if model]
+
+    def rebuild(self) -> int:
+        """Index every ``<run>/result.json`` under the root; returns the count."""
+        count = 0
+        for path in sorted(self.root.glob("*/result.json")):
+            try:
+                payload = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                continue
+            self.index_run(path.parent, payload)
+            count += 1
+        return count
+
+
+_archives: dict[Path, RunArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(root: str | Path | None = None) -> RunArchive:
+    """The shared index of ``root`` (default ``OUTPUT_DIR``)."""
+    root = Path(root or settings.OUTPUT_DIR).resolve()
+    with _archives_lock:
+        if root not in _archives:
+            _archives[root] = RunArchive(root)
+        return _archives[root]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="查询历史运行归档")
+    parser.add_argument("query", nargs="?", default="", help="全文检索关键词（空格分隔，需全部命中）")
+    parser.add_argument("--root", default=None, help="归档目录（默认 OUTPUT_DIR）")
+    parser.add_argument("--rebuild", action="store_true", help="扫描归档目录，重建索引")
+    parser.add_argument("--model", default="", help="只看使用该模型的运行")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="返回条数")
+    args = parser.parse_args(argv)
+
+    archive = get_archive(args.root)
+    if args.rebuild:
+        print(f"已索引 {archive.rebuild()} 次运行")
+    page = archive.search(args.query, model=args.model, limit=args.limit)
+    for entry in page.entries:
+        edited = " ✏️" if entry.edited else ""
+        print(f"{entry.timestamp[:19]}  {entry.topic}{edited}  → {entry.output_dir}")
+        if entry.snippet:
+            print(f"    {entry.snippet}")
+    print(f"共 {page.total} 条")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
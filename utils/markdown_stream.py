@@ -0,0 +1,152 @@
+"""Incremental Markdown parser for streamed agent output.
+
+:class:`MarkdownStreamParser` is fed text chunks as they arrive and returns
+structured records as soon as each line completes, so every line is parsed
+exactly once however the stream is chunked. Records carry a ``kind``
+derived from the enclosing headings of the agents' output formats:
+
+- ``storyboard_row`` — a row of the 分镜脚本 table
+- ``title_candidate`` — a row of the 标题方案 table
+- ``vulnerability`` — a row of a 漏洞清单 table (with its 论点)
+- ``key_point`` — an item of the 关键论点 list
+- ``tag`` — a ``#标签`` under 标签策略 (with its group)
+- ``table_row`` / ``list_item`` — any other table row or list item
+- ``section`` — a heading's complete text, emitted when the section closes
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+(.*)$")
+_SEPARATOR_RE = re.compile(r"^\|?[\s:|-]+\|?$")
+_TAG_RE = re.compile(r"#([^\s#，,、]+)")
+
+_TABLE_KINDS = (
+    ("分镜脚本", "storyboard_row"),
+    ("标题方案", "title_candidate"),
+    ("漏洞清单", "vulnerability"),
+)
+_LIST_KINDS = (("关键论点", "key_point"),)
+_TAG_SECTION = "标签策略"
+
+
+@dataclass
+class MarkdownRecord:
+    kind: str
+    section: str  # innermost enclosing heading, "" before the first one
+    data: dict[str, str] = field(default_factory=dict)
+
+
+def _split_row(line: str) -> list[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+class MarkdownStreamParser:
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._headings: list[tuple[int, str]] = []
+        # Open sections: (level, title, lines), outermost first.
+        self._open: list[tuple[int, str, list[str]]] = []
+        self._table_header: list[str] | None = None
+        self._in_code = False
+
+    def feed(self, chunk: str) -> list[MarkdownRecord]:
+        """Consume ``chunk``; return records for the lines it completed."""
+        self._buffer += chunk
+        if "\n" not in chunk:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        records: list[MarkdownRecord] = []
+        for line in lines:
+            self._line(line, records)
+        return records
+
+    def close(self) -> list[MarkdownRecord]:
+        """Flush the final partial line and close every open section."""
+        records: list[MarkdownRecord] = []
+        if self._buffer:
+            self._line(self._buffer, records)
+            self._buffer = ""
+        self._close_sections(1, records)
+        return records
+
+    # --- internals ---
+
+    def _path_kind(self, table: Sequence[tuple[str, str]], default: str) -> str:
+        for _, title in self._headings:
+            for prefix, kind in table:
+                if title.startswith(prefix):
+                    return kind
+        return default
+
+    def _close_sections(self, level: int, records: list[MarkdownRecord]) -> None:
+        while self._open and self._open[-1][0] >= level:
+            lvl, title, lines = self._open.pop()
+            text = "\n".join(lines).strip()
+            parent = self._open[-1][1] if self._open else ""
+            records.append(MarkdownRecord("section", parent, {"level": str(lvl), "title": title, "text": text}))
+
+    def _line(self, line: str, records: list[MarkdownRecord]) -> None:
+        line = line.rstrip("\r")
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self._in_code = not self._in_code
+        heading = None if self._in_code else _HEADING_RE.match(stripped)
+        if heading:
+            level, title = len(heading.group(1)), heading.group(2)
+            self._close_sections(level, records)
+            self._headings = [h for h in self._headings if h[0] < level] + [(level, title)]
+            self._open.append((level, title, []))
+            self._table_header = None
+        for _, _, lines in self._open:
+            lines.append(line)
+        if heading or self._in_code or stripped.startswith("```"):
+            return
+
+        section = self._headings[-1][1] if self._headings else ""
+        if stripped.startswith("|"):
+            cells = _split_row(stripped)
+            if self._table_header is None:
+                self._table_header = cells
+            elif not _SEPARATOR_RE.match(stripped):
+                data = dict(zip(self._table_header, cells))
+                kind = self._path_kind(_TABLE_KINDS, "table_row")
+                if kind == "vulnerability":
+                    data["论点"] = section
+                records.append(MarkdownRecord(kind, section, data))
+            return
+        self._table_header = None
+
+        if any(title.startswith(_TAG_SECTION) for _, title in self._headings):
+            for tag in _TAG_RE.findall(stripped):
+                records.append(MarkdownRecord("tag", section, {"group": section, "tag": tag}))
+            return
+        item = _LIST_RE.match(line)
+        if item:
+            kind = self._path_kind(_LIST_KINDS, "list_item")
+            records.append(MarkdownRecord(kind, section, {"text": item.group(1).strip()}))
+
+
+def parse_markdown(text: str) -> list[MarkdownRecord]:
+    """Parse a complete document in one pass."""
+    parser = MarkdownStreamParser()
+    return parser.feed(text) + parser.close()
+
+
+def extract_sections(text: str, titles: Iterable[str]) -> str:
+    """The sections of ``text`` whose heading starts with one of ``titles``.
+
+    Sections are joined in document order, headings included. Returns ""
+    if none are found.
+    """
+    wanted = tuple(titles)
+    found = [
+        r.data["text"]
+        for r in parse_markdown(text)
+        if r.kind == "section" and r.data["title"].startswith(wanted)
+    ]
+    return "\n\n".join(found)
@@ -0,0 +1,537 @@
+"""In-process metrics for LLM calls and agent runs.
+
+Counters, gauges and histograms are kept in a small dependency-free
+registry and exported either in Prometheus text format from a local
+``/metrics`` HTTP endpoint, or as OTLP/JSON lines appended to a file
+(one ``ExportMetricsServiceRequest`` per flush).
+
+Recording is a no-op unless ``METRICS_ENABLED`` is set.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from config.settings import settings
+from llm.base import AsyncChatStream, AsyncLLMClient, ChatStream, LLMClient, LLMResponse
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+_LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, str]) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: _LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self._values: dict[_LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> list[tuple[_LabelKey, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]) -> None:
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: dict[_LabelKey, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> list[tuple[_LabelKey, list[int], float]]:
+        with self._lock:
+            return [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render_prometheus(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if isinstance(metric, Histogram):
+                for key, counts, total in metric.samples():
+                    cumulative = 0
+                    for bound, count in zip((*metric.buckets, "+Inf"), counts):
+                        cumulative += count
+                        le = (("le", str(bound)),)
+                        lines.append(f"{metric.name}_bucket{_format_labels(key, le)} {cumulative}")
+                    lines.append(f"{metric.name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{metric.name}_count{_format_labels(key)} {cumulative}")
+            else:
+                for key, value in metric.samples():
+                    lines.append(f"{metric.name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_otlp(self, start_time_ns: int) -> dict:
+        """Snapshot as an OTLP/JSON ``ExportMetricsServiceRequest``."""
+        now_ns = time.time_ns()
+
+        def attributes(key: _LabelKey) -> list[dict]:
+            return [{"key": k, "value": {"stringValue": v}} for k, v in key]
+
+        metrics: list[dict] = []
+        for metric in self._metrics:
+            entry: dict = {"name": metric.name, "description": metric.help}
+            if isinstance(metric, Histogram):
+                entry["histogram"] = {
+                    "aggregationTemporality": 2,  # cumulative
+                    "dataPoints": [
+                        {
+                            "attributes": attributes(key),
+                            "startTimeUnixNano": str(start_time_ns),
+                            "timeUnixNano": str(now_ns),
+                            "count": str(sum(counts)),
+                            "sum": total,
+                            "bucketCounts": [str(c) for c in counts],
+                            "explicitBounds": list(metric.buckets),
+                        }
+                        for key, counts, total in metric.samples()
+                    ],
+                }
+            else:
+                points = [
+                    {
+                        "attributes": attributes(key),
+                        "startTimeUnixNano": str(start_time_ns),
+                        "timeUnixNano": str(now_ns),
+                        "asDouble": value,
+                    }
+                    for key, value in metric.samples()
+                ]
+                if isinstance(metric, Gauge):
+                    entry["gauge"] = {"dataPoints": points}
+                else:
+                    entry["sum"] = {
+                        "aggregationTemporality": 2,
+                        "isMonotonic": True,
+                        "dataPoints": points,
+                    }
+            metrics.append(entry)
+        return {
+            "resourceMetrics": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": "singularity-editorial"}}
+                        ]
+                    },
+                    "scopeMetrics": [{"scope": {"name": "utils.metrics"}, "metrics": metrics}],
+                }
+            ]
+        }
+
+
+registry = MetricsRegistry()
+
+llm_calls = registry.counter("llm_calls_total", "LLM calls by model and kind (chat/stream).")
+llm_errors = registry.counter("llm_errors_total", "Failed LLM calls by model and error type.")
+llm_input_tokens = registry.counter("llm_input_tokens_total", "Input tokens billed, by model.")
+llm_output_tokens = registry.counter("llm_output_tokens_total", "Output tokens billed, by model.")
+llm_in_flight = registry.gauge("llm_in_flight", "LLM calls currently in flight, by model.")
+llm_latency = registry.histogram("llm_latency_seconds", "LLM call latency, by model.", LATENCY_BUCKETS)
+llm_ttft = registry.histogram(
+    "llm_time_to_first_token_seconds", "Streaming time to first token, by model.", LATENCY_BUCKETS
+)
+llm_throughput = registry.histogram(
+    "llm_output_tokens_per_second", "Output tokens per second, by model.", THROUGHPUT_BUCKETS
+)
+
+llm_failovers = registry.counter(
+    "llm_failovers_total", "Calls moved to the next backend after an error, by error type."
+)
+llm_hedges = registry.counter("llm_hedges_total", "Hedged duplicate streams, by outcome (started/won).")
+
+agent_runs = registry.counter("agent_runs_total", "Completed agent runs by agent and model.")
+agent_errors = registry.counter("agent_errors_total", "Failed agent runs by agent and error type.")
+agent_cancellations = registry.counter(
+    "agent_cancellations_total", "Agent runs stopped by cancellation or deadline, by agent."
+)
+agent_input_tokens = registry.counter("agent_input_tokens_total", "Input tokens by agent and model.")
+agent_output_tokens = registry.counter("agent_output_tokens_total", "Output tokens by agent and model.")
+agent_in_flight = registry.gauge("agent_in_flight", "Agent runs currently in flight, by agent.")
+agent_latency = registry.histogram("agent_latency_seconds", "Agent run latency, by agent.", LATENCY_BUCKETS)
+agent_ttft = registry.histogram(
+    "agent_time_to_first_token_seconds", "Agent time to first token, by agent.", LATENCY_BUCKETS
+)
+agent_throughput = registry.histogram(
+    "agent_output_tokens_per_second", "Agent output tokens per second, by agent.", THROUGHPUT_BUCKETS
+)
+
+
+def enabled() -> bool:
+    return settings.METRICS_ENABLED
+
+
+# ---------------------------------------------------------------------------
+# Agent-level recording (called from agents.base_agent)
+# ---------------------------------------------------------------------------
+
+
+def agent_started(agent_key: str) -> None:
+    if enabled():
+        agent_in_flight.inc(agent=agent_key)
+
+
+def agent_abandoned(agent_key: str) -> None:
+    """A stream closed before completion: neither a run nor an error."""
+    if enabled():
+        agent_in_flight.dec(agent=agent_key)
+
+
+def agent_cancelled(agent_key: str, partial) -> None:
+    """A run stopped through its cancel token; ``partial`` is its ``AgentResult`` so far.
+
+    Its (estimated) usage still counts: those tokens were billed.
+    """
+    if not enabled():
+        return
+    agent_in_flight.dec(agent=agent_key)
+    agent_cancellations.inc(agent=agent_key)
+    agent_input_tokens.inc(partial.input_tokens, agent=agent_key, model=partial.model)
+    agent_output_tokens.inc(partial.output_tokens, agent=agent_key, model=partial.model)
+
+
+def agent_finished(agent_key: str, result=None, error: BaseException | None = None) -> None:
+    """Record the end of an agent run; ``result`` is an ``AgentResult``."""
+    if not enabled():
+        return
+    agent_in_flight.dec(agent=agent_key)
+    if error is not None:
+        agent_errors.inc(agent=agent_key, error=type(error).__name__)
+        return
+    agent_runs.inc(agent=agent_key, model=result.model)
+    agent_input_tokens.inc(result.input_tokens, agent=agent_key, model=result.model)
+    agent_output_tokens.inc(result.output_tokens, agent=agent_key, model=result.model)
+    agent_latency.observe(result.elapsed_seconds, agent=agent_key)
+    if result.timing is not None:
+        agent_ttft.observe(result.timing.time_to_first_token_seconds, agent=agent_key)
+        agent_throughput.observe(result.timing.output_tokens_per_second, agent=agent_key)
+
+
+# ---------------------------------------------------------------------------
+# LLM-level instrumentation
+# ---------------------------------------------------------------------------
+
+
+def backend_failed_over(error: BaseException) -> None:
+    if enabled():
+        llm_failovers.inc(error=type(error).__name__)
+
+
+def hedge_started() -> None:
+    if enabled():
+        llm_hedges.inc(outcome="started")
+
+
+def hedge_won() -> None:
+    """The hedged duplicate produced text before the original request."""
+    if enabled():
+        llm_hedges.inc(outcome="won")
+
+
+def _record_llm_response(model: str, response: LLMResponse, elapsed: float) -> None:
+    llm_input_tokens.inc(response.input_tokens, model=model)
+    llm_output_tokens.inc(response.output_tokens, model=model)
+    llm_latency.observe(elapsed, model=model)
+
+
+class InstrumentedLLMClient(LLMClient):
+    """Wraps an :class:`LLMClient`, recording call metrics for ``model``."""
+
+    def __init__(self, inner: LLMClient, model: str) -> None:
+        self._inner = inner
+        self._model = model
+
+    def chat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        llm_calls.inc(model=self._model, kind="chat")
+        llm_in_flight.inc(model=self._model)
+        start = time.monotonic()
+        try:
+            response = self._inner.chat(system_prompt, user_message, max_tokens, temperature, prefill)
+        except Exception as e:
+            llm_errors.inc(model=self._model, error=type(e).__name__)
+            raise
+        finally:
+            llm_in_flight.dec(model=self._model)
+        elapsed = time.monotonic() - start
+        _record_llm_response(self._model, response, elapsed)
+        if elapsed > 0:
+            llm_throughput.observe(response.output_tokens / elapsed, model=self._model)
+        return response
+
+    def chat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> ChatStream:
+        inner = self._inner.chat_stream(system_prompt, user_message, max_tokens, temperature, prefill)
+        return _InstrumentedChatStream(inner, self._model)
+
+
+class _InstrumentedChatStream(ChatStream):
+    def __init__(self, inner: ChatStream, model: str) -> None:
+        self.response: LLMResponse | None = None
+        self._inner = inner
+        self._model = model
+        self._closed = False
+
+    def close(self) -> None:
+        self._closed = True
+        self._inner.close()
+
+    def __iter__(self) -> Iterator[str]:
+        model = self._model
+        llm_calls.inc(model=model, kind="stream")
+        llm_in_flight.inc(model=model)
+        start = time.monotonic()
+        first: float | None = None
+        try:
+            for text in self._inner:
+                if first is None:
+                    first = time.monotonic()
+                    llm_ttft.observe(first - start, model=model)
+                yield text
+        except Exception as e:
+            # A stream stopped by its caller didn't fail.
+            if not self._closed:
+                llm_errors.inc(model=model, error=type(e).__name__)
+            raise
+        finally:
+            llm_in_flight.dec(model=model)
+        end = time.monotonic()
+        self.response = self._inner.response
+        _record_llm_response(model, self.response, end - start)
+        if first is not None and end > first:
+            llm_throughput.observe(self.response.output_tokens / (end - first), model=model)
+
+
+class AsyncInstrumentedLLMClient(AsyncLLMClient):
+    """Asyncio version of :class:`InstrumentedLLMClient`."""
+
+    def __init__(self, inner: AsyncLLMClient, model: str) -> None:
+        self._inner = inner
+        self._model = model
+
+    async def achat(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> LLMResponse:
+        llm_calls.inc(model=self._model, kind="chat")
+        llm_in_flight.inc(model=self._model)
+        start = time.monotonic()
+        try:
+            response = await self._inner.achat(
+                system_prompt, user_message, max_tokens, temperature, prefill
+            )
+        except Exception as e:
+            llm_errors.inc(model=self._model, error=type(e).__name__)
+            raise
+        finally:
+            llm_in_flight.dec(model=self._model)
+        elapsed = time.monotonic() - start
+        _record_llm_response(self._model, response, elapsed)
+        if elapsed > 0:
+            llm_throughput.observe(response.output_tokens / elapsed, model=self._model)
+        return response
+
+    def achat_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        prefill: str = "",
+    ) -> AsyncChatStream:
+        inner = self._inner.achat_stream(system_prompt, user_message, max_tokens, temperature, prefill)
+        return _AsyncInstrumentedChatStream(inner, self._model)
+
+
+class _AsyncInstrumentedChatStream(AsyncChatStream):
+    # Cancellation (asyncio.CancelledError) is not an Exception, so a
+    # stopped stream isn't counted as an error.
+    def __init__(self, inner: AsyncChatStream, model: str) -> None:
+        self.response: LLMResponse | None = None
+        self._inner = inner
+        self._model = model
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        model = self._model
+        llm_calls.inc(model=model, kind="stream")
+        llm_in_flight.inc(model=model)
+        start = time.monotonic()
+        first: float | None = None
+        try:
+            async for text in self._inner:
+                if first is None:
+                    first = time.monotonic()
+                    llm_ttft.observe(first - start, model=model)
+                yield text
+        except Exception as e:
+            llm_errors.inc(model=model, error=type(e).__name__)
+            raise
+        finally:
+            llm_in_flight.dec(model=model)
+        end = time.monotonic()
+        self.response = self._inner.response
+        _record_llm_response(model, self.response, end - start)
+        if first is not None and end > first:
+            llm_throughput.observe(self.response.output_tokens / (end - first), model=model)
+
+
+# ---------------------------------------------------------------------------
+# Exporters
+# ---------------------------------------------------------------------------
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+_server: ThreadingHTTPServer | None = None
+_exporter_thread: threading.Thread | None = None
+_start_lock = threading.Lock()
+
+
+def start_metrics_server(port: int | None = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` on a daemon thread (idempotent per process)."""
+    global _server
+    with _start_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port or settings.METRICS_PORT), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
+
+
+def start_file_exporter(path: str | Path | None = None, interval: float | None = None) -> None:
+    """Append an OTLP/JSON snapshot to ``path`` every ``interval`` seconds."""
+    global _exporter_thread
+    target = Path(path or settings.METRICS_OTLP_FILE)
+    period = interval or settings.METRICS_EXPORT_INTERVAL
+    start_ns = time.time_ns()
+
+    def loop() -> None:
+        while True:
+            time.sleep(period)
+            flush_to_file(target, start_ns)
+
+    with _start_lock:
+        if _exporter_thread is None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _exporter_thread = threading.Thread(target=loop, name="metrics-otlp", daemon=True)
+            _exporter_thread.start()
+            # Short-lived runs (batch) still get a final snapshot.
+            atexit.register(flush_to_file, target, start_ns)
+
+
+def flush_to_file(path: Path, start_time_ns: int) -> None:
+    line = json.dumps(registry.to_otlp(start_time_ns), ensure_ascii=False)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def start_configured_exporters() -> None:
+    """Start whichever exporters the settings ask for (no-op if disabled)."""
+    if not enabled():
+        return
+    if settings.METRICS_PORT:
+        start_metrics_server()
+    if settings.METRICS_OTLP_FILE:
+        start_file_exporter()
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
+import dataclasses
 import json
 import re
 from datetime import datetime
 from pathlib import Path
 
 from agents.base_agent import AgentResult
-from agents.pipeline import AGENT_ORDER, PipelineState
+from agents.pipeline import PipelineState
 from config.settings import settings
+from utils.archive import get_archive
 
 
 def _sanitize_dirname(text: str, max_len: int = 20) -> str:
@@ -17,6 +19,23 @@ def _sanitize_dirname(text: str, max_len: int = 20) -> str:
     return cleaned[:max_len] if cleaned else "untitled"
 
 
+def _create_unique_dir(parent: Path, dir_name: str) -> Path:
+    """Create ``parent/dir_name``, adding a numeric suffix if it already exists.
+
+    Concurrent batch runs can share the same timestamp and topic prefix.
+    """
+    parent.mkdir(parents=True, exist_ok=True)
+    candidate = parent / dir_name
+    suffix = 1
+    while True:
+        try:
+            candidate.mkdir()
+            return candidate
+        except FileExistsError:
+            suffix += 1
+            candidate = parent / f"{dir_name}_{suffix}"
+
+
 def _result_to_dict(result: AgentResult) -> dict:
     return {
         "agent_key": result.agent_key,
@@ -26,39 +45,59 @@ def _result_to_dict(result: AgentResult) -> dict:
         "model": result.model,
         "input_tokens": result.input_tokens,
         "output_tokens": result.output_tokens,
+        "cache_read_input_tokens": result.cache_read_input_tokens,
+        "cache_creation_input_tokens": result.cache_creation_input_tokens,
         "elapsed_seconds": result.elapsed_seconds,
         "edited": result.edited,
         "edited_text": result.edited_text,
+        "timing": dataclasses.asdict(result.timing) if result.timing else None,
+        "records": [dataclasses.asdict(r) for r in result.records],
     }
 
 
-def save_results(state: PipelineState) -> Path:
-    """Save pipeline results as JSON and Markdown. Returns the output directory."""
+def _node_label(state: PipelineState, key: str, agent_names: dict[str, str]) -> str:
+    agent = state.graph[key].agent
+    label = agent_names.get(agent, agent)
+    # Several nodes may run the same agent; tell them apart by node name.
+    return label if key == agent else f"{label}（{key}）"
+
+
+def save_results(state: PipelineState, parent_dir: str | Path | None = None) -> Path:
+    """Save pipeline results as JSON and Markdown. Returns the output directory.
+
+    The run directory is created under ``parent_dir`` (default ``OUTPUT_DIR``)
+    and indexed in that directory's archive (see :mod:`utils.archive`).
+    """
     now = datetime.now()
     dir_name = f"{now.strftime('%Y%m%d_%H%M%S')}_{_sanitize_dirname(state.topic)}"
-    output_dir = Path(settings.OUTPUT_DIR) / dir_name
-    output_dir.mkdir(parents=True, exist_ok=True)
+    parent_dir = Path(parent_dir or settings.OUTPUT_DIR)
+    output_dir = _create_unique_dir(parent_dir, dir_name)
 
     # --- JSON ---
     total_input_tokens = 0
     total_output_tokens = 0
+    total_cache_read_tokens = 0
     total_elapsed = 0.0
     agent_data = {}
-    for key in AGENT_ORDER:
+    for key in state.graph.order:
         result = state.results.get(key)
         if result:
             agent_data[key] = _result_to_dict(result)
             total_input_tokens += result.input_tokens
             total_output_tokens += result.output_tokens
+            total_cache_read_tokens += result.cache_read_input_tokens
             total_elapsed += result.elapsed_seconds
 
     json_payload = {
+        "run_id": state.run_id,
         "topic": state.topic,
         "timestamp": now.isoformat(),
         "agents": agent_data,
+        "status": {key: state.node_status(key).value for key in state.graph.order},
         "stats": {
             "total_input_tokens": total_input_tokens,
             "total_output_tokens": total_output_tokens,
+            "total_cache_read_input_tokens": total_cache_read_tokens,
             "total_elapsed_seconds": round(total_elapsed, 2),
         },
     }
@@ -84,11 +123,11 @@ def save_results(state: PipelineState) -> Path:
         f"",
     ]
 
-    for key in AGENT_ORDER:
+    for key in state.graph.order:
         result = state.results.get(key)
         if not result:
             continue
-        label = agent_names.get(key, key)
+        label = _node_label(state, key, agent_names)
         md_lines.append(f"## {label}")
         md_lines.append("")
         if result.edited:
@@ -101,23 +140,30 @@ def save_results(state: PipelineState) -> Path:
 
     md_lines.append("## 运行统计")
     md_lines.append("")
-    md_lines.append("| Agent | 输入 tokens | 输出 tokens | 耗时 (s) | 已编辑 |")
-    md_lines.append("|-------|-----------|-----------|---------|--------|")
-    for key in AGENT_ORDER:
+    md_lines.append("| Agent | 输入 tokens | 输出 tokens | 耗时 (s) | 首 token (s) | tokens/s | 已编辑 |")
+    md_lines.append("|-------|-----------|-----------|---------|------------|----------|--------|")
+    for key in state.graph.order:
         result = state.results.get(key)
         if not result:
             continue
-        label = agent_names.get(key, key)
+        label = _node_label(state, key, agent_names)
         edited_mark = "✏️" if result.edited else ""
+        ttft = result.timing.time_to_first_token_seconds if result.timing else "—"
+        tps = result.timing.output_tokens_per_second if result.timing else "—"
         md_lines.append(
-            f"| {label} | {result.input_tokens} | {result.output_tokens} | {result.elapsed_seconds} | {edited_mark} |"
+            f"| {label} | {result.input_tokens} | {result.output_tokens} | {result.elapsed_seconds} "
+            f"| {ttft} | {tps} | {edited_mark} |"
         )
     md_lines.append(
-        f"| **合计** | **{total_input_tokens}** | **{total_output_tokens}** | **{round(total_elapsed, 2)}** | |"
+        f"| **合计** | **{total_input_tokens}** | **{total_output_tokens}** | **{round(total_elapsed, 2)}** | | | |"
     )
     md_lines.append("")
 
     md_path = output_dir / "result.md"
     md_path.write_text("\n".join(md_lines), encoding="utf-8")
 
+    if settings.ARCHIVE_INDEX_ENABLED:
+        get_archive(parent_dir).index_run(output_dir, json_payload)
+    if state.store is not None:
+        state.store.mark_saved(state.run_id, output_dir)
     return output_dir
@@ -0,0 +1,206 @@
+"""Durable run store: every pipeline run checkpointed to SQLite.
+
+Each run gets a stable ID when it starts. Every node outcome is written in
+its own transaction the moment the node finishes, so a crashed or restarted
+process loses at most the node that was in flight. :meth:`RunStore.load`
+rebuilds a :class:`PipelineState` from the checkpoints; running it again
+resumes from the first unfinished node without re-calling the LLM for the
+completed ones.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from agents.base_agent import AgentResult
+from agents.pipeline import DEFAULT_GRAPH, Node, NodeStatus, PipelineGraph, PipelineState
+from config.settings import settings
+
+
+def new_run_id() -> str:
+    """A sortable, unique run ID, e.g. ``20250101-120000-1a2b3c4d``."""
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def _graph_to_json(graph: PipelineGraph) -> str:
+    return json.dumps(
+        [[node.name, node.agent, list(node.inputs)] for node in graph],
+        ensure_ascii=False,
+    )
+
+
+def _graph_from_json(value: str) -> PipelineGraph:
+    nodes = [Node(name, agent, tuple(inputs)) for name, agent, inputs in json.loads(value)]
+    if nodes == list(DEFAULT_GRAPH):
+        return DEFAULT_GRAPH
+    return PipelineGraph(nodes)
+
+
+@dataclass
+class RunSummary:
+    run_id: str
+    topic: str
+    created_at: float
+    updated_at: float
+    done_nodes: int
+    total_nodes: int
+    failed_nodes: int
+    output_dir: str = ""
+
+    @property
+    def is_complete(self) -> bool:
+        return self.done_nodes >= self.total_nodes
+
+
+class RunStore:
+    """SQLite (WAL) store of runs and their per-node checkpoints."""
+
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " topic TEXT NOT NULL,"
+            " graph TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " output_dir TEXT NOT NULL DEFAULT '')"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,"
+            " node TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT NOT NULL DEFAULT '',"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (run_id, node))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_updated ON runs (updated_at)")
+
+    def _write(self, statements: list[tuple[str, tuple]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def create_run(self, state: PipelineState) -> str:
+        """Register ``state`` as a new run and attach the store to it.
+
+        Nodes already completed in ``state`` are checkpointed too.
+        """
+        state.run_id = state.run_id or new_run_id()
+        state.store = self
+        now = time.time()
+        statements = [(
+            # An existing run (a resume) keeps its creation time and output dir.
+            "INSERT INTO runs (run_id, topic, graph, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (run_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (state.run_id, state.topic, _graph_to_json(state.graph), now, now),
+        )]
+        statements += [self._node_statement(state, name, now) for name in state.results]
+        self._write(statements)
+        return state.run_id
+
+    def _node_statement(self, state: PipelineState, name: str, now: float) -> tuple[str, tuple]:
+        # A cancelled node keeps its partial output (and billed usage).
+        result = state.results.get(name) or state.partials.get(name)
+        value = json.dumps(dataclasses.asdict(result), ensure_ascii=False) if result else None
+        return (
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+            (state.run_id, name, state.node_status(name).value, value, state.errors.get(name, ""), now),
+        )
+
+    def checkpoint(self, state: PipelineState, name: str) -> None:
+        """Atomically persist the current outcome of node ``name``."""
+        now = time.time()
+        self._write([
+            self._node_statement(state, name, now),
+            ("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, state.run_id)),
+        ])
+
+    def mark_saved(self, run_id: str, output_dir: str | Path) -> None:
+        self._write([("UPDATE runs SET output_dir = ? WHERE run_id = ?", (str(output_dir), run_id))])
+
+    def load(self, run_id: str) -> PipelineState:
+        """Rebuild a run's state from its checkpoints (attached to this store)."""
+        with self._lock:
+            run = self._conn.execute(
+                "SELECT topic, graph FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT node, status, result, error FROM checkpoints WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        if run is None:
+            raise KeyError(f"运行记录不存在：{run_id}")
+        topic, graph = run
+        state = PipelineState(topic=topic, graph=_graph_from_json(graph), run_id=run_id)
+        for node, status, result, error in rows:
+            if node not in state.graph.nodes:
+                continue
+            if status == NodeStatus.DONE.value and result is not None:
+                state.mark_done(node, AgentResult.from_dict(json.loads(result)))
+            elif status in (NodeStatus.FAILED.value, NodeStatus.CANCELLED.value):
+                state.status[node] = NodeStatus(status)
+                state.errors[node] = error
+                if result is not None:
+                    state.partials[node] = AgentResult.from_dict(json.loads(result))
+        state.store = self
+        return state
+
+    def list_runs(self, limit: int | None = 50, unfinished_only: bool = False) -> list[RunSummary]:
+        """Most recently updated runs first; ``limit=None`` returns all."""
+        having = " HAVING done < json_array_length(r.graph)" if unfinished_only else ""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.run_id, r.topic, json_array_length(r.graph), r.created_at, r.updated_at,"
+                " r.output_dir,"
+                " COUNT(CASE WHEN c.status = 'done' THEN 1 END) AS done,"
+                " COUNT(CASE WHEN c.status = 'failed' THEN 1 END)"
+                " FROM runs r LEFT JOIN checkpoints c ON c.run_id = r.run_id"
+                f" GROUP BY r.run_id{having} ORDER BY r.updated_at DESC LIMIT ?",
+                (-1 if limit is None else limit,),
+            ).fetchall()
+        return [
+            RunSummary(run_id, topic, created, updated, done, total, failed, output_dir)
+            for run_id, topic, total, created, updated, output_dir, done, failed in rows
+        ]
+
+    def delete(self, run_id: str) -> None:
+        self._write([
+            ("DELETE FROM checkpoints WHERE run_id = ?", (run_id,)),
+            ("DELETE FROM runs WHERE run_id = ?", (run_id,)),
+        ])
+
+
+_store: RunStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_run_store() -> RunStore | None:
+    """The process-wide run store, or None if ``RUN_STORE_ENABLED`` is off."""
+    global _store
+    if not settings.RUN_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = RunStore(settings.RUN_STORE_PATH)
+        return _store